@@ -0,0 +1,152 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# compares the old per-session prisma upsert batch against the unnest-based
+# bulk upsert in common/session_ingest.py
+# run from the root of the bot with: python -m benchmarks.session_ingest
+# this writes to (and then cleans up) the database in DB_URL, so please don't
+# point it at production
+
+import asyncio
+import datetime
+import os
+import time
+import typing
+import uuid
+
+import rpl_config
+
+if not os.environ.get("DB_URL"):
+    rpl_config.load()
+
+from prisma import Prisma
+
+import common.models as models
+import common.session_ingest as session_ingest
+from common.playerlist_utils import RealmPlayersContainer
+
+SIZES = (1_000, 10_000, 50_000)
+BENCHMARK_REALM_PREFIX = "benchmark-"
+
+
+def make_joined(size: int, now: datetime.datetime) -> RealmPlayersContainer:
+    # spread the sessions out over a bunch of realms, like a real tick would
+    return RealmPlayersContainer(
+        player_sessions=[
+            models.PlayerSession(
+                custom_id=str(uuid.uuid4()),
+                realm_id=f"{BENCHMARK_REALM_PREFIX}{index % 500}",
+                xuid=str(2535400000000000 + index),
+                online=True,
+                last_seen=now,
+                joined_at=now,
+            )
+            for index in range(size)
+        ],
+        fields=("joined_at",),
+    )
+
+
+def make_stayed_and_left(
+    joined: RealmPlayersContainer, now: datetime.datetime
+) -> RealmPlayersContainer:
+    # the same sessions a minute later, with every other player having left -
+    # with the fields a tick writes for players who stayed or left
+    return RealmPlayersContainer(
+        player_sessions=[
+            session.model_copy(update={"online": index % 2 == 0, "last_seen": now})
+            for index, session in enumerate(joined.player_sessions)
+        ]
+    )
+
+
+async def batch_path(db: Prisma, container: RealmPlayersContainer) -> None:
+    async with db.batch_() as batch:
+        for session in container.player_sessions:
+            batch.playersession.upsert(
+                where={
+                    "custom_id_joined_at": {
+                        "custom_id": session.custom_id,
+                        "joined_at": session.joined_at,
+                    }
+                },
+                data={
+                    "create": session.model_dump(exclude_defaults=True),
+                    "update": session.model_dump(include=set(container.fields)),
+                },  # type: ignore
+            )
+
+
+async def bulk_path(db: Prisma, container: RealmPlayersContainer) -> None:
+    await session_ingest.bulk_upsert_sessions(db, (container,))
+
+
+async def cleanup(db: Prisma) -> None:
+    await db.playersession.delete_many(
+        where={"realm_id": {"startswith": BENCHMARK_REALM_PREFIX}}
+    )
+
+
+async def time_path(
+    db: Prisma,
+    func: typing.Callable[[Prisma, RealmPlayersContainer], typing.Awaitable[None]],
+    size: int,
+) -> tuple[float, float]:
+    now = datetime.datetime.now(tz=datetime.UTC)
+    container = make_joined(size, now)
+
+    # first run inserts everything, like a tick full of joins would
+    # second run updates every row, like the tick after where everyone either
+    # stayed or left would
+    start = time.perf_counter()
+    await func(db, container)
+    insert_time = time.perf_counter() - start
+
+    update_container = make_stayed_and_left(
+        container, now + datetime.timedelta(minutes=1)
+    )
+    start = time.perf_counter()
+    await func(db, update_container)
+    update_time = time.perf_counter() - start
+
+    await cleanup(db)
+    return insert_time, update_time
+
+
+async def main() -> None:
+    db = Prisma(datasource={"url": os.environ["DB_URL"]})
+    await db.connect()
+
+    try:
+        await cleanup(db)
+
+        print(  # noqa: T201
+            f"{'sessions':>10} | {'path':>6} | {'insert (s)':>10} | {'update (s)':>10}"
+        )
+        for size in SIZES:
+            for name, func in (("batch", batch_path), ("bulk", bulk_path)):
+                insert_time, update_time = await time_path(db, func, size)
+                print(  # noqa: T201
+                    f"{size:>10} | {name:>6} | {insert_time:>10.3f} |"
+                    f" {update_time:>10.3f}"
+                )
+    finally:
+        await cleanup(db)
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# compares the old retention delete against dropping whole weekly partitions, like
+# common/session_partitions.py does now
+# this uses two stand-in copies of realmplayersession (one plain, one partitioned)
+# filled with fake sessions rather than the real thing, but they're still made
+# in the database in DB_URL, so please don't point it at production
+# run from the root of the bot with: python -m benchmarks.session_retention
+
+import asyncio
+import datetime
+import os
+import time
+
+import rpl_config
+
+if not os.environ.get("DB_URL"):
+    rpl_config.load()
+
+from prisma import Prisma
+
+import common.session_partitions as session_partitions
+
+# the week the cutoff is in gets cleaned up chunk by chunk, and the pause between
+# chunks would just be timed as well
+os.environ.setdefault("RETENTION_BATCH_SLEEP", "0")
+
+SIZES = (100_000, 1_000_000, 5_000_000)
+# a bit over the retention period, so that about a fifth of the sessions expire
+WEEKS = 6
+RETENTION = datetime.timedelta(days=31)
+
+PLAIN_TABLE = "benchmark_session_plain"
+PARTITIONED_TABLE = "benchmark_session_partitioned"
+
+CREATE_PLAIN = f'CREATE TABLE "{PLAIN_TABLE}" (LIKE "realmplayersession" INCLUDING ALL)'
+CREATE_PARTITIONED = (
+    f'CREATE TABLE "{PARTITIONED_TABLE}" (LIKE "realmplayersession" INCLUDING ALL)'
+    ' PARTITION BY RANGE ("joined_at")'
+)
+CREATE_PARTITION = (
+    'CREATE TABLE "{name}" PARTITION OF "{table}"'
+    " FOR VALUES FROM ('{start}') TO ('{end}')"
+)
+# sessions spread evenly across every week, lasting up to three hours each
+FILL = """
+INSERT INTO "{table}" ("custom_id", "realm_id", "xuid", "online", "last_seen",
+    "joined_at")
+SELECT gen_random_uuid(), ("i" % 500)::text, ("i" % 20000)::text, false,
+    $1::timestamptz + ("i" * $2::bigint / $3::bigint) * interval '1 second'
+        + ("i" % 180) * interval '1 minute',
+    $1::timestamptz + ("i" * $2::bigint / $3::bigint) * interval '1 second'
+FROM generate_series(0, $3::bigint - 1) AS "i"
+"""
+DELETE = 'DELETE FROM "{table}" WHERE NOT "online" AND "last_seen" < $1::timestamptz'
+SIZE = 'SELECT pg_total_relation_size(\'"{table}"\')::bigint AS "size"'
+# for the partitioned table, this counts every partition
+PARTITIONED_SIZE = """
+SELECT coalesce(sum(pg_total_relation_size("inhrelid")), 0)::bigint AS "size"
+FROM pg_inherits WHERE "inhparent" = '"{table}"'::regclass
+"""
+
+
+async def cleanup(db: Prisma) -> None:
+    await db.execute_raw(f'DROP TABLE IF EXISTS "{PLAIN_TABLE}"')
+    await db.execute_raw(f'DROP TABLE IF EXISTS "{PARTITIONED_TABLE}"')
+
+
+async def setup(db: Prisma, size: int, first_week: datetime.datetime) -> None:
+    await db.execute_raw(CREATE_PLAIN)
+    await db.execute_raw(CREATE_PARTITIONED)
+
+    for week in range(WEEKS + 1):
+        start = first_week + session_partitions.PARTITION_LENGTH * week
+        await db.execute_raw(
+            CREATE_PARTITION.format(
+                name=session_partitions.partition_name(start, table=PARTITIONED_TABLE),
+                table=PARTITIONED_TABLE,
+                start=start.isoformat(),
+                end=(start + session_partitions.PARTITION_LENGTH).isoformat(),
+            )
+        )
+
+    span = int((session_partitions.PARTITION_LENGTH * WEEKS).total_seconds())
+    for table in (PLAIN_TABLE, PARTITIONED_TABLE):
+        await db.execute_raw(FILL.format(table=table), first_week, span, size)
+        await db.execute_raw(f'ANALYZE "{table}"')
+
+
+async def delete_path(db: Prisma, cutoff: datetime.datetime) -> tuple[float, int]:
+    start = time.perf_counter()
+    await db.execute_raw(DELETE.format(table=PLAIN_TABLE), cutoff)
+    elapsed = time.perf_counter() - start
+
+    rows = await db.query_raw(SIZE.format(table=PLAIN_TABLE))
+    return elapsed, rows[0]["size"]
+
+
+async def drop_path(db: Prisma, cutoff: datetime.datetime) -> tuple[float, int]:
+    start = time.perf_counter()
+    await session_partitions.drop_expired_partitions(
+        db, cutoff, table=PARTITIONED_TABLE
+    )
+    elapsed = time.perf_counter() - start
+
+    rows = await db.query_raw(PARTITIONED_SIZE.format(table=PARTITIONED_TABLE))
+    return elapsed, rows[0]["size"]
+
+
+async def main() -> None:
+    db = Prisma(datasource={"url": os.environ["DB_URL"]})
+    await db.connect()
+
+    now = datetime.datetime.now(tz=datetime.UTC)
+    first_week = session_partitions.week_start(
+        now - session_partitions.PARTITION_LENGTH * WEEKS
+    )
+    cutoff = now - RETENTION
+
+    try:
+        await cleanup(db)
+
+        print(  # noqa: T201
+            f"{'sessions':>10} | {'path':>6} | {'time (s)':>10} |"
+            f" {'size after (MiB)':>16}"
+        )
+        for size in SIZES:
+            await setup(db, size, first_week)
+
+            for name, (elapsed, table_size) in (
+                ("delete", await delete_path(db, cutoff)),
+                ("drop", await drop_path(db, cutoff)),
+            ):
+                print(  # noqa: T201
+                    f"{size:>10} | {name:>6} | {elapsed:>10.3f} |"
+                    f" {table_size / 1024 / 1024:>16.1f}"
+                )
+
+            await cleanup(db)
+    finally:
+        await cleanup(db)
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,168 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# compares the old hour-by-hour loops for bucketing session minutes against the
+# numpy-based versions now in common/stats_utils.py
+# run from the root of the bot with: python -m benchmarks.stats_bucketing
+
+import datetime
+import random
+import time
+import typing
+from collections import defaultdict
+
+import common.stats_utils as stats_utils
+from common.stats_utils import GatherDatetimesReturn, InSeconds
+
+SIZES = (1_000, 10_000, 50_000)
+DAYS = 30
+
+
+# the old implementations, more or less as they were
+
+
+def legacy_minutes_per_bucket(
+    ranges: typing.Iterable[GatherDatetimesReturn], bucket: int
+) -> defaultdict[int, int]:
+    minutes_per_bucket: defaultdict[int, int] = defaultdict(int)
+
+    for _, start, end in ranges:
+        end_time = int(end.timestamp()) // 60 * 60
+        current = int(start.timestamp()) // 60 * 60
+
+        while current < end_time:
+            floored = current // bucket * bucket
+            next_bucket = floored + bucket
+
+            minutes = (
+                (next_bucket - current) // 60
+                if current + bucket <= end_time
+                else (end_time - current) // 60
+            )
+
+            minutes_per_bucket[floored] += minutes
+            current = next_bucket
+
+    return minutes_per_bucket
+
+
+def legacy_get_minutes(
+    ranges: typing.Iterable[GatherDatetimesReturn], bucket: int
+) -> dict[datetime.datetime, int]:
+    minutes_per_bucket = legacy_minutes_per_bucket(ranges, bucket)
+    return {
+        datetime.datetime.fromtimestamp(k, tz=datetime.UTC): minutes_per_bucket[k]
+        for k in range(
+            min(minutes_per_bucket.keys()), max(minutes_per_bucket.keys()) + 1, bucket
+        )
+    }
+
+
+def legacy_timespan_minutes_per_hour(
+    ranges: typing.Iterable[GatherDatetimesReturn],
+) -> dict[datetime.time, int]:
+    minutes_per_hour: dict[int, int] = {i: 0 for i in range(24)}
+    for k, v in legacy_minutes_per_bucket(ranges, InSeconds.HOUR).items():
+        minutes_per_hour[k % InSeconds.DAY // InSeconds.HOUR] += v
+    return {datetime.time(hour=k): v for k, v in minutes_per_hour.items()}
+
+
+def legacy_timespan_minutes_per_day_of_the_week(
+    ranges: typing.Iterable[GatherDatetimesReturn],
+) -> dict[datetime.date, int]:
+    minutes_per_day_of_the_week: dict[int, int] = {i: 0 for i in range(7)}
+    for k, v in legacy_minutes_per_bucket(ranges, InSeconds.DAY).items():
+        minutes_per_day_of_the_week[((k // InSeconds.DAY) + 4) % 7] += v
+    return {
+        datetime.date(year=1970, month=1, day=(k - 3) + 7): v
+        for k, v in minutes_per_day_of_the_week.items()
+    }
+
+
+CASES: tuple[tuple[str, typing.Callable, typing.Callable], ...] = (
+    (
+        "get_minutes_per_hour",
+        lambda r: legacy_get_minutes(r, InSeconds.HOUR),
+        stats_utils.get_minutes_per_hour,
+    ),
+    (
+        "get_minutes_per_day",
+        lambda r: legacy_get_minutes(r, InSeconds.DAY),
+        stats_utils.get_minutes_per_day,
+    ),
+    (
+        "timespan_minutes_per_hour",
+        legacy_timespan_minutes_per_hour,
+        stats_utils.timespan_minutes_per_hour,
+    ),
+    (
+        "timespan_minutes_per_day_of_the_week",
+        legacy_timespan_minutes_per_day_of_the_week,
+        stats_utils.timespan_minutes_per_day_of_the_week,
+    ),
+)
+
+
+def make_ranges(size: int) -> list[GatherDatetimesReturn]:
+    # mostly short sessions with the occasional very long one, like real realms
+    # seeded so every run times the same data - nothing here needs to be secure
+    rng = random.Random(size)  # noqa: S311
+    now = datetime.datetime.now(tz=datetime.UTC)
+    ranges: list[GatherDatetimesReturn] = []
+
+    for index in range(size):
+        joined_at = now - datetime.timedelta(seconds=rng.randint(0, DAYS * 86400))
+        length = (
+            rng.randint(0, 86400 * 2)
+            if rng.random() < 0.05
+            else int(rng.expovariate(1 / 3600))
+        )
+        ranges.append(
+            GatherDatetimesReturn(
+                str(2535400000000000 + index % 2000),
+                joined_at,
+                joined_at + datetime.timedelta(seconds=length),
+            )
+        )
+
+    return ranges
+
+
+def timed(func: typing.Callable, ranges: list[GatherDatetimesReturn]) -> float:
+    start = time.perf_counter()
+    func(ranges)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    for size in SIZES:
+        ranges = make_ranges(size)
+
+        for name, legacy, vectorized in CASES:
+            if legacy(ranges) != vectorized(ranges):
+                raise AssertionError(f"{name} results differ at {size} sessions.")
+
+            legacy_time = timed(legacy, ranges)
+            vectorized_time = timed(vectorized, ranges)
+            print(  # noqa: T201
+                f"{size:>6} sessions | {name:<36} | legacy: {legacy_time * 1000:9.2f}ms"
+                f" | numpy: {vectorized_time * 1000:8.2f}ms"
+                f" | {legacy_time / vectorized_time:6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
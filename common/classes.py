@@ -32,6 +32,7 @@ from httpcore._backends.asyncio import AsyncioBackend
 from prisma import Base64, Json, _builder
 from prisma._async_http import Response
 
+import common.leaderboards as leaderboards
 import common.models as models
 import common.playerlist_utils as pl_utils
 import common.utils as utils
@@ -158,20 +159,21 @@ class OrderedSet[T](MutableSet[T]):
 
 
 @ipy.utils.define(kw_only=False, auto_detect=True)
-class DynamicLeaderboardPaginator:
+class DynamicPaginator:
+    """
+    A paginator that works out each page as it's shown, rather than all at once.
+    Subclasses say how many entries there are and how to render a page.
+    """
+
     client: "utils.RealmBotBase" = attrs.field(
         repr=False,
     )
     """The client to hook listeners into"""
 
-    pages_data: list[tuple[str, int]] = attrs.field(repr=False, kw_only=True)
-    """The entries for the leaderboard"""
-    period_str: str = attrs.field(repr=False, kw_only=True)
-    """The period, represented as a string."""
     timestamp: ipy.Timestamp = attrs.field(repr=False, kw_only=True)
     """The timestamp to use for the embeds."""
     nicknames: dict[str, str] = attrs.field(repr=False, kw_only=True)
-    """The nicknames to use for this leaderboard."""
+    """The nicknames to use for the players shown."""
 
     page_index: int = attrs.field(repr=False, kw_only=True, default=0)
     """The index of the current page being displayed"""
@@ -220,11 +222,16 @@ class DynamicLeaderboardPaginator:
         """The ID of the author of the message this paginator is currently attached to"""
         return self._author_id
 
+    @property
+    def total(self) -> int:
+        """How many entries there are across every page."""
+        raise NotImplementedError
+
     @property
     def last_page_index(self) -> int:
-        if len(self.pages_data) == 0:
+        if self.total == 0:
             return 0
-        return (len(self.pages_data) - 1) // 20
+        return (self.total - 1) // leaderboards.PAGE_SIZE
 
     def create_components(self, disable: bool = False) -> list[ipy.ActionRow]:
         """
@@ -282,43 +289,7 @@ class DynamicLeaderboardPaginator:
 
     async def to_dict(self) -> dict:
         """Convert this paginator into a dictionary for sending."""
-        page_data = self.pages_data[self.page_index * 20 : (self.page_index * 20) + 20]
-
-        gamertag_map = await pl_utils.get_xuid_to_gamertag_map(
-            self.bot, [e[0] for e in page_data if e[0] not in self.nicknames]
-        )
-
-        leaderboard_builder: list[str] = []
-        index = self.page_index * 20
-
-        for xuid, playtime in page_data:
-            precisedelta = humanize.precisedelta(
-                playtime, minimum_unit="minutes", format="%0.0f"
-            )
-
-            if precisedelta == "1 minutes":  # why humanize
-                precisedelta = "1 minute"
-
-            display = models.display_gamertag(
-                xuid, gamertag_map[xuid], self.nicknames.get(xuid)
-            )
-
-            leaderboard_builder.append(f"**{index+1}\\.** {display} {precisedelta}")
-
-            index += 1
-
-        page = ipy.Embed(
-            title=f"Leaderboard for the past {self.period_str}",
-            description="\n".join(leaderboard_builder),
-            color=self.bot.color,
-            timestamp=self.timestamp,
-        )
-        page.set_author(name=f"Page {self.page_index+1}/{self.last_page_index+1}")
-
-        return {
-            "embeds": [page.to_dict()],
-            "components": [c.to_dict() for c in self.create_components()],
-        }
+        raise NotImplementedError
 
     async def send(self, ctx: ipy.BaseContext, **kwargs: typing.Any) -> ipy.Message:
         """
@@ -372,22 +343,86 @@ class DynamicLeaderboardPaginator:
 
 
 @ipy.utils.define(kw_only=False, auto_detect=True)
-class DynamicRealmMembers(DynamicLeaderboardPaginator):
+class DynamicLeaderboardPaginator(DynamicPaginator):
+    fetch_page: typing.Callable[
+        [int], typing.Awaitable[leaderboards.LeaderboardPage]
+    ] = attrs.field(repr=False, kw_only=True)
+    """Fetches the page of the leaderboard at the given index"""
+    first_page: leaderboards.LeaderboardPage = attrs.field(repr=False, kw_only=True)
+    """The first page of the leaderboard, which also has how many entries there are"""
+    period_str: str = attrs.field(repr=False, kw_only=True)
+    """The period, represented as a string."""
+
+    @property
+    def total(self) -> int:
+        return self.first_page.total
+
+    async def to_dict(self) -> dict:
+        """Convert this paginator into a dictionary for sending."""
+        # pages are only fetched as they're needed, rather than all at once
+        if self.page_index == 0:
+            page_data = self.first_page.entries
+        else:
+            page_data = (await self.fetch_page(self.page_index)).entries
+
+        gamertag_map = await pl_utils.get_xuid_to_gamertag_map(
+            self.bot, [e[0] for e in page_data if e[0] not in self.nicknames]
+        )
+
+        leaderboard_builder: list[str] = []
+        index = self.page_index * leaderboards.PAGE_SIZE
+
+        for xuid, playtime in page_data:
+            precisedelta = humanize.precisedelta(
+                playtime, minimum_unit="minutes", format="%0.0f"
+            )
+
+            if precisedelta == "1 minutes":  # why humanize
+                precisedelta = "1 minute"
+
+            display = models.display_gamertag(
+                xuid, gamertag_map[xuid], self.nicknames.get(xuid)
+            )
+
+            leaderboard_builder.append(f"**{index+1}\\.** {display} {precisedelta}")
+
+            index += 1
+
+        page = ipy.Embed(
+            title=f"Leaderboard for the past {self.period_str}",
+            description="\n".join(leaderboard_builder),
+            color=self.bot.color,
+            timestamp=self.timestamp,
+        )
+        page.set_author(name=f"Page {self.page_index+1}/{self.last_page_index+1}")
+
+        return {
+            "embeds": [page.to_dict()],
+            "components": [c.to_dict() for c in self.create_components()],
+        }
+
+
+@ipy.utils.define(kw_only=False, auto_detect=True)
+class DynamicRealmMembers(DynamicPaginator):
     pages_data: list[elytra.Player] = attrs.field(repr=False, kw_only=True)
     realm_name: str = attrs.field(repr=False, kw_only=True)
     owner_xuid: str = attrs.field(repr=False, kw_only=True)
-    period_str: str = attrs.field(repr=False, kw_only=True, default="", init=False)
+
+    @property
+    def total(self) -> int:
+        return len(self.pages_data)
 
     async def to_dict(self) -> dict:
         """Convert this paginator into a dictionary for sending."""
-        page_data = self.pages_data[self.page_index * 20 : (self.page_index * 20) + 20]
+        start = self.page_index * leaderboards.PAGE_SIZE
+        page_data = self.pages_data[start : start + leaderboards.PAGE_SIZE]
 
         gamertag_map = await pl_utils.get_xuid_to_gamertag_map(
             self.client, [p.uuid for p in page_data if p.uuid not in self.nicknames]
         )
 
         str_builder: list[str] = []
-        index = self.page_index * 20
+        index = start
 
         for player in page_data:
             xuid = player.uuid
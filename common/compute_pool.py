@@ -0,0 +1,160 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# runs heavy, pure functions - mostly the stats kernels - in worker processes
+# so that they don't block the event loop (and with it, heartbeats and every
+# other interaction)
+# this module holds state, so like metrics, it shouldn't be reloaded
+
+import asyncio
+import concurrent.futures
+import datetime
+import logging
+import multiprocessing
+import os
+import typing
+from concurrent.futures.process import BrokenProcessPool
+
+import common.metrics as metrics
+
+__all__ = ("default_timeout", "run", "shutdown", "start", "worker_count")
+
+logger = logging.getLogger("realms_bot")
+
+_executor: concurrent.futures.ProcessPoolExecutor | None = None
+# once the pool breaks, it stays broken - see _fail_over
+_broken = False
+
+
+def worker_count() -> int:
+    return int(os.environ.get("STATS_COMPUTE_WORKERS", "2"))
+
+
+def default_timeout() -> float:
+    return float(os.environ.get("STATS_COMPUTE_TIMEOUT", "60"))
+
+
+def _get_executor() -> concurrent.futures.ProcessPoolExecutor | None:
+    global _executor
+
+    if _executor is None and not _broken and (workers := worker_count()) > 0:
+        # fork rather than spawn or forkserver, as those re-run main.py - and so
+        # set up a whole other bot - in every worker
+        # the workers only ever touch numpy, so whatever else gets copied over
+        # doesn't matter much, and start() makes sure that's as little as possible
+        _executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        )
+
+    return _executor
+
+
+async def start() -> None:
+    """
+    Starts up the workers ahead of time, ideally before the bot has connected to
+    anything or cached much of anything.
+    """
+    if executor := _get_executor():
+        # forked pools start all of their workers on the first submit
+        await asyncio.get_running_loop().run_in_executor(executor, int)
+
+
+def _fail_over() -> None:
+    global _broken
+
+    if _broken:
+        return
+
+    # a worker died - making a new pool would mean forking the bot as it is now,
+    # threads and all, which can deadlock the children
+    # so everything's worked out in-process from here on until a restart
+    logger.warning("Stats compute pool broke, computing in-process from now on.")
+    metrics.counter("stats.compute.broken").inc()
+    _broken = True
+    shutdown()
+
+
+async def _run_in_pool[
+    *Ts, T
+](
+    executor: concurrent.futures.ProcessPoolExecutor,
+    deadline: float,
+    func: typing.Callable[[*Ts], T],
+    *args: *Ts,
+) -> T:
+    loop = asyncio.get_running_loop()
+    queue_depth = metrics.gauge("stats.compute.queue_depth")
+
+    future = executor.submit(func, *args)
+    queue_depth.inc()
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(queue_depth.dec))
+
+    try:
+        async with asyncio.timeout_at(deadline):
+            with metrics.timing("stats.compute.run").time():
+                return await asyncio.wrap_future(future)
+    except TimeoutError:
+        metrics.counter("stats.compute.timed_out").inc()
+        future.cancel()
+        raise
+    except asyncio.CancelledError:
+        metrics.counter("stats.compute.cancelled").inc()
+        future.cancel()
+        raise
+
+
+async def run[
+    *Ts, T
+](
+    func: typing.Callable[[*Ts], T],
+    *args: *Ts,
+    deadline: datetime.datetime | None = None,
+) -> T:
+    """
+    Runs the function in a worker process and waits for the result.
+    The function and its arguments have to be picklable, so module-level
+    functions and simple data only.
+
+    If this is still going by the deadline (or after STATS_COMPUTE_TIMEOUT seconds
+    if there isn't one) or the caller is cancelled, the work is cancelled too - though work
+    that's already running can only be abandoned, not stopped.
+    If there are no workers configured, the function is just run directly. If
+    the workers have broken, it's run in a thread instead.
+    """
+    if deadline is None:
+        timeout = default_timeout()
+    else:
+        timeout = (deadline - datetime.datetime.now(datetime.UTC)).total_seconds()
+    loop_deadline = asyncio.get_running_loop().time() + timeout
+
+    if (executor := _get_executor()) is not None:
+        try:
+            return await _run_in_pool(executor, loop_deadline, func, *args)
+        except BrokenProcessPool:
+            _fail_over()
+    elif not _broken:
+        return func(*args)
+
+    async with asyncio.timeout_at(loop_deadline):
+        return await asyncio.to_thread(func, *args)
+
+
+def shutdown() -> None:
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
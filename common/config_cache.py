@@ -0,0 +1,213 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+import typing
+import uuid
+
+import orjson
+
+import common.metrics as metrics
+
+if typing.TYPE_CHECKING:
+    import valkey.asyncio as aiovalkey
+
+    from common.models import GuildConfig
+
+__all__ = ("CACHE", "INVALIDATION_CHANNEL", "ConfigCache")
+
+logger = logging.getLogger("realms_bot")
+
+# guild configs are looked up on every interaction and for every guild on every
+# playerlist event, and they almost never change - so they're kept in memory
+# configs are stored here whenever they're fetched or saved, and every save (or
+# other change) is published to INVALIDATION_CHANNEL so that other processes drop
+# their copy of it. like the gamertag cache, entries also only live for LOCAL_TTL
+# seconds, which also covers premium codes expiring
+# looking up every config for a realm goes through the realm index for the guild
+# ids, then here
+# this is module-level since models needs it, so this module shouldn't be reloaded
+
+# how many configs are kept around
+MAX_ENTRIES = 25_000
+# how long configs last for, in seconds
+LOCAL_TTL = 900
+
+INVALIDATION_CHANNEL = "rpl-config-invalidate"
+
+
+class _Entry:
+    __slots__ = ("config", "expires_at")
+
+    def __init__(self, config: "GuildConfig", expires_at: float) -> None:
+        self.config = config
+        self.expires_at = expires_at
+
+
+class ConfigCache:
+    """
+    Keeps guild configs in memory by guild id. Configs are copied going in and
+    out, so changing one doesn't change what's cached until it's saved.
+    """
+
+    __slots__ = (
+        "_configs",
+        "_origin",
+        "invalidation_hooks",
+        "max_entries",
+        "ttl",
+        "valkey",
+    )
+
+    def __init__(
+        self, *, max_entries: int = MAX_ENTRIES, ttl: float = LOCAL_TTL
+    ) -> None:
+        self._configs: collections.OrderedDict[int, _Entry] = collections.OrderedDict()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # set at startup. until then, nothing is published
+        self.valkey: aiovalkey.Valkey | None = None
+        # used to ignore our own invalidation messages
+        self._origin = uuid.uuid4().hex
+        # called with the guild id of every config that was changed some other way
+        # than saving it here, or None if anything could have changed
+        self.invalidation_hooks: list[typing.Callable[[int | None], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._configs)
+
+    def _get_entry(self, guild_id: int, now: float) -> "GuildConfig | None":
+        entry = self._configs.get(guild_id)
+        if entry is None:
+            return None
+
+        if entry.expires_at <= now:
+            del self._configs[guild_id]
+            return None
+
+        self._configs.move_to_end(guild_id)
+        return entry.config
+
+    def get(self, guild_id: int) -> "GuildConfig | None":
+        if (config := self._get_entry(guild_id, time.monotonic())) is None:
+            metrics.counter("configs.cache.miss").inc()
+            return None
+
+        metrics.counter("configs.cache.hit").inc()
+        return config.model_copy(deep=True)
+
+    def put(self, config: "GuildConfig") -> None:
+        if self.max_entries <= 0:
+            # caching is off, so it'd just be evicted right away
+            return
+
+        # a config without its premium code would look like it doesn't have premium
+        if config.premium_code_id is not None and config.premium_code is None:
+            self._configs.pop(config.guild_id, None)
+            return
+
+        self._configs[config.guild_id] = _Entry(
+            config.model_copy(deep=True), time.monotonic() + self.ttl
+        )
+        self._configs.move_to_end(config.guild_id)
+
+        while len(self._configs) > self.max_entries:
+            self._configs.popitem(last=False)
+            metrics.counter("configs.cache.evicted").inc()
+
+    def discard(self, guild_id: int) -> None:
+        self._configs.pop(guild_id, None)
+
+    def clear(self) -> None:
+        self._configs.clear()
+
+    async def _publish(self, guild_id: int) -> None:
+        if not self.valkey:
+            return
+
+        try:
+            await self.valkey.publish(
+                INVALIDATION_CHANNEL,
+                orjson.dumps({"origin": self._origin, "guild_id": guild_id}),
+            )
+        except Exception:
+            # everyone else's copy will expire eventually anyways
+            logger.exception("Failed to publish config invalidation.")
+
+    async def store(self, config: "GuildConfig") -> None:
+        """
+        Stores a config that was just saved, and lets other processes know about it.
+        """
+        self.put(config)
+        await self._publish(config.guild_id)
+
+    async def invalidate(self, guild_id: int) -> None:
+        """
+        Drops a config that was changed some other way than saving it, both here
+        and in other processes.
+        """
+        self.discard(guild_id)
+        self._run_hooks(guild_id)
+        await self._publish(guild_id)
+
+    def _run_hooks(self, guild_id: int | None) -> None:
+        for hook in self.invalidation_hooks:
+            try:
+                hook(guild_id)
+            except Exception:
+                logger.exception("Config invalidation hook failed.")
+
+    def handle_invalidation(self, data: str | bytes) -> None:
+        message = orjson.loads(data)
+        if message["origin"] == self._origin:
+            return
+
+        self.discard(message["guild_id"])
+        self._run_hooks(message["guild_id"])
+        metrics.counter("configs.cache.invalidated").inc()
+
+    async def listen(self, valkey: "aiovalkey.Valkey") -> None:
+        """
+        Listens for invalidations from other processes until cancelled.
+        """
+        reconnecting = False
+
+        while True:
+            try:
+                async with valkey.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+
+                    # anything could have changed while we weren't listening
+                    # the first time around, we've only just loaded everything
+                    if reconnecting:
+                        self.clear()
+                        self._run_hooks(None)
+
+                    async for message in pubsub.listen():
+                        if message and message["type"] == "message":
+                            self.handle_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Config invalidation listener failed.")
+                reconnecting = True
+                await asyncio.sleep(5)
+
+
+CACHE = ConfigCache()
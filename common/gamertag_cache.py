@@ -0,0 +1,241 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+import typing
+import uuid
+
+import orjson
+
+import common.metrics as metrics
+
+if typing.TYPE_CHECKING:
+    import valkey.asyncio as aiovalkey
+    from valkey.asyncio.client import Pipeline
+
+__all__ = ("INVALIDATION_CHANNEL", "GamertagCache")
+
+logger = logging.getLogger("realms_bot")
+
+# an in-process layer in front of the "rpl-xuid-*" and "rpl-gt-*" keys in valkey
+# the playerlist, live playerlists and autorunners look up the same few hundred
+# active players over and over, and most of those lookups never need to leave
+# the process
+# whenever a gamertag is written to valkey, the xuids and gamertags involved are
+# published to INVALIDATION_CHANNEL so that every other process (other bots,
+# pollers) drops what it had for them. pub/sub is fire and forget, so entries also
+# only live for LOCAL_TTL seconds in case a message gets missed
+
+# how many xuids (and gamertags) are kept around in each direction
+MAX_ENTRIES = 50_000
+# how long entries last for, in seconds
+LOCAL_TTL = 600
+
+INVALIDATION_CHANNEL = "rpl-gamertag-invalidate"
+
+
+class _Entry:
+    __slots__ = ("expires_at", "value")
+
+    def __init__(self, value: str, expires_at: float) -> None:
+        self.value = value
+        self.expires_at = expires_at
+
+
+class _LRU:
+    __slots__ = ("_entries", "max_entries", "ttl")
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self._entries: collections.OrderedDict[str, _Entry] = collections.OrderedDict()
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, now: float) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if entry.expires_at <= now:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def set(self, key: str, value: str, now: float) -> list[tuple[str, str]]:
+        self._entries[key] = _Entry(value, now + self.ttl)
+        self._entries.move_to_end(key)
+
+        evicted: list[tuple[str, str]] = []
+        while len(self._entries) > self.max_entries:
+            evicted_key, entry = self._entries.popitem(last=False)
+            evicted.append((evicted_key, entry.value))
+        return evicted
+
+    def pop(self, key: str) -> str | None:
+        entry = self._entries.pop(key, None)
+        return entry.value if entry else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class GamertagCache:
+    """
+    Keeps recently used xuid to gamertag (and gamertag to xuid) mappings in memory,
+    falling back to valkey for anything that isn't.
+    """
+
+    __slots__ = ("_gamertags", "_origin", "_xuids")
+
+    def __init__(
+        self, *, max_entries: int = MAX_ENTRIES, ttl: float = LOCAL_TTL
+    ) -> None:
+        self._gamertags = _LRU(max_entries, ttl)
+        self._xuids = _LRU(max_entries, ttl)
+        # used to ignore our own invalidation messages
+        self._origin = uuid.uuid4().hex
+
+    def __len__(self) -> int:
+        return len(self._gamertags)
+
+    def put(self, xuid: str, gamertag: str) -> None:
+        now = time.monotonic()
+
+        # keep both directions evicting the same players
+        for _, old_gamertag in self._gamertags.set(xuid, gamertag, now):
+            self._xuids.pop(old_gamertag)
+        for _, old_xuid in self._xuids.set(gamertag, xuid, now):
+            self._gamertags.pop(old_xuid)
+
+    def discard(self, xuid: str | None = None, gamertag: str | None = None) -> None:
+        if xuid and (old_gamertag := self._gamertags.pop(xuid)):
+            self._xuids.pop(old_gamertag)
+        if gamertag and (old_xuid := self._xuids.pop(gamertag)):
+            self._gamertags.pop(old_xuid)
+
+    def clear(self) -> None:
+        self._gamertags.clear()
+        self._xuids.clear()
+
+    async def get_gamertags(
+        self, valkey: "aiovalkey.Valkey", xuids: typing.Iterable[str]
+    ) -> dict[str, str | None]:
+        """
+        Gets the gamertag of every given xuid, or None for the ones that aren't
+        known. Anything not in memory is fetched from valkey in one go.
+        """
+        now = time.monotonic()
+        results: dict[str, str | None] = {}
+        missing: list[str] = []
+
+        for xuid in xuids:
+            if (gamertag := self._gamertags.get(xuid, now)) is not None:
+                results[xuid] = gamertag
+            else:
+                missing.append(xuid)
+
+        metrics.counter("gamertags.cache.local_hit").inc(len(results))
+
+        if missing:
+            async with valkey.pipeline() as pipeline:
+                for xuid in missing:
+                    pipeline.get(f"rpl-xuid-{xuid}")
+                fetched: list[str | None] = await pipeline.execute()
+
+            for xuid, gamertag in zip(missing, fetched, strict=True):
+                results[xuid] = gamertag
+                if gamertag:
+                    self.put(xuid, gamertag)
+
+            found = sum(1 for gamertag in fetched if gamertag)
+            metrics.counter("gamertags.cache.valkey_hit").inc(found)
+            metrics.counter("gamertags.cache.miss").inc(len(missing) - found)
+
+        return results
+
+    async def get_gamertag(self, valkey: "aiovalkey.Valkey", xuid: str) -> str | None:
+        return (await self.get_gamertags(valkey, (xuid,)))[xuid]
+
+    async def get_xuid(self, valkey: "aiovalkey.Valkey", gamertag: str) -> str | None:
+        if (xuid := self._xuids.get(gamertag, time.monotonic())) is not None:
+            metrics.counter("gamertags.cache.local_hit").inc()
+            return xuid
+
+        if xuid := await valkey.get(f"rpl-gt-{gamertag}"):
+            metrics.counter("gamertags.cache.valkey_hit").inc()
+            self.put(xuid, gamertag)
+        else:
+            metrics.counter("gamertags.cache.miss").inc()
+        return xuid
+
+    def queue_store(
+        self, pipe: "Pipeline", gamertags: typing.Mapping[str, str], expire: int
+    ) -> None:
+        """
+        Queues up storing the given xuid to gamertag mappings in valkey (and
+        telling everyone else about them), and stores them in memory right away.
+        """
+        if not gamertags:
+            return
+
+        for xuid, gamertag in gamertags.items():
+            self.discard(xuid, gamertag)
+            self.put(xuid, gamertag)
+
+            pipe.setex(name=f"rpl-xuid-{xuid}", time=expire, value=gamertag)
+            pipe.setex(name=f"rpl-gt-{gamertag}", time=expire, value=xuid)
+
+        pipe.publish(
+            INVALIDATION_CHANNEL,
+            orjson.dumps({"origin": self._origin, "pairs": list(gamertags.items())}),
+        )
+
+    def handle_invalidation(self, data: str | bytes) -> None:
+        message = orjson.loads(data)
+        if message["origin"] == self._origin:
+            return
+
+        for xuid, gamertag in message["pairs"]:
+            self.discard(xuid, gamertag)
+        metrics.counter("gamertags.cache.invalidated").inc(len(message["pairs"]))
+
+    async def listen(self, valkey: "aiovalkey.Valkey") -> None:
+        """
+        Listens for invalidations from other processes until cancelled.
+        """
+        while True:
+            try:
+                async with valkey.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+
+                    # anything could have changed while we weren't listening
+                    self.clear()
+
+                    async for message in pubsub.listen():
+                        if message and message["type"] == "message":
+                            self.handle_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Gamertag invalidation listener failed.")
+                await asyncio.sleep(5)
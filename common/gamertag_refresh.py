@@ -0,0 +1,222 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import time
+import typing
+import zlib
+
+import common.metrics as metrics
+import common.playerlist_utils as pl_utils
+import common.ratelimits as ratelimits
+
+if typing.TYPE_CHECKING:
+    from common.utils import RealmBotBase
+
+__all__ = ("GamertagRefresher",)
+
+# gamertags in valkey expire after a week, and when a popular realm's gamertags
+# were all fetched at once, they all expire at once too - leaving the next
+# autorunner with hundreds of misses to get through
+# instead, the gamertags of anyone who's been active recently are fetched again
+# a bit before they expire. every xuid gets its own point in REFRESH_SPREAD to be
+# refreshed at, so gamertags that would expire together get refreshed at
+# different times, and the load is spread out
+
+# gamertags are refreshed somewhere between REFRESH_AHEAD and
+# REFRESH_AHEAD + REFRESH_SPREAD before they expire
+REFRESH_AHEAD = datetime.timedelta(hours=6)
+REFRESH_SPREAD = datetime.timedelta(hours=18)
+# how long players count as recently active for after they were last seen online
+RECENT_WINDOW = datetime.timedelta(days=1)
+# the most gamertags refreshed in one go - anything past this waits for the next run
+MAX_PER_RUN = 5_000
+# how many xuids are loaded at a time when looking for recently active players
+SEED_PAGE_SIZE = 5_000
+# gamertags that couldn't be resolved are tried again after this, doubling every
+# time it fails again up to MAX_FAILURE_BACKOFF
+FAILURE_BACKOFF = datetime.timedelta(hours=1)
+MAX_FAILURE_BACKOFF = datetime.timedelta(days=1)
+
+_SEED_PAGE = """
+SELECT DISTINCT "xuid" FROM "realmplayersession"
+WHERE ("online" OR "last_seen" >= $1::timestamptz) AND "xuid" > $2
+ORDER BY "xuid"
+LIMIT $3
+"""
+
+
+def _refresh_threshold(xuid: str) -> int:
+    # crc32 since hash() changes between processes
+    spread = int(REFRESH_SPREAD.total_seconds())
+    return int(REFRESH_AHEAD.total_seconds()) + zlib.crc32(xuid.encode()) % spread
+
+
+def _failure_backoff(failures: int) -> float:
+    backoff = FAILURE_BACKOFF.total_seconds() * 2 ** (failures - 1)
+    return min(backoff, MAX_FAILURE_BACKOFF.total_seconds())
+
+
+class GamertagRefresher:
+    """
+    Keeps the gamertags of recently active players from expiring in Valkey.
+    """
+
+    __slots__ = ("failures", "next_check", "recent", "seeded")
+
+    def __init__(self) -> None:
+        # xuid: the last time (in monotonic time) they were seen online
+        self.recent: dict[str, float] = {}
+        # xuid: the time (in monotonic time) their gamertag could next be due
+        # there's no point asking valkey about a gamertag that has days left,
+        # so xuids without an entry here are the only ones looked at every run
+        self.next_check: dict[str, float] = {}
+        # xuid: how many times in a row their gamertag couldn't be resolved
+        self.failures: dict[str, int] = {}
+        self.seeded = False
+
+    def track(self, xuids: typing.Iterable[str], now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        for xuid in xuids:
+            self.recent[xuid] = now
+
+    def forget_old(self, now: float | None = None) -> None:
+        cutoff = (
+            time.monotonic() if now is None else now
+        ) - RECENT_WINDOW.total_seconds()
+        self.recent = {
+            xuid: seen for xuid, seen in self.recent.items() if seen >= cutoff
+        }
+        self.next_check = {
+            xuid: check
+            for xuid, check in self.next_check.items()
+            if xuid in self.recent
+        }
+        self.failures = {
+            xuid: count for xuid, count in self.failures.items() if xuid in self.recent
+        }
+
+    async def _seed(self, bot: "RealmBotBase") -> None:
+        # players who were around before we started up count too
+        # there can be a lot of them, so they're gone through a page at a time
+        since = datetime.datetime.now(tz=datetime.UTC) - RECENT_WINDOW
+        last_xuid = ""
+
+        while True:
+            rows = await bot.db.query_raw(_SEED_PAGE, since, last_xuid, SEED_PAGE_SIZE)
+            if not rows:
+                break
+
+            self.track(row["xuid"] for row in rows)
+            last_xuid = rows[-1]["xuid"]
+
+            if len(rows) < SEED_PAGE_SIZE:
+                break
+
+        self.seeded = True
+
+    async def due(
+        self, bot: "RealmBotBase", now: float | None = None
+    ) -> tuple[list[str], list[str]]:
+        """
+        Returns every tracked xuid whose gamertag is missing from Valkey, and
+        every one whose gamertag is past its refresh point, the ones closest to
+        expiring first.
+        """
+        now = time.monotonic() if now is None else now
+        xuids = [xuid for xuid in self.recent if self.next_check.get(xuid, 0.0) <= now]
+        if not xuids:
+            return [], []
+
+        async with bot.valkey.pipeline() as pipeline:
+            for xuid in xuids:
+                pipeline.ttl(f"rpl-xuid-{xuid}")
+            ttls: list[int] = await pipeline.execute()
+
+        missing: list[str] = []
+        expiring: list[tuple[int, str]] = []
+
+        for xuid, ttl in zip(xuids, ttls, strict=True):
+            # -2 means it doesn't exist, -1 means it never expires
+            if ttl == -2:
+                missing.append(xuid)
+                continue
+
+            threshold = _refresh_threshold(xuid)
+            if 0 <= ttl <= threshold:
+                expiring.append((ttl, xuid))
+            elif ttl == -1:
+                self.next_check[xuid] = now + RECENT_WINDOW.total_seconds()
+            else:
+                self.next_check[xuid] = now + ttl - threshold
+
+        expiring.sort()
+        return missing, [xuid for _, xuid in expiring]
+
+    async def run(self, bot: "RealmBotBase") -> int:
+        """
+        Refreshes the gamertags that are due, returning how many were.
+        """
+        if not self.seeded:
+            await self._seed(bot)
+
+        now = time.monotonic()
+        for realm_id in bot.online_state.realm_ids():
+            self.track(bot.online_state.xuids(realm_id), now)
+        self.forget_old(now)
+
+        missing, expiring = await self.due(bot, now)
+        metrics.gauge("gamertags.refresh.tracked").set(len(self.recent))
+        metrics.gauge("gamertags.refresh.due").set(len(missing) + len(expiring))
+
+        if missing:
+            # a gamertag missing from valkey is usually still in the database, which
+            # puts it back into valkey for a bit - it'll be refreshed properly
+            # later, once it's close to expiring again
+            known = await pl_utils.get_known_gamertags(bot, missing)
+            restored = [xuid for xuid in missing if known.get(xuid)]
+            for xuid in restored:
+                self.next_check.pop(xuid, None)
+            metrics.counter("gamertags.refresh.restored").inc(len(restored))
+
+            missing = [xuid for xuid in missing if not known.get(xuid)]
+
+        to_refresh = (missing + expiring)[:MAX_PER_RUN]
+        refreshed = 0
+        if to_refresh:
+            # this goes through the resolver like anything else, which writes
+            # the new gamertags (and expiry times) back to valkey
+            resolved = await bot.gamertag_resolver.resolve(
+                to_refresh, priority=ratelimits.Priority.BACKGROUND
+            )
+
+            for xuid in to_refresh:
+                if xuid in resolved:
+                    refreshed += 1
+                    self.failures.pop(xuid, None)
+                    # checked next run, which will find its new expiry time
+                    self.next_check.pop(xuid, None)
+                    continue
+
+                # no point trying this one again every run
+                failures = self.failures.get(xuid, 0) + 1
+                self.failures[xuid] = failures
+                self.next_check[xuid] = now + _failure_backoff(failures)
+
+            metrics.counter("gamertags.refresh.failed").inc(len(to_refresh) - refreshed)
+
+        metrics.counter("gamertags.refresh.refreshed").inc(refreshed)
+        return refreshed
@@ -0,0 +1,192 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import time
+import typing
+
+import common.metrics as metrics
+import common.playerlist_utils as pl_utils
+import common.ratelimits as ratelimits
+
+if typing.TYPE_CHECKING:
+    from common.utils import RealmBotBase
+
+__all__ = ("GamertagResolver",)
+
+# the hourly autorunner, live playerlists, and commands like /leaderboard all tend
+# to miss on the same xuids at the same time, and used to each fetch them on
+# their own - burning through peoplehub's ratelimit for nothing
+# instead, every request waits a moment for others to come in, and everything
+# asked for in that moment is fetched together, with anything already being
+# fetched shared between everyone who wants it
+# like the gamertag cache, this lives on the bot and so shouldn't be reloaded
+
+# how long to wait for other requests to come in, in seconds
+COALESCE_WINDOW = 0.05
+
+
+class _Flight(typing.NamedTuple):
+    future: asyncio.Future[pl_utils.GamertagInfo | None]
+    with_device: bool
+    priority: ratelimits.Priority
+
+
+class GamertagResolver:
+    """
+    Resolves XUIDs to gamertags through GamertagHandler, merging concurrent requests
+    for the same XUIDs into one batch.
+    """
+
+    __slots__ = ("_flush_task", "_in_flight", "_pending", "bot")
+
+    def __init__(self, bot: "RealmBotBase") -> None:
+        self.bot = bot
+        self._in_flight: dict[str, _Flight] = {}
+        self._pending: dict[str, _Flight] = {}
+        self._flush_task: asyncio.Task[None] | None = None
+
+    async def resolve(
+        self,
+        xuids: typing.Iterable[str],
+        *,
+        gather_devices_for: typing.Container[str] = frozenset(),
+        priority: ratelimits.Priority = ratelimits.Priority.INTERACTIVE,
+    ) -> dict[str, pl_utils.GamertagInfo]:
+        """
+        Resolves the given XUIDs, returning the ones that could be resolved.
+        Devices are only gathered for XUIDs in gather_devices_for.
+        Batches go out with the most urgent priority of anyone waiting on them.
+        """
+        loop = asyncio.get_running_loop()
+        futures: dict[str, asyncio.Future[pl_utils.GamertagInfo | None]] = {}
+        coalesced = 0
+
+        for xuid in dict.fromkeys(xuids):
+            if not xuid:
+                continue
+
+            with_device = xuid in gather_devices_for
+
+            # a fetch without devices is no good for someone who wants them,
+            # but the other way around is fine
+            flight = self._in_flight.get(xuid)
+            pending = flight is not None and self._pending.get(xuid) is flight
+
+            if flight and (flight.with_device or not with_device):
+                if pending and priority < flight.priority:
+                    self._in_flight[xuid] = self._pending[xuid] = flight._replace(
+                        priority=priority
+                    )
+
+                futures[xuid] = flight.future
+                coalesced += 1
+                continue
+
+            if flight and pending:
+                # it hasn't been fetched yet, so it can just gather the device too
+                flight = flight._replace(
+                    with_device=True, priority=min(priority, flight.priority)
+                )
+                coalesced += 1
+            else:
+                flight = _Flight(loop.create_future(), with_device, priority)
+
+            self._in_flight[xuid] = self._pending[xuid] = flight
+            futures[xuid] = flight.future
+
+        metrics.counter("gamertags.resolver.requested").inc(len(futures))
+        metrics.counter("gamertags.resolver.coalesced").inc(coalesced)
+
+        if self._pending and self._flush_task is None:
+            self._flush_task = self.bot.create_task(self._flush())
+
+        # shielded so that one caller giving up doesn't cancel it for everyone
+        results = await asyncio.gather(
+            *(asyncio.shield(future) for future in futures.values())
+        )
+        return {
+            xuid: info
+            for xuid, info in zip(futures.keys(), results, strict=True)
+            if info
+        }
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(COALESCE_WINDOW)
+
+        pending = self._pending
+        self._pending = {}
+        self._flush_task = None
+
+        # each priority gets its own handler so that a big background batch doesn't
+        # get to jump the queue because one live playerlist xuid was in it
+        by_priority: dict[ratelimits.Priority, dict[str, _Flight]] = {}
+        for xuid, flight in pending.items():
+            by_priority.setdefault(flight.priority, {})[xuid] = flight
+
+        await asyncio.gather(
+            *(self._run_batch(flights) for flights in by_priority.values())
+        )
+
+    async def _run_batch(self, flights: dict[str, _Flight]) -> None:
+        metrics.counter("gamertags.resolver.fetched").inc(len(flights))
+        start = time.perf_counter()
+
+        try:
+            handler = pl_utils.GamertagHandler(
+                self.bot,
+                tuple(flights.keys()),
+                self.bot.openxbl_session,
+                gather_devices_for={
+                    xuid for xuid, flight in flights.items() if flight.with_device
+                },
+                priority=next(iter(flights.values())).priority,
+            )
+
+            # the handler fetches in chunks, so whoever's waiting on a chunk can
+            # have their gamertags as soon as it's done
+            async for results in handler.stream():
+                for xuid, info in results.items():
+                    flight = flights.get(xuid)
+                    if flight and not flight.future.done():
+                        flight.future.set_result(info)
+        except asyncio.CancelledError:
+            for flight in flights.values():
+                flight.future.cancel()
+            raise
+        except Exception as e:
+            metrics.counter("gamertags.resolver.failed").inc(len(flights))
+            for flight in flights.values():
+                if not flight.future.done():
+                    flight.future.set_exception(e)
+                    # everyone waiting on this may have given up already, and
+                    # asyncio would complain about the exception never being
+                    # retrieved - anyone still waiting gets it all the same
+                    flight.future.exception()
+        else:
+            # anything left couldn't be resolved
+            for flight in flights.values():
+                if not flight.future.done():
+                    flight.future.set_result(None)
+        finally:
+            metrics.timing("gamertags.resolver.batch").observe(
+                time.perf_counter() - start
+            )
+
+            for xuid, flight in flights.items():
+                # a request wanting devices may have started its own fetch since
+                if self._in_flight.get(xuid) is flight:
+                    del self._in_flight[xuid]
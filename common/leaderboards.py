@@ -0,0 +1,116 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import typing
+
+from prisma import get_client
+
+import common.playtime_rollup as playtime_rollup
+
+if typing.TYPE_CHECKING:
+    from prisma import Prisma
+
+__all__ = (
+    "PAGE_SIZE",
+    "LeaderboardPage",
+    "fetch_page",
+)
+
+PAGE_SIZE = 20
+
+# every session since the given time, as epoch timestamps
+# same parameters and columns as the rollup version, so the leaderboard query can
+# use either
+_SESSION_RANGES = """
+SELECT "xuid", floor(extract(epoch FROM "joined_at"))::bigint AS "start",
+    floor(extract(epoch FROM "last_seen"))::bigint AS "end", 1 AS "weight"
+FROM "realmplayersession"
+WHERE "realm_id" = $1 AND "joined_at" >= $2::timestamptz AND "last_seen" IS NOT NULL
+    AND ($3::text[] IS NULL OR "xuid" = ANY($3::text[]))
+"""
+
+# the playtime of a range is its end floored to the minute minus its start floored
+# to the minute (or nothing if that's negative) - exactly like calc_timespan
+# ranges with a negative weight are taken away instead, see WEIGHTED_HOURLY_RANGES
+# the earliest session is looked up directly, as the rollups start on the hour
+# ties are broken by xuid so that pages don't shuffle around between fetches
+_LEADERBOARD = """
+WITH "ranges" AS ({ranges}), "totals" AS (
+    SELECT "xuid",
+        sum("weight" * greatest("end" / 60 - "start" / 60, 0))::bigint * 60
+            AS "seconds"
+    FROM "ranges"
+    WHERE "xuid" <> ''
+    GROUP BY "xuid"
+)
+SELECT "xuid", "seconds", count(*) OVER () AS "total",
+    (
+        SELECT floor(extract(epoch FROM min("joined_at")))::bigint
+        FROM "realmplayersession"
+        WHERE "realm_id" = $1 AND "joined_at" >= $2::timestamptz
+            AND "last_seen" IS NOT NULL
+            AND ($3::text[] IS NULL OR "xuid" = ANY($3::text[]))
+    ) AS "earliest"
+FROM "totals"
+WHERE "seconds" > 0
+ORDER BY "seconds" DESC, "xuid"
+LIMIT $4 OFFSET $5
+"""
+_SESSION_LEADERBOARD = _LEADERBOARD.format(ranges=_SESSION_RANGES)
+_ROLLUP_LEADERBOARD = _LEADERBOARD.format(ranges=playtime_rollup.WEIGHTED_HOURLY_RANGES)
+
+
+class LeaderboardPage(typing.NamedTuple):
+    entries: list[tuple[str, int]]
+    """The xuids and seconds played of the players on this page."""
+    total: int
+    """How many players are on the leaderboard in total."""
+    earliest: datetime.datetime | None
+    """When the earliest data used for the leaderboard starts."""
+
+
+async def fetch_page(
+    realm_id: str,
+    min_datetime: datetime.datetime,
+    page: int,
+    *,
+    rollups: bool = True,
+    db: "Prisma | None" = None,
+) -> LeaderboardPage:
+    """
+    Fetches a page of the Realm's playtime leaderboard since the given time,
+    most played first. If rollups is true, the hourly playtime rollups are used
+    rather than every session - the results are the same either way.
+    """
+    db = db or get_client()
+    query = _ROLLUP_LEADERBOARD if rollups else _SESSION_LEADERBOARD
+
+    rows = await db.query_raw(
+        query, realm_id, min_datetime, None, PAGE_SIZE, page * PAGE_SIZE
+    )
+    if not rows:
+        return LeaderboardPage([], 0, None)
+
+    return LeaderboardPage(
+        [(row["xuid"], row["seconds"]) for row in rows],
+        rows[0]["total"],
+        (
+            datetime.datetime.fromtimestamp(rows[0]["earliest"], tz=datetime.UTC)
+            if rows[0]["earliest"] is not None
+            else None
+        ),
+    )
@@ -0,0 +1,200 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import typing
+
+import interactions as ipy
+
+import common.metrics as metrics
+import common.playerlist_utils as pl_utils
+
+if typing.TYPE_CHECKING:
+    from common.models import GuildConfig
+    from common.playerlist_events import LiveOnlineUpdate
+    from common.utils import RealmBotBase
+
+__all__ = ("LiveOnlineRenderer", "build_embed")
+
+logger = logging.getLogger("realms_bot")
+
+# live online lists used to be edited on every single update, which for busy realms
+# meant an edit per guild every minute - more than enough to run into discord's
+# per-channel ratelimits, which then got the list invalidated
+# instead, updates for a message wait a moment for others to come in and are
+# merged together, and the message is only edited if what it shows has changed
+# like the gamertag resolver, this lives on the bot and so shouldn't be reloaded
+
+# how long updates for a message are gathered up before it's edited, in seconds
+# this also acts as the minimum time between edits of the same message
+COALESCE_WINDOW = 3.0
+
+
+def build_embed(
+    color: ipy.Color,
+    online_count: int,
+    gamertag_str: str,
+    timestamp: datetime.datetime,
+) -> ipy.Embed:
+    embed = ipy.Embed(
+        title=f"{online_count}/10 people online",
+        description=gamertag_str or "*No players online.*",
+        color=color,
+        timestamp=timestamp,  # type: ignore
+    )
+    embed.set_footer("As of")
+    return embed
+
+
+class _Pending:
+    """Every update for a message that hasn't been applied yet, merged together."""
+
+    __slots__ = (
+        "config",
+        "gamertag_mapping",
+        "joined",
+        "left",
+        "realm_down",
+        "timestamp",
+        "updates",
+    )
+
+    def __init__(self, event: "LiveOnlineUpdate") -> None:
+        # the sets are shared between every guild's event, so they need copying
+        self.joined = set(event.joined)
+        self.left = set(event.left)
+        self.gamertag_mapping = dict(event.gamertag_mapping)
+        self.timestamp = event.timestamp
+        self.realm_down = event.realm_down_event
+        self.config: GuildConfig = event.config
+        self.updates = 1
+
+    def merge(self, event: "LiveOnlineUpdate") -> None:
+        # a later update wins - someone who left and then joined again is online
+        self.joined.difference_update(event.left)
+        self.joined.update(event.joined)
+        self.left.difference_update(event.joined)
+        self.left.update(event.left)
+        self.gamertag_mapping.update(event.gamertag_mapping)
+
+        self.timestamp = event.timestamp
+        self.realm_down = event.realm_down_event
+        self.config = event.config
+        self.updates += 1
+
+
+class LiveOnlineRenderer:
+    """
+    Keeps live online lists up to date, merging updates that come in close together
+    and skipping edits that wouldn't change anything.
+    """
+
+    __slots__ = ("_pending", "_rendered", "_tasks", "bot")
+
+    def __init__(self, bot: "RealmBotBase") -> None:
+        self.bot = bot
+        # keyed by the live online channel, ie "channel_id|message_id"
+        self._pending: dict[str, _Pending] = {}
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+        # what each message was last successfully edited to show
+        self._rendered: dict[str, tuple[str, str]] = {}
+
+    def submit(self, event: "LiveOnlineUpdate") -> None:
+        key = event.live_online_channel
+
+        if pending := self._pending.get(key):
+            pending.merge(event)
+            metrics.counter("live_online.coalesced").inc()
+        else:
+            self._pending[key] = _Pending(event)
+
+        # only one task per message, so edits to it never race each other
+        if key not in self._tasks:
+            self._tasks[key] = self.bot.create_task(self._run(key))
+
+    def discard(self, key: str) -> None:
+        self._pending.pop(key, None)
+        self._rendered.pop(key, None)
+
+    async def _run(self, key: str) -> None:
+        try:
+            while key in self._pending:
+                await asyncio.sleep(COALESCE_WINDOW)
+
+                pending = self._pending.pop(key, None)
+                if not pending:
+                    break
+
+                try:
+                    await self._apply(key, pending)
+                except Exception:
+                    logger.exception("Failed to update live online list %s.", key)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _apply(self, key: str, pending: _Pending) -> None:
+        xuid_str: str | None
+        old_gamertag_str: str | None
+        xuid_str, old_gamertag_str = await self.bot.valkey.hmget(
+            key, ("xuids", "gamertags")
+        )
+
+        xuids_init: list[str] = xuid_str.split(",") if xuid_str else []
+        gamertags: list[str] = old_gamertag_str.splitlines() if old_gamertag_str else []
+
+        gamertag_mapping = pending.gamertag_mapping
+        gamertag_mapping.update(dict(zip(xuids_init, gamertags, strict=True)))
+
+        xuids = set(xuids_init).union(pending.joined).difference(pending.left)
+        xuid_list = sorted(xuids, key=lambda x: gamertag_mapping[x].lower())
+
+        new_xuid_str = ",".join(xuid_list)
+        gamertag_str = "\n".join(gamertag_mapping[xuid] for xuid in xuid_list)
+
+        if new_xuid_str != (xuid_str or "") or gamertag_str != (old_gamertag_str or ""):
+            await self.bot.valkey.hset(
+                key, mapping={"xuids": new_xuid_str, "gamertags": gamertag_str}
+            )
+
+        if pending.realm_down:
+            gamertag_str = f"{os.environ['GRAY_CIRCLE_EMOJI']} *Realm is offline.*"
+
+        rendered = (str(len(xuids)), gamertag_str)
+        if self._rendered.get(key) == rendered:
+            metrics.counter("live_online.skipped").inc(pending.updates)
+            return
+
+        embed = build_embed(self.bot.color, len(xuids), gamertag_str, pending.timestamp)
+
+        chan_id, msg_id = key.split("|")
+        fake_msg = ipy.Message(client=self.bot, id=int(msg_id), channel_id=int(chan_id))  # type: ignore
+
+        try:
+            await fake_msg.edit(embed=embed)
+        except ipy.errors.HTTPException as e:
+            self._rendered.pop(key, None)
+            metrics.counter("live_online.failed").inc()
+            if e.status < 500:
+                await pl_utils.eventually_invalidate_live_online(
+                    self.bot, pending.config
+                )
+            return
+
+        self._rendered[key] = rendered
+        metrics.counter("live_online.edited").inc()
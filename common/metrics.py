@@ -0,0 +1,136 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import collections
+import contextlib
+import time
+import typing
+
+__all__ = ("Counter", "Gauge", "Timing", "counter", "gauge", "render", "timing")
+
+# a tiny, in-process metrics registry
+# this is meant to be looked at through the owner debug command, not scraped,
+# so it only keeps enough around to give a decent idea of what's going on
+
+# note: this module should not be reloaded by extensions, or else every metric
+# gets reset
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def render(self) -> str:
+        return str(self.value)
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value: float = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def render(self) -> str:
+        return str(round(self.value, 3))
+
+
+class Timing:
+    __slots__ = ("count", "last", "max", "recent", "total")
+
+    def __init__(self, window: int = 120) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+        self.recent: collections.deque[float] = collections.deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    @contextlib.contextmanager
+    def time(self) -> typing.Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def percentile(self, percent: float) -> float:
+        if not self.recent:
+            return 0.0
+
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, int(len(ordered) * percent))
+        return ordered[index]
+
+    def render(self) -> str:
+        if not self.count:
+            return "no data"
+
+        return (
+            f"last={self.last:.3f}s p50={self.percentile(0.5):.3f}s"
+            f" p95={self.percentile(0.95):.3f}s max={self.max:.3f}s n={self.count}"
+        )
+
+
+_registry: dict[str, Counter | Gauge | Timing] = {}
+
+
+def _get_or_create[T: Counter | Gauge | Timing](name: str, cls: type[T]) -> T:
+    metric = _registry.get(name)
+    if metric is None:
+        metric = _registry[name] = cls()
+    elif not isinstance(metric, cls):
+        raise TypeError(f"Metric {name} is a {type(metric).__name__}, not {cls}.")
+    return metric  # type: ignore
+
+
+def counter(name: str) -> Counter:
+    return _get_or_create(name, Counter)
+
+
+def gauge(name: str) -> Gauge:
+    return _get_or_create(name, Gauge)
+
+
+def timing(name: str) -> Timing:
+    return _get_or_create(name, Timing)
+
+
+def render(prefix: str = "") -> str:
+    return "\n".join(
+        f"{name}: {metric.render()}"
+        for name, metric in sorted(_registry.items())
+        if name.startswith(prefix)
+    )
@@ -37,6 +37,9 @@ from prisma.models import (
 )
 from prisma.partials import AutorunPlayerSession, PrismaAutorunGuildConfig
 
+import common.config_cache as config_cache
+import common.realm_index as realm_index
+
 logger = logging.getLogger("realms_bot")
 
 __all__ = (
@@ -93,15 +96,56 @@ class GuildConfig(PrismaGuildConfig):
 
     @classmethod
     async def get(cls, guild_id: int) -> "GuildConfig":
-        return await cls.prisma().find_unique_or_raise(
+        if config := config_cache.CACHE.get(guild_id):
+            return config
+
+        config = await cls.prisma().find_unique_or_raise(
             where={"guild_id": guild_id}, include={"premium_code": True}
         )
+        config_cache.CACHE.put(config)
+        return config
 
     @classmethod
     async def get_or_none(cls, guild_id: int) -> typing.Optional["GuildConfig"]:
-        return await cls.prisma().find_unique(
+        if config := config_cache.CACHE.get(guild_id):
+            return config
+
+        config = await cls.prisma().find_unique(
             where={"guild_id": guild_id}, include={"premium_code": True}
         )
+        if config:
+            config_cache.CACHE.put(config)
+        return config
+
+    @classmethod
+    async def get_many(cls, guild_ids: typing.Iterable[int]) -> list["GuildConfig"]:
+        configs: list[GuildConfig] = []
+        missing: list[int] = []
+
+        for guild_id in guild_ids:
+            if config := config_cache.CACHE.get(guild_id):
+                configs.append(config)
+            else:
+                missing.append(guild_id)
+
+        if missing:
+            fetched = await cls.prisma().find_many(
+                where={"guild_id": {"in": missing}}, include={"premium_code": True}
+            )
+            for config in fetched:
+                config_cache.CACHE.put(config)
+            configs.extend(fetched)
+
+        return configs
+
+    @classmethod
+    async def get_for_realm(cls, realm_id: str) -> list["GuildConfig"]:
+        # the index knows which guilds there are, the cache (hopefully) has them
+        return [
+            config
+            for config in await cls.get_many(realm_index.INDEX.guild_ids(realm_id))
+            if config.realm_id == realm_id
+        ]
 
     @cached_property
     def valid_premium(self) -> bool:
@@ -117,6 +161,8 @@ class GuildConfig(PrismaGuildConfig):
         if data.get("nicknames") is not None:
             data["nicknames"] = Json(data["nicknames"])
         await self.prisma().update(where={"guild_id": self.guild_id}, data=data)  # type: ignore
+        realm_index.INDEX.update(self)
+        await config_cache.CACHE.store(self)
 
 
 class AutorunGuildConfig(PrismaAutorunGuildConfig):
@@ -144,6 +190,10 @@ EMOJI_DEVICE_NAMES = {
 
 
 class PlayerSession(PrismaPlayerSession):
+    # every session in the database has a joined_at, but sessions that are only
+    # used for display (like in live playerlists) don't
+    joined_at: typing.Optional[datetime] = None  # type: ignore
+
     if typing.TYPE_CHECKING:
         gamertag: typing.Optional[str] = None
         device: typing.Optional[str] = None
@@ -0,0 +1,299 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import typing
+import uuid
+from array import array
+from bisect import bisect_left
+
+__all__ = ("OnlineSession", "OnlineState", "RealmDiff")
+
+# xuids are (almost always) 16 digit numbers, so they fit just fine into an
+# unsigned 64 bit int. anything that isn't gets interned into ids from here up,
+# which real xuids will never reach
+_INTERNED_START = 1 << 63
+_UUID_SIZE = 16
+
+# join times are kept as microseconds since the epoch, which is exactly what
+# postgres keeps - they need to match the database to find the session's partition
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _to_micros(timestamp: datetime.datetime) -> int:
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+class OnlineSession(typing.NamedTuple):
+    xuid: str
+    custom_id: str
+    joined_at: datetime.datetime
+
+
+class RealmDiff(typing.NamedTuple):
+    joined: list[OnlineSession]
+    left: list[OnlineSession]
+    online: int
+
+    @property
+    def stayed(self) -> int:
+        return self.online - len(self.joined)
+
+
+class _RealmState:
+    __slots__ = ("joined_ats", "session_ids", "xuids")
+
+    # xuids is always sorted, and session_ids holds the 16 byte uuid for
+    # the xuid at the same index (so index * 16 to index * 16 + 16)
+    # joined_ats is at the same index as the xuid
+    xuids: array[int]
+    session_ids: bytearray
+    joined_ats: array[int]
+
+    def __init__(
+        self, xuids: array[int], session_ids: bytearray, joined_ats: array[int]
+    ) -> None:
+        self.xuids = xuids
+        self.session_ids = session_ids
+        self.joined_ats = joined_ats
+
+    def index(self, xuid: int) -> int:
+        index = bisect_left(self.xuids, xuid)
+        if index < len(self.xuids) and self.xuids[index] == xuid:
+            return index
+        return -1
+
+    def session_id(self, index: int) -> str:
+        start = index * _UUID_SIZE
+        return str(uuid.UUID(bytes=bytes(self.session_ids[start : start + _UUID_SIZE])))
+
+    def session(self, index: int, xuid: str) -> OnlineSession:
+        return OnlineSession(
+            xuid, self.session_id(index), _from_micros(self.joined_ats[index])
+        )
+
+
+class OnlineState:
+    """
+    Keeps track of who is online on every Realm and the ID of their current session.
+
+    Replaces what used to be a dict of sets of XUIDs and a dict of "realm_id-xuid"
+    strings to UUID strings - at thousands of Realms, those were a lot of strings
+    to keep around and hash every minute.
+    """
+
+    __slots__ = ("_interned", "_interned_reverse", "_realms")
+
+    def __init__(self) -> None:
+        self._realms: dict[int, _RealmState] = {}
+        self._interned: dict[str, int] = {}
+        self._interned_reverse: list[str] = []
+
+    def _to_int(self, xuid: str) -> int:
+        if xuid.isascii() and xuid.isdecimal() and xuid[0] != "0" and len(xuid) < 19:
+            return int(xuid)
+
+        if (interned := self._interned.get(xuid)) is None:
+            interned = _INTERNED_START + len(self._interned_reverse)
+            self._interned[xuid] = interned
+            self._interned_reverse.append(xuid)
+        return interned
+
+    def _to_str(self, xuid: int) -> str:
+        if xuid >= _INTERNED_START:
+            return self._interned_reverse[xuid - _INTERNED_START]
+        return str(xuid)
+
+    def __contains__(self, realm_id: int) -> bool:
+        return realm_id in self._realms
+
+    def realm_ids(self) -> list[int]:
+        return list(self._realms)
+
+    def count(self, realm_id: int) -> int:
+        state = self._realms.get(realm_id)
+        return len(state.xuids) if state else 0
+
+    def is_online(self, realm_id: int, xuid: str) -> bool:
+        state = self._realms.get(realm_id)
+        return bool(state) and state.index(self._to_int(xuid)) != -1  # type: ignore
+
+    def session_id(self, realm_id: int, xuid: str) -> str | None:
+        state = self._realms.get(realm_id)
+        if not state:
+            return None
+
+        index = state.index(self._to_int(xuid))
+        return state.session_id(index) if index != -1 else None
+
+    def sessions(self, realm_id: int) -> list[OnlineSession]:
+        state = self._realms.get(realm_id)
+        if not state:
+            return []
+
+        return [
+            state.session(index, self._to_str(xuid))
+            for index, xuid in enumerate(state.xuids)
+        ]
+
+    def xuids(self, realm_id: int) -> list[str]:
+        state = self._realms.get(realm_id)
+        return [self._to_str(xuid) for xuid in state.xuids] if state else []
+
+    def add(
+        self,
+        realm_id: int,
+        xuid: str,
+        custom_id: str | None = None,
+        joined_at: datetime.datetime | None = None,
+    ) -> str:
+        """
+        Marks a player as online, returning the ID of their session.
+        If they're already online, their existing session ID is kept.
+        joined_at should be what the session has in the database, if it's there.
+        """
+        state = self._realms.get(realm_id)
+        if state is None:
+            state = self._realms[realm_id] = _RealmState(
+                array("Q"), bytearray(), array("q")
+            )
+
+        int_xuid = self._to_int(xuid)
+        index = bisect_left(state.xuids, int_xuid)
+
+        if index < len(state.xuids) and state.xuids[index] == int_xuid:
+            return state.session_id(index)
+
+        session_bytes = uuid.UUID(custom_id).bytes if custom_id else uuid.uuid4().bytes
+        state.xuids.insert(index, int_xuid)
+        state.session_ids[index * _UUID_SIZE : index * _UUID_SIZE] = session_bytes
+        state.joined_ats.insert(
+            index, _to_micros(joined_at or datetime.datetime.now(tz=datetime.UTC))
+        )
+        return str(uuid.UUID(bytes=session_bytes))
+
+    def discard(self, realm_id: int, xuid: str) -> str | None:
+        """Marks a player as offline, returning the ID of the session they had."""
+        state = self._realms.get(realm_id)
+        if not state:
+            return None
+
+        index = state.index(self._to_int(xuid))
+        if index == -1:
+            return None
+
+        session_id = state.session_id(index)
+        del state.xuids[index]
+        del state.session_ids[index * _UUID_SIZE : (index + 1) * _UUID_SIZE]
+        del state.joined_ats[index]
+        return session_id
+
+    def pop_realm(self, realm_id: int) -> list[OnlineSession] | None:
+        """Forgets about a Realm entirely, returning who was online on it."""
+        if realm_id not in self._realms:
+            return None
+
+        sessions = self.sessions(realm_id)
+        del self._realms[realm_id]
+        return sessions
+
+    def update(
+        self, realm_id: int, xuids: typing.Iterable[str], now: datetime.datetime
+    ) -> RealmDiff:
+        """
+        Replaces who is online on a Realm with the given XUIDs, returning who
+        joined and who left.
+
+        Joining players get a new session ID that joined now, players who stayed
+        keep theirs.
+        The Realm is kept around even if no one is online, which is how
+        missing Realms are detected.
+        """
+        new_xuids = sorted(self._to_int(xuid) for xuid in xuids)
+
+        state = self._realms.get(realm_id)
+        old_xuids = state.xuids if state else array("Q")
+        old_session_ids = state.session_ids if state else bytearray()
+        old_joined_ats = state.joined_ats if state else array("q")
+        now_micros = _to_micros(now)
+
+        merged_xuids = array("Q")
+        merged_session_ids = bytearray()
+        merged_joined_ats = array("q")
+        joined: list[OnlineSession] = []
+        left: list[OnlineSession] = []
+
+        # both lists are sorted, so a single walk through both of them
+        # gives us the joins, leaves, and stays
+        old_index = 0
+        new_index = 0
+        old_len = len(old_xuids)
+        new_len = len(new_xuids)
+
+        while old_index < old_len or new_index < new_len:
+            if (
+                new_index < new_len
+                and merged_xuids
+                and new_xuids[new_index] == merged_xuids[-1]
+            ):
+                # duplicate xuid in the input, skip it
+                new_index += 1
+                continue
+
+            if new_index >= new_len or (
+                old_index < old_len and old_xuids[old_index] < new_xuids[new_index]
+            ):
+                start = old_index * _UUID_SIZE
+                left.append(
+                    OnlineSession(
+                        self._to_str(old_xuids[old_index]),
+                        str(
+                            uuid.UUID(
+                                bytes=bytes(old_session_ids[start : start + _UUID_SIZE])
+                            )
+                        ),
+                        _from_micros(old_joined_ats[old_index]),
+                    )
+                )
+                old_index += 1
+            elif old_index >= old_len or new_xuids[new_index] < old_xuids[old_index]:
+                session_id = uuid.uuid4()
+                merged_xuids.append(new_xuids[new_index])
+                merged_session_ids += session_id.bytes
+                merged_joined_ats.append(now_micros)
+                joined.append(
+                    OnlineSession(
+                        self._to_str(new_xuids[new_index]), str(session_id), now
+                    )
+                )
+                new_index += 1
+            else:
+                start = old_index * _UUID_SIZE
+                merged_xuids.append(new_xuids[new_index])
+                merged_session_ids += old_session_ids[start : start + _UUID_SIZE]
+                merged_joined_ats.append(old_joined_ats[old_index])
+                old_index += 1
+                new_index += 1
+
+        self._realms[realm_id] = _RealmState(
+            merged_xuids, merged_session_ids, merged_joined_ats
+        )
+        return RealmDiff(joined, left, len(merged_xuids))
@@ -0,0 +1,128 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import typing
+
+import common.metrics as metrics
+
+if typing.TYPE_CHECKING:
+    from prisma import Prisma
+
+__all__ = (
+    "COLD_TTL",
+    "MAX_AGE",
+    "ProfileEntry",
+    "fetch_gamertags",
+    "fetch_xuid",
+    "upsert_profiles",
+)
+
+# every gamertag the bot finds out about is also kept in "realmplayerprofile", which
+# sits behind valkey (and the in-memory cache in front of that) as a cold tier
+# valkey only keeps gamertags for a week and can lose everything on a restart -
+# without this, every gamertag would need to be fetched from xbox live again
+# afterwards, and the bot would be stuck behind ratelimits for hours
+# gamertags only very rarely change, so slightly old ones are fine to use
+
+# profiles older than this aren't trusted anymore and are fetched again
+MAX_AGE = datetime.timedelta(days=30)
+# how long gamertags found in the database are put back into valkey for
+# this is short on purpose - the refresher will get the ones that are still being
+# used properly before it runs out
+COLD_TTL = int(datetime.timedelta(days=1).total_seconds())
+
+# the device is only known sometimes, so the last one known is kept around
+_UPSERT = """
+INSERT INTO "realmplayerprofile" ("xuid", "gamertag", "updated_at", "last_device")
+SELECT "xuid", "gamertag", now(), "last_device"
+FROM unnest($1::text[], $2::text[], $3::text[]) AS "staging"(
+    "xuid", "gamertag", "last_device"
+)
+ON CONFLICT ("xuid") DO UPDATE SET
+    "gamertag" = EXCLUDED."gamertag",
+    "updated_at" = EXCLUDED."updated_at",
+    "last_device" = coalesce(EXCLUDED."last_device", "realmplayerprofile"."last_device")
+"""
+_FETCH_GAMERTAGS = """
+SELECT "xuid", "gamertag" FROM "realmplayerprofile"
+WHERE "xuid" = ANY($1::text[]) AND "updated_at" >= $2::timestamptz
+"""
+# gamertags can be given back out after someone changes theirs, so the newest
+# profile wins. this uses the index on lower("gamertag")
+_FETCH_XUID = """
+SELECT "xuid", "gamertag" FROM "realmplayerprofile"
+WHERE lower("gamertag") = lower($1) AND "updated_at" >= $2::timestamptz
+ORDER BY "updated_at" DESC
+LIMIT 1
+"""
+
+
+class ProfileEntry(typing.NamedTuple):
+    gamertag: str
+    device: str | None = None
+
+
+def _oldest_allowed() -> datetime.datetime:
+    return datetime.datetime.now(tz=datetime.UTC) - MAX_AGE
+
+
+async def upsert_profiles(
+    db: "Prisma", profiles: typing.Mapping[str, ProfileEntry]
+) -> int:
+    if not profiles:
+        return 0
+
+    xuids = list(profiles.keys())
+    return await db.execute_raw(
+        _UPSERT,
+        xuids,
+        [profiles[xuid].gamertag for xuid in xuids],
+        [profiles[xuid].device for xuid in xuids],
+    )
+
+
+async def fetch_gamertags(
+    db: "Prisma", xuids: typing.Collection[str]
+) -> dict[str, str]:
+    """
+    Fetches the gamertags of whichever of the given xuids have a recent enough
+    profile, all in one query.
+    """
+    if not xuids:
+        return {}
+
+    rows = await db.query_raw(_FETCH_GAMERTAGS, list(xuids), _oldest_allowed())
+    found = {row["xuid"]: row["gamertag"] for row in rows}
+
+    metrics.counter("gamertags.profiles.hit").inc(len(found))
+    metrics.counter("gamertags.profiles.miss").inc(len(xuids) - len(found))
+    return found
+
+
+async def fetch_xuid(db: "Prisma", gamertag: str) -> tuple[str, str] | None:
+    """
+    Fetches the xuid of the given gamertag, ignoring case. The gamertag is returned
+    too, since its case may be different from what was given.
+    """
+    rows = await db.query_raw(_FETCH_XUID, gamertag, _oldest_allowed())
+
+    if rows:
+        metrics.counter("gamertags.profiles.hit").inc()
+        return rows[0]["xuid"], rows[0]["gamertag"]
+
+    metrics.counter("gamertags.profiles.miss").inc()
+    return None
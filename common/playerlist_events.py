@@ -37,6 +37,9 @@ def define[C]() -> typing.Callable[[C], C]:
 @define()
 class PlayerlistParseFinish(ipy.events.BaseEvent):
     containers: tuple[pl_utils.RealmPlayersContainer, ...] = attrs.field(repr=False)
+    # realms whose still-online players only need last_seen bumped to timestamp
+    online_realm_ids: tuple[str, ...] = attrs.field(repr=False, factory=tuple)
+    timestamp: datetime | None = attrs.field(repr=False, default=None)
 
 
 @define()
@@ -44,9 +47,7 @@ class PlayerlistEvent(ipy.events.BaseEvent):
     realm_id: str = attrs.field(repr=False)
 
     async def configs(self) -> list[models.GuildConfig]:
-        return await models.GuildConfig.prisma().find_many(
-            where={"realm_id": self.realm_id}
-        )
+        return await models.GuildConfig.get_for_realm(self.realm_id)
 
 
 @define()
@@ -62,6 +63,11 @@ class LivePlayerlistSend(PlayerlistEvent):
     timestamp: datetime = attrs.field(repr=False)
     realm_down_event: bool = attrs.field(repr=False, default=False, kw_only=True)
 
+    async def live_configs(
+        self, guild_ids: typing.Iterable[int]
+    ) -> list[models.GuildConfig]:
+        return await models.GuildConfig.get_many(guild_ids)
+
 
 @define()
 class LiveOnlineUpdate(LivePlayerlistSend):
@@ -84,6 +90,8 @@ class PlayerWatchlistMatch(PlayerlistEvent):
     guild_ids: set[int] = attrs.field(repr=False)
 
     async def configs(self) -> list[models.GuildConfig]:
-        return await models.GuildConfig.prisma().find_many(
-            where={"realm_id": self.realm_id, "guild_id": {"in": list(self.guild_ids)}}
-        )
+        return [
+            config
+            for config in await models.GuildConfig.get_many(self.guild_ids)
+            if config.realm_id == self.realm_id
+        ]
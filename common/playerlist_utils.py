@@ -17,6 +17,7 @@ Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 import asyncio
 import contextlib
 import logging
+import os
 import typing
 from collections import defaultdict
 
@@ -28,7 +29,10 @@ import orjson
 from msgspec import ValidationError
 from valkey.asyncio.client import Pipeline
 
+import common.metrics as metrics
 import common.models as models
+import common.player_profiles as player_profiles
+import common.ratelimits as ratelimits
 import common.utils as utils
 
 logger = logging.getLogger("realms_bot")
@@ -62,6 +66,18 @@ class GamertagOnCooldown(Exception):
         super().__init__("The gamertag handler is on cooldown.")
 
 
+# how many xuids peoplehub is asked about at once
+AMOUNT_TO_GET = 500
+# how long openxbl is used for when peoplehub is ratelimited, in seconds
+BACKUP_TIMEOUT = 15
+
+
+def fetch_fanout() -> int:
+    # how many chunks of xuids are fetched from peoplehub at once
+    # the ratelimits still apply on top of this
+    return int(os.environ.get("GAMERTAG_FETCH_FANOUT", "4"))
+
+
 class GamertagInfo(typing.NamedTuple):
     gamertag: str
     device: str | None = None
@@ -75,28 +91,29 @@ class GamertagHandler:
     """
 
     bot: utils.RealmBotBase = attrs.field()
-    sem: asyncio.Semaphore = attrs.field()
     xuids_to_get: tuple[str, ...] = attrs.field()
     openxbl_session: aiohttp.ClientSession = attrs.field()
     gather_devices_for: set[str] = attrs.field(kw_only=True, factory=set)
-
-    index: int = attrs.field(init=False, default=0)
-    responses: list[elytra.ProfileResponse | elytra.PeopleHubResponse] = attrs.field(
-        init=False, factory=list
+    priority: ratelimits.Priority = attrs.field(
+        kw_only=True, default=ratelimits.Priority.INTERACTIVE
     )
-    AMOUNT_TO_GET: int = attrs.field(init=False, default=500)
+    fanout: int = attrs.field(kw_only=True, factory=fetch_fanout)
+
+    AMOUNT_TO_GET: int = attrs.field(init=False, default=AMOUNT_TO_GET)
 
     def __attrs_post_init__(self) -> None:
         # filter out empty strings, because that's possible somehow?
         self.xuids_to_get = tuple(x for x in self.xuids_to_get if x)
 
-    async def get_gamertags(self, xuid_list: list[str]) -> None:
+    async def get_gamertags(self, xuid_list: list[str]) -> elytra.PeopleHubResponse:
         # this endpoint is absolutely op and should rarely fail
         # franky, we usually don't need the backup thing, but you can't go wrong
         # having it
 
+        await self.bot.ratelimits.acquire("peoplehub", self.priority)
+
         try:
-            people = await self.bot.xbox.fetch_people_batch(
+            return await self.bot.xbox.fetch_people_batch(
                 xuid_list, dont_handle_ratelimit=True
             )
 
@@ -107,6 +124,7 @@ class GamertagHandler:
                 description: str = people_json["description"]
 
                 if description.startswith("Throttled"):  # ratelimited
+                    self.bot.ratelimits.observe_throttle("peoplehub", people_json)
                     raise GamertagOnCooldown() from e
 
                 # otherwise, invalid xuid
@@ -117,30 +135,37 @@ class GamertagHandler:
                 return await self.get_gamertags(xuid_list)
 
             if people_json.get("limitType"):  # ratelimit
+                self.bot.ratelimits.observe_throttle("peoplehub", people_json)
                 raise GamertagOnCooldown() from e
 
             else:
                 raise
 
-        self.responses.append(people)
-        self.index += self.AMOUNT_TO_GET
-
-    async def backup_get_gamertags(self) -> None:
+    async def backup_get_gamertags(
+        self,
+        xuid_list: list[str],
+        responses: list[elytra.ProfileResponse | elytra.PeopleHubResponse],
+    ) -> None:
         # openxbl is used throughout this, and its basically a way of navigating
         # the xbox live api in a more sane way than its actually laid out
         # while xbox-webapi-python can also do this without using a 3rd party service,
         # using openxbl can be more reliable at times as it has a generous 500 requests
         # per hour limit on the free tier and is not subject to ratelimits
         # however, there's no bulk xuid > gamertag option, and is a bit slow in general
+        # responses are added as they come in so that a timeout doesn't lose them
+
+        for xuid in xuid_list:
+            await self.bot.ratelimits.acquire("openxbl", self.priority)
 
-        for xuid in self.xuids_to_get[self.index :]:
             async with self.openxbl_session.get(
                 f"https://xbl.io/api/v2/account/{xuid}"
             ) as r:
+                self.bot.ratelimits.observe_headers("openxbl", r.headers, r.status)
+
                 try:
                     r.raise_for_status()
 
-                    self.responses.append(await elytra.ProfileResponse.from_response(r))
+                    responses.append(await elytra.ProfileResponse.from_response(r))
                 except (
                     aiohttp.ContentTypeError,
                     aiohttp.ClientResponseError,
@@ -156,11 +181,8 @@ class GamertagHandler:
                         text,
                     )
 
-            self.index += 1
-
     def _handle_new_gamertag(
         self,
-        pipe: Pipeline,
         xuid: str,
         gamertag: str,
         dict_gamertags: dict[str, GamertagInfo],
@@ -171,14 +193,6 @@ class GamertagHandler:
             return dict_gamertags
 
         dict_gamertags[xuid] = GamertagInfo(gamertag, device)
-
-        pipe.setex(
-            name=f"rpl-xuid-{xuid}", time=utils.EXPIRE_GAMERTAGS_AT, value=gamertag
-        )
-        pipe.setex(
-            name=f"rpl-gt-{gamertag}", time=utils.EXPIRE_GAMERTAGS_AT, value=xuid
-        )
-
         return dict_gamertags
 
     async def _execute_pipeline(self, pipe: Pipeline) -> None:
@@ -187,69 +201,99 @@ class GamertagHandler:
         finally:
             await pipe.reset()
 
-    async def run(self) -> dict[str, GamertagInfo]:
-        while self.index < len(self.xuids_to_get):
-            current_xuid_list = list(
-                self.xuids_to_get[self.index : self.index + self.AMOUNT_TO_GET]
-            )
+    async def _fetch_chunk(
+        self, xuid_list: list[str]
+    ) -> list[elytra.ProfileResponse | elytra.PeopleHubResponse]:
+        retried = False
 
-            async with self.sem:
-                try:
-                    await self.get_gamertags(current_xuid_list)
-                except (
-                    GamertagOnCooldown,
-                    ValidationError,
-                    elytra.MicrosoftAPIException,
+        while True:
+            try:
+                return [await self.get_gamertags(list(xuid_list))]
+            except GamertagOnCooldown:
+                # if peoplehub is going to be back soon, waiting for it is a lot
+                # quicker than going through openxbl one xuid at a time
+                if (
+                    not retried
+                    and self.bot.ratelimits.bucket("peoplehub").estimated_wait()
+                    <= BACKUP_TIMEOUT
                 ):
-                    # hopefully fixes itself in 15 seconds
-                    with contextlib.suppress(asyncio.TimeoutError):
-                        await asyncio.wait_for(self.backup_get_gamertags(), timeout=15)
+                    retried = True
+                    continue
+                break
+            except (ValidationError, elytra.MicrosoftAPIException):
+                break
+
+        responses: list[elytra.ProfileResponse | elytra.PeopleHubResponse] = []
 
+        # hopefully fixes itself in 15 seconds
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                self.backup_get_gamertags(xuid_list, responses),
+                timeout=BACKUP_TIMEOUT,
+            )
+
+        return responses
+
+    def _parse_responses(
+        self, responses: list[elytra.ProfileResponse | elytra.PeopleHubResponse]
+    ) -> dict[str, GamertagInfo]:
         dict_gamertags: dict[str, GamertagInfo] = {}
-        pipe = self.bot.valkey.pipeline()
 
-        try:
-            for response in self.responses:
-                if isinstance(response, elytra.PeopleHubResponse):
-                    for user in response.people:
-                        device = None
-                        if (
-                            user.xuid in self.gather_devices_for
-                            and user.presence_details
-                        ) and (
-                            a_match := next(
-                                (
-                                    p
-                                    for p in user.presence_details
-                                    if (p.is_primary or p.state == "Active")
-                                ),
-                                None,
-                            )
-                        ):
-                            device = a_match.device
-
-                        dict_gamertags = self._handle_new_gamertag(
-                            pipe,
-                            user.xuid,
-                            user.gamertag,
-                            dict_gamertags,
-                            device=device,
+        for response in responses:
+            if isinstance(response, elytra.PeopleHubResponse):
+                for user in response.people:
+                    device = None
+                    if (
+                        user.xuid in self.gather_devices_for and user.presence_details
+                    ) and (
+                        a_match := next(
+                            (
+                                p
+                                for p in user.presence_details
+                                if (p.is_primary or p.state == "Active")
+                            ),
+                            None,
                         )
-                else:
-                    for user in response.profile_users:
-                        xuid = user.id
-                        try:
-                            # really funny but efficient way of getting gamertag
-                            # from this data
-                            gamertag = next(
-                                s.value for s in user.settings if s.id == "Gamertag"
-                            )
-                        except (KeyError, StopIteration):
-                            continue
-
-                        dict_gamertags = self._handle_new_gamertag(
-                            pipe, xuid, gamertag, dict_gamertags
+                    ):
+                        device = a_match.device
+
+                    dict_gamertags = self._handle_new_gamertag(
+                        user.xuid,
+                        user.gamertag,
+                        dict_gamertags,
+                        device=device,
+                    )
+            else:
+                for user in response.profile_users:
+                    xuid = user.id
+                    try:
+                        # really funny but efficient way of getting gamertag
+                        # from this data
+                        gamertag = next(
+                            s.value for s in user.settings if s.id == "Gamertag"
                         )
+                    except (KeyError, StopIteration):
+                        continue
+
+                    dict_gamertags = self._handle_new_gamertag(
+                        xuid, gamertag, dict_gamertags
+                    )
+
+        return dict_gamertags
+
+    async def _store(self, dict_gamertags: dict[str, GamertagInfo]) -> None:
+        if not dict_gamertags:
+            return
+
+        pipe = self.bot.valkey.pipeline()
+
+        try:
+            # everything from one chunk goes out in one pipeline
+            self.bot.gamertag_cache.queue_store(
+                pipe,
+                {xuid: info.gamertag for xuid, info in dict_gamertags.items()},
+                utils.EXPIRE_GAMERTAGS_AT,
+            )
 
             # send data to pipeline in background
             self.bot.create_task(self._execute_pipeline(pipe))
@@ -257,8 +301,100 @@ class GamertagHandler:
             await pipe.reset()
             raise
 
+        if utils.FEATURE("PLAYER_PROFILES"):
+            self.bot.create_task(
+                _store_profiles(
+                    self.bot,
+                    {
+                        xuid: player_profiles.ProfileEntry(info.gamertag, info.device)
+                        for xuid, info in dict_gamertags.items()
+                    },
+                )
+            )
+
+    async def _run_chunk(
+        self, xuid_list: list[str], sem: asyncio.Semaphore
+    ) -> dict[str, GamertagInfo]:
+        async with sem:
+            with metrics.timing("gamertags.handler.chunk").time():
+                dict_gamertags = self._parse_responses(
+                    await self._fetch_chunk(xuid_list)
+                )
+
+        await self._store(dict_gamertags)
         return dict_gamertags
 
+    async def stream(self) -> typing.AsyncGenerator[dict[str, GamertagInfo], None]:
+        """
+        Fetches the gamertags in chunks of AMOUNT_TO_GET, with up to `fanout` chunks
+        being fetched at once, and yields the gamertags of each chunk as soon as
+        it's done.
+        """
+        chunks = [
+            list(self.xuids_to_get[index : index + self.AMOUNT_TO_GET])
+            for index in range(0, len(self.xuids_to_get), self.AMOUNT_TO_GET)
+        ]
+        if not chunks:
+            return
+
+        sem = asyncio.Semaphore(max(self.fanout, 1))
+        tasks = [asyncio.create_task(self._run_chunk(chunk, sem)) for chunk in chunks]
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # only does anything if something went wrong or we were stopped early
+            for task in tasks:
+                task.cancel()
+
+    async def run(self) -> dict[str, GamertagInfo]:
+        dict_gamertags: dict[str, GamertagInfo] = {}
+        async for chunk_gamertags in self.stream():
+            dict_gamertags.update(chunk_gamertags)
+        return dict_gamertags
+
+
+async def _store_profiles(
+    bot: utils.RealmBotBase, profiles: dict[str, player_profiles.ProfileEntry]
+) -> None:
+    try:
+        await player_profiles.upsert_profiles(bot.db, profiles)
+    except Exception:
+        # not being able to store these isn't the end of the world, they're in
+        # valkey anyways
+        logger.exception("Failed to store %s player profiles.", len(profiles))
+
+
+async def get_known_gamertags(
+    bot: utils.RealmBotBase, xuids: typing.Collection[str]
+) -> dict[str, str | None]:
+    """
+    Gets the gamertag of every given xuid that the bot already knows about, or None
+    for the ones it doesn't. This goes through the gamertag cache and valkey, then
+    the player profiles stored in the database - anything past that has to be
+    fetched from Xbox Live.
+    """
+    gamertags = await bot.gamertag_cache.get_gamertags(bot.valkey, xuids)
+
+    if not utils.FEATURE("PLAYER_PROFILES"):
+        return gamertags
+
+    missing = [xuid for xuid, gamertag in gamertags.items() if not gamertag]
+    if not missing:
+        return gamertags
+
+    found = await player_profiles.fetch_gamertags(bot.db, missing)
+    if found:
+        gamertags.update(found)
+
+        # put them back into valkey so that we don't need to go here next time
+        async with bot.valkey.pipeline() as pipe:
+            bot.gamertag_cache.queue_store(pipe, found, player_profiles.COLD_TTL)
+            await pipe.execute()
+
+    return gamertags
+
 
 async def has_linked_realm(ctx: utils.RealmContext) -> bool:
     config = await ctx.fetch_config()
@@ -285,10 +421,7 @@ async def has_autorunning_playerlist_channel(ctx: utils.RealmContext) -> bool:
     return True
 
 
-async def invalidate_premium(
-    bot: utils.RealmBotBase,
-    config: models.GuildConfig,
-) -> None:
+async def invalidate_premium(config: models.GuildConfig) -> None:
     if config.valid_premium:
         config.premium_code = None
     config.live_playerlist = False
@@ -296,15 +429,9 @@ async def invalidate_premium(
     config.live_online_channel = None
     config.reoccurring_leaderboard = None
 
+    # saving updates the realm index too
     await config.save()
 
-    if config.realm_id:
-        bot.live_playerlist_store[config.realm_id].discard(config.guild_id)
-        if not await models.GuildConfig.prisma().count(
-            where={"realm_id": config.realm_id, "fetch_devices": True}
-        ):
-            bot.fetch_devices_for.discard(config.realm_id)
-
 
 async def eventually_invalidate(
     bot: utils.RealmBotBase,
@@ -341,9 +468,7 @@ async def eventually_invalidate(
         # playerlist channel info
         old_playerlist_chan = config.playerlist_chan
         config.playerlist_chan = None
-        old_live_playerlist = config.live_playerlist
         config.live_playerlist = False
-        old_watchlist = config.player_watchlist
         config.player_watchlist = []
         config.player_watchlist_role = None
         config.notification_channels = {}
@@ -354,15 +479,6 @@ async def eventually_invalidate(
             f"invalid-playerlist7-{config.guild_id}",
         )
 
-        if config.realm_id and old_watchlist:
-            for player_xuid in old_watchlist:
-                bot.player_watchlist_store[f"{config.realm_id}-{player_xuid}"].discard(
-                    config.guild_id
-                )
-
-        if config.realm_id and old_live_playerlist:
-            bot.live_playerlist_store[config.realm_id].discard(config.guild_id)
-
         if old_playerlist_chan:
             with contextlib.suppress(ipy.errors.HTTPException, AttributeError):
                 chan = utils.partial_channel(bot, old_playerlist_chan)
@@ -402,18 +518,11 @@ async def eventually_invalidate_watchlist(
             num_times,
         )
 
-        old_watchlist = config.player_watchlist
         config.player_watchlist = []
         config.player_watchlist_role = None
         old_chan = config.notification_channels.pop("player_watchlist", None)
         await config.save()
 
-        if config.realm_id and old_watchlist:
-            for player_xuid in old_watchlist:
-                bot.player_watchlist_store[f"{config.realm_id}-{player_xuid}"].discard(
-                    config.guild_id
-                )
-
         if old_chan:
             with contextlib.suppress(ipy.errors.HTTPException, AttributeError):
                 chan = utils.partial_channel(bot, old_chan)
@@ -524,6 +633,8 @@ async def eventually_invalidate_live_online(
     await bot.valkey.expire(f"invalid-liveonline-{config.guild_id}", 86400)
 
     if num_times >= 3:
+        if config.live_online_channel:
+            bot.live_online.discard(config.live_online_channel)
         config.live_online_channel = None
         await config.save()
         await bot.valkey.delete(f"invalid-liveonline-{config.guild_id}")
@@ -536,6 +647,7 @@ async def fill_in_gamertags_for_sessions(
     bypass_cache: bool = False,
     bypass_cache_for: set[str] | None = None,
     gamertag_map: defaultdict[str, str] | dict[str, str] | None = None,
+    priority: ratelimits.Priority = ratelimits.Priority.INTERACTIVE,
 ) -> list[models.PlayerSession]:
     session_dict = {session.xuid: session for session in player_sessions}
     unresolved: list[str] = []
@@ -554,14 +666,9 @@ async def fill_in_gamertags_for_sessions(
                     session_dict[xuid].gamertag = gamertag
                     session_dict_copy.pop(xuid, None)
 
-        async with bot.valkey.pipeline() as pipeline:
-            for session in session_dict_copy.values():
-                pipeline.get(f"rpl-xuid-{session.xuid}")
-
-            gamertag_list: list[str | None] = await pipeline.execute()
+        cached_gamertags = await get_known_gamertags(bot, session_dict_copy.keys())
 
-        for index, xuid in enumerate(session_dict_copy.keys()):
-            gamertag = gamertag_list[index]
+        for xuid, gamertag in cached_gamertags.items():
             session_dict[xuid].gamertag = gamertag
 
             if not gamertag:
@@ -571,14 +678,11 @@ async def fill_in_gamertags_for_sessions(
         bypass_cache_for = set(unresolved)
 
     if unresolved:
-        gamertag_handler = GamertagHandler(
-            bot,
-            bot.pl_sem,
-            tuple(unresolved),
-            bot.openxbl_session,
-            gather_devices_for=bypass_cache_for or set(),
+        gamertag_dict = await bot.gamertag_resolver.resolve(
+            unresolved,
+            gather_devices_for=bypass_cache_for or frozenset(),
+            priority=priority,
         )
-        gamertag_dict = await gamertag_handler.run()
 
         for xuid, gamertag_info in gamertag_dict.items():
             if not session_dict[xuid].gamertag:
@@ -591,19 +695,17 @@ async def fill_in_gamertags_for_sessions(
 async def get_xuid_to_gamertag_map(
     bot: utils.RealmBotBase,
     xuid_list: list[str],
+    *,
+    priority: ratelimits.Priority = ratelimits.Priority.INTERACTIVE,
 ) -> defaultdict[str, str]:
     gamertag_map: defaultdict[str, str] = defaultdict(lambda: "")
 
     unresolved: list[str] = []
 
-    async with bot.valkey.pipeline() as pipeline:
-        for xuid in xuid_list:
-            pipeline.get(f"rpl-xuid-{xuid}")
-
-        gamertag_list: list[str | None] = await pipeline.execute()
+    cached_gamertags = await get_known_gamertags(bot, xuid_list)
 
-    for index, xuid in enumerate(xuid_list):
-        gamertag = gamertag_list[index]
+    for xuid in xuid_list:
+        gamertag = cached_gamertags[xuid]
 
         if not gamertag:
             unresolved.append(xuid)
@@ -612,13 +714,9 @@ async def get_xuid_to_gamertag_map(
         gamertag_map[xuid] = gamertag
 
     if unresolved:
-        gamertag_handler = GamertagHandler(
-            bot,
-            bot.pl_sem,
-            tuple(unresolved),
-            bot.openxbl_session,
+        gamertag_dict = await bot.gamertag_resolver.resolve(
+            unresolved, priority=priority
         )
-        gamertag_dict = await gamertag_handler.run()
 
         for xuid, gamertag_info in gamertag_dict.items():
             gamertag_map[xuid] = gamertag_info.gamertag
@@ -627,7 +725,7 @@ async def get_xuid_to_gamertag_map(
 
 
 async def gamertag_from_xuid(bot: utils.RealmBotBase, xuid: str | int) -> str:
-    if gamertag := await bot.valkey.get(f"rpl-xuid-{xuid}"):
+    if gamertag := (await get_known_gamertags(bot, (str(xuid),)))[str(xuid)]:
         return gamertag
 
     maybe_gamertag: elytra.ProfileResponse | None = None
@@ -638,12 +736,17 @@ async def gamertag_from_xuid(bot: utils.RealmBotBase, xuid: str | int) -> str:
         ValidationError,
         elytra.MicrosoftAPIException,
     ):
+        await bot.ratelimits.acquire("profile")
         maybe_gamertag = await bot.xbox.fetch_profile_by_xuid(xuid)
 
     if not maybe_gamertag:
+        await bot.ratelimits.acquire("openxbl")
+
         async with bot.openxbl_session.get(
             f"https://xbl.io/api/v2/account/{xuid}"
         ) as r:
+            bot.ratelimits.observe_headers("openxbl", r.headers, r.status)
+
             try:
                 r.raise_for_status()
                 maybe_gamertag = await elytra.ProfileResponse.from_response(r)
@@ -669,23 +772,32 @@ async def gamertag_from_xuid(bot: utils.RealmBotBase, xuid: str | int) -> str:
     )
 
     async with bot.valkey.pipeline() as pipe:
-        pipe.setex(
-            name=f"rpl-xuid-{xuid}",
-            time=utils.EXPIRE_GAMERTAGS_AT,
-            value=gamertag,
-        )
-        pipe.setex(
-            name=f"rpl-gt-{gamertag}",
-            time=utils.EXPIRE_GAMERTAGS_AT,
-            value=str(xuid),
+        bot.gamertag_cache.queue_store(
+            pipe, {str(xuid): gamertag}, utils.EXPIRE_GAMERTAGS_AT
         )
         await pipe.execute()
 
+    if utils.FEATURE("PLAYER_PROFILES"):
+        await _store_profiles(bot, {str(xuid): player_profiles.ProfileEntry(gamertag)})
+
     return gamertag
 
 
 async def xuid_from_gamertag(bot: utils.RealmBotBase, gamertag: str) -> str:
-    if xuid := await bot.valkey.get(f"rpl-gt-{gamertag}"):
+    if xuid := await bot.gamertag_cache.get_xuid(bot.valkey, gamertag):
+        return xuid
+
+    if utils.FEATURE("PLAYER_PROFILES") and (
+        profile := await player_profiles.fetch_xuid(bot.db, gamertag)
+    ):
+        xuid, found_gamertag = profile
+
+        async with bot.valkey.pipeline() as pipe:
+            bot.gamertag_cache.queue_store(
+                pipe, {xuid: found_gamertag}, player_profiles.COLD_TTL
+            )
+            await pipe.execute()
+
         return xuid
 
     maybe_xuid: elytra.ProfileResponse | None = None
@@ -696,14 +808,19 @@ async def xuid_from_gamertag(bot: utils.RealmBotBase, gamertag: str) -> str:
         ValidationError,
         elytra.MicrosoftAPIException,
     ):
+        await bot.ratelimits.acquire("profile")
         maybe_xuid = await bot.xbox.fetch_profile_by_gamertag(gamertag)
 
     if not maybe_xuid:
         with contextlib.suppress(asyncio.TimeoutError):
+            await bot.ratelimits.acquire("openxbl")
+
             async with bot.openxbl_session.get(
                 f"https://xbl.io/api/v2/search/{gamertag}",
                 timeout=aiohttp.ClientTimeout(total=2.5),
             ) as r:
+                bot.ratelimits.observe_headers("openxbl", r.headers, r.status)
+
                 with contextlib.suppress(ValidationError, aiohttp.ContentTypeError):
                     maybe_xuid = await elytra.ProfileResponse.from_response(r)
 
@@ -713,16 +830,12 @@ async def xuid_from_gamertag(bot: utils.RealmBotBase, gamertag: str) -> str:
     xuid = maybe_xuid.profile_users[0].id
 
     async with bot.valkey.pipeline() as pipe:
-        pipe.setex(
-            name=f"rpl-xuid-{xuid}",
-            time=utils.EXPIRE_GAMERTAGS_AT,
-            value=gamertag,
-        )
-        pipe.setex(
-            name=f"rpl-gt-{gamertag}",
-            time=utils.EXPIRE_GAMERTAGS_AT,
-            value=str(xuid),
+        bot.gamertag_cache.queue_store(
+            pipe, {str(xuid): gamertag}, utils.EXPIRE_GAMERTAGS_AT
         )
         await pipe.execute()
 
+    if utils.FEATURE("PLAYER_PROFILES"):
+        await _store_profiles(bot, {str(xuid): player_profiles.ProfileEntry(gamertag)})
+
     return xuid
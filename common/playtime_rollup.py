@@ -0,0 +1,236 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import typing
+
+from prisma import get_client
+
+if typing.TYPE_CHECKING:
+    from prisma import Prisma
+    from prisma.client import Batch
+
+__all__ = (
+    "HOURLY_RANGES",
+    "WEIGHTED_HOURLY_RANGES",
+    "HourlyPlaytime",
+    "fetch_hourly",
+    "prune_rollups",
+    "queue_rollup_sessions",
+    "rollup_recent",
+    "rollup_sessions",
+    "starting_hour",
+)
+
+# how many minutes every player has played in every hour, per realm, is kept in
+# "realmplayerhourlyplaytime" so that the stats commands don't have to go through
+# every single session
+# every session keeps track of how far it has been rolled up to in "rolled_up_to",
+# so each part of a session is only ever added once - the part from there
+# (or joined_at, if it's never been rolled up) to last_seen is what's left
+# as with everything else stats related, everything is floored to the minute
+_ROLLUP_BASE = """
+WITH "pending" AS (
+    SELECT "custom_id", "joined_at", "realm_id", "xuid",
+        date_trunc('minute', coalesce("rolled_up_to", "joined_at"), 'UTC') AS "start",
+        date_trunc('minute', "last_seen", 'UTC') AS "end"
+    FROM "realmplayersession"
+    WHERE "joined_at" IS NOT NULL
+        AND date_trunc('minute', "last_seen", 'UTC')
+            > date_trunc('minute', coalesce("rolled_up_to", "joined_at"), 'UTC')
+        AND {condition}
+    {lock}
+), "marked" AS (
+    UPDATE "realmplayersession" AS "session" SET "rolled_up_to" = "pending"."end"
+    FROM "pending" WHERE "session"."custom_id" = "pending"."custom_id"
+        AND "session"."joined_at" = "pending"."joined_at"
+)
+INSERT INTO "realmplayerhourlyplaytime" ("realm_id", "xuid", "hour", "minutes")
+SELECT "pending"."realm_id", "pending"."xuid", "hours"."hour",
+    sum(
+        extract(epoch FROM least("pending"."end", "hours"."hour" + interval '1 hour')
+        - greatest("pending"."start", "hours"."hour")) / 60
+    )::int
+FROM "pending"
+CROSS JOIN LATERAL generate_series(
+    date_trunc('hour', "pending"."start", 'UTC'),
+    "pending"."end" - interval '1 minute',
+    interval '1 hour'
+) AS "hours"("hour")
+GROUP BY 1, 2, 3
+ON CONFLICT ("realm_id", "xuid", "hour") DO UPDATE
+SET "minutes" = "realmplayerhourlyplaytime"."minutes" + EXCLUDED."minutes"
+"""
+
+# the rows are locked so that two rollups can't add the same part of a session
+# twice - the second one will see the updated rolled_up_to once the first is done
+# sessions are looked up by their whole primary key so only their partitions are read
+_ROLLUP_SESSIONS = _ROLLUP_BASE.format(
+    condition=(
+        '("custom_id", "joined_at") IN (SELECT * FROM'
+        " unnest($1::text[]::uuid[], $2::text[]::timestamptz[]))"
+    ),
+    lock="FOR UPDATE",
+)
+# the periodic rollup can just skip whatever's busy, it'll get it next time
+_ROLLUP_RECENT = _ROLLUP_BASE.format(
+    condition='"last_seen" >= $1::timestamptz', lock="FOR UPDATE SKIP LOCKED"
+)
+
+# the rollups are returned as ranges that start on the hour and last for however
+# many minutes were played, and whatever hasn't been rolled up yet (mostly the tail
+# end of players who are still online) is returned as-is, all in one query
+# $1 is the realm id, $2 the hour to start from, and $3 the xuids to filter by (or null)
+_HOURLY_RANGES_BASE = """
+SELECT "xuid", extract(epoch FROM "hour")::bigint AS "start",
+    extract(epoch FROM "hour")::bigint + "minutes" * 60 AS "end"
+FROM "realmplayerhourlyplaytime"
+WHERE "realm_id" = $1 AND "hour" >= {start}
+    AND ($3::text[] IS NULL OR "xuid" = ANY($3::text[]))
+UNION ALL
+SELECT "xuid",
+    floor(extract(epoch FROM
+        greatest(coalesce("rolled_up_to", "joined_at"), {start})
+    ))::bigint AS "start",
+    floor(extract(epoch FROM "last_seen"))::bigint AS "end"
+FROM "realmplayersession"
+WHERE "realm_id" = $1 AND "joined_at" IS NOT NULL AND "last_seen" >= {start}
+    AND (
+        "rolled_up_to" IS NULL
+        OR "rolled_up_to" < date_trunc('minute', "last_seen", 'UTC')
+    )
+    AND ($3::text[] IS NULL OR "xuid" = ANY($3::text[]))
+"""
+HOURLY_RANGES = _HOURLY_RANGES_BASE.format(start="$2::timestamptz")
+
+# the rollups can't tell which session any of their minutes came from, so they
+# also have the minutes of sessions that joined before the window started - which
+# the session based stats leave out
+# those sessions are just whoever was online at the time, so they're cheap to find,
+# and are returned with a weight of -1 so they can be taken back out - totalled up,
+# this comes out to exactly what going through every session would
+# same parameters as HOURLY_RANGES, except $2 is the exact start of the window
+_WINDOW_HOUR = "date_trunc('hour', $2::timestamptz, 'UTC')"
+_WEIGHTED_RANGES_BASE = """
+SELECT "xuid", "start", "end", 1 AS "weight"
+FROM ({ranges}) AS "ranges"
+UNION ALL
+SELECT "xuid",
+    floor(extract(epoch FROM greatest("joined_at", {start})))::bigint AS "start",
+    floor(extract(epoch FROM "last_seen"))::bigint AS "end",
+    -1 AS "weight"
+FROM "realmplayersession"
+WHERE "realm_id" = $1 AND "joined_at" < $2::timestamptz AND "last_seen" >= {start}
+    AND ($3::text[] IS NULL OR "xuid" = ANY($3::text[]))
+"""
+WEIGHTED_HOURLY_RANGES = _WEIGHTED_RANGES_BASE.format(
+    ranges=_HOURLY_RANGES_BASE.format(start=_WINDOW_HOUR), start=_WINDOW_HOUR
+)
+
+_PRUNE = 'DELETE FROM "realmplayerhourlyplaytime" WHERE "hour" < $1::timestamptz'
+
+
+class HourlyPlaytime(typing.NamedTuple):
+    xuid: str
+    start: datetime.datetime
+    end: datetime.datetime
+
+
+def _session_keys(
+    sessions: typing.Iterable[tuple[str, datetime.datetime]],
+) -> tuple[list[str], list[str]]:
+    custom_ids: list[str] = []
+    joined_ats: list[str] = []
+    for custom_id, joined_at in sessions:
+        custom_ids.append(custom_id)
+        joined_ats.append(joined_at.isoformat())
+    return custom_ids, joined_ats
+
+
+def queue_rollup_sessions(
+    batch: "Batch", sessions: typing.Sequence[tuple[str, datetime.datetime]]
+) -> None:
+    """Queues up rolling up the given (custom_id, joined_at) sessions."""
+    if not sessions:
+        return
+
+    batch.execute_raw(_ROLLUP_SESSIONS, *_session_keys(sessions))  # type: ignore
+
+
+async def rollup_sessions(
+    db: "Prisma", sessions: typing.Sequence[tuple[str, datetime.datetime]]
+) -> int:
+    """Rolls up the given (custom_id, joined_at) sessions."""
+    if not sessions:
+        return 0
+
+    return await db.execute_raw(_ROLLUP_SESSIONS, *_session_keys(sessions))
+
+
+async def rollup_recent(db: "Prisma", since: datetime.datetime) -> int:
+    """
+    Rolls up every session seen since the given time that has something left to
+    roll up - mostly players who are still online, but this also catches
+    sessions that were closed without being rolled up.
+    """
+    return await db.execute_raw(_ROLLUP_RECENT, since)
+
+
+async def prune_rollups(db: "Prisma", before: datetime.datetime) -> int:
+    return await db.execute_raw(_PRUNE, before)
+
+
+def starting_hour(min_datetime: datetime.datetime) -> datetime.datetime:
+    # the hour the minimum datetime is in counts too
+    return min_datetime.replace(minute=0, second=0, microsecond=0)
+
+
+async def fetch_hourly(
+    realm_id: str,
+    min_datetime: datetime.datetime,
+    *,
+    xuids: typing.Sequence[str] | None = None,
+    db: "Prisma | None" = None,
+) -> list[HourlyPlaytime]:
+    """
+    Fetches how much each player played on the Realm per hour since the given time,
+    optionally only for the given players.
+
+    Each entry is returned as a range that starts on the hour and lasts for
+    however many minutes were played, which means it can be bucketed just like
+    a session can. Anything that hasn't been rolled up yet is returned as-is.
+
+    This isn't quite what bucketing sessions gives: the whole hour the given time
+    is in is included, as is playtime from sessions that joined before it, and
+    sessions are split up at every hour - so short sessions crossing an hour
+    aren't counted twice like they are with sessions. See stats_utils for where
+    this is used.
+    """
+    db = db or get_client()
+    min_hour = starting_hour(min_datetime)
+
+    rows = await db.query_raw(
+        HOURLY_RANGES, realm_id, min_hour, list(xuids) if xuids is not None else None
+    )
+
+    return [
+        HourlyPlaytime(
+            row["xuid"],
+            datetime.datetime.fromtimestamp(row["start"], tz=datetime.UTC),
+            datetime.datetime.fromtimestamp(row["end"], tz=datetime.UTC),
+        )
+        for row in rows
+    ]
@@ -0,0 +1,258 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import enum
+import heapq
+import itertools
+import time
+import typing
+
+import common.metrics as metrics
+
+if typing.TYPE_CHECKING:
+    import httpx
+
+__all__ = ("DEFAULT_LIMITS", "Priority", "RateLimitScheduler", "TokenBucket")
+
+# every endpoint used to resolve gamertags gets a token bucket, and every request
+# to one has to wait for a token first
+# the limits start out as the defaults below, and are then adjusted to whatever
+# the endpoints themselves say - from ratelimit headers, Retry-After, and the
+# limits xbox live puts in its throttle responses
+# when there's a queue, live playerlists go first, then commands people are
+# waiting on, then the autorunners, then anything in the background
+# this lives on the bot and holds state, so it shouldn't be reloaded
+
+
+class Priority(enum.IntEnum):
+    LIVE = 0
+    INTERACTIVE = 1
+    AUTORUNNER = 2
+    # work nobody is waiting on, like refreshing gamertags ahead of time
+    BACKGROUND = 3
+
+
+# endpoint: (requests, per this many seconds)
+DEFAULT_LIMITS: dict[str, tuple[int, float]] = {
+    "peoplehub": (10, 15),
+    "profile": (10, 15),
+    # openxbl's free tier
+    "openxbl": (500, 3600),
+}
+
+_HOST_ENDPOINTS = {
+    "peoplehub.xboxlive.com": "peoplehub",
+    "profile.xboxlive.com": "profile",
+}
+
+
+class TokenBucket:
+    __slots__ = (
+        "_dispatcher",
+        "_sequence",
+        "_waiters",
+        "blocked_until",
+        "capacity",
+        "name",
+        "period",
+        "tokens",
+        "updated",
+    )
+
+    def __init__(self, name: str, capacity: int, period: float) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self.tokens: float = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: asyncio.Task[None] | None = None
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def estimated_wait(self) -> float:
+        """Roughly how long a new request would have to wait, in seconds."""
+        now = time.monotonic()
+        self._refill(now)
+
+        needed = len(self._waiters) + 1 - self.tokens
+        wait = max(needed, 0) / self.rate
+        return max(self.blocked_until - now, 0) + wait
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        start = time.monotonic()
+        self._refill(start)
+
+        if not self._waiters and start >= self.blocked_until and self.tokens >= 1:
+            self.tokens -= 1
+            metrics.timing(f"ratelimit.{self.name}.wait").observe(0)
+            return
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        metrics.gauge(f"ratelimit.{self.name}.queued").set(len(self._waiters))
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # the token may have been handed over right before this was
+            # cancelled - it'd go to waste otherwise
+            if future.done() and not future.cancelled():
+                self._refill(time.monotonic())
+                self.tokens = min(self.capacity, self.tokens + 1)
+            raise
+        finally:
+            waited = time.monotonic() - start
+            metrics.timing(f"ratelimit.{self.name}.wait").observe(waited)
+            metrics.timing(
+                f"ratelimit.{self.name}.wait.{priority.name.lower()}"
+            ).observe(waited)
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            if self._waiters[0][2].done():  # cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+
+            now = time.monotonic()
+            self._refill(now)
+
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+            elif self.tokens >= 1:
+                self.tokens -= 1
+                heapq.heappop(self._waiters)[2].set_result(None)
+            else:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+            metrics.gauge(f"ratelimit.{self.name}.queued").set(len(self._waiters))
+
+    def learn_limit(self, capacity: int, period: float) -> None:
+        if capacity <= 0 or period <= 0:
+            return
+
+        self._refill(time.monotonic())
+        self.capacity = capacity
+        self.period = period
+        self.tokens = min(self.tokens, capacity)
+        metrics.gauge(f"ratelimit.{self.name}.capacity").set(capacity)
+        metrics.gauge(f"ratelimit.{self.name}.period").set(period)
+
+    def block_for(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        metrics.counter(f"ratelimit.{self.name}.throttled").inc()
+
+    def set_remaining(self, remaining: int, reset_after: float | None) -> None:
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, remaining)
+
+        if remaining <= 0 and reset_after:
+            self.block_for(reset_after)
+
+
+def _float_header(headers: typing.Mapping[str, str], name: str) -> float | None:
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class RateLimitScheduler:
+    """
+    Hands out requests to the endpoints used to resolve gamertags, keeping each
+    under its ratelimit.
+    """
+
+    __slots__ = ("buckets",)
+
+    def __init__(
+        self, limits: typing.Mapping[str, tuple[int, float]] = DEFAULT_LIMITS
+    ) -> None:
+        self.buckets = {
+            name: TokenBucket(name, capacity, period)
+            for name, (capacity, period) in limits.items()
+        }
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        return self.buckets[endpoint]
+
+    async def acquire(
+        self, endpoint: str, priority: Priority = Priority.INTERACTIVE
+    ) -> None:
+        await self.buckets[endpoint].acquire(priority)
+
+    def observe_headers(
+        self, endpoint: str, headers: typing.Mapping[str, str], status: int
+    ) -> None:
+        bucket = self.buckets[endpoint]
+
+        limit = _float_header(headers, "X-RateLimit-Limit")
+        remaining = _float_header(headers, "X-RateLimit-Remaining")
+        reset = _float_header(headers, "X-RateLimit-Reset")
+
+        # reset is usually a unix timestamp, but some send seconds from now instead
+        if reset and reset > 1_000_000_000:
+            reset = max(reset - time.time(), 0)
+
+        if limit and int(limit) != bucket.capacity:
+            bucket.learn_limit(int(limit), bucket.period)
+        if remaining is not None:
+            bucket.set_remaining(int(remaining), reset)
+
+        if status == 429:
+            retry_after = _float_header(headers, "Retry-After")
+            bucket.block_for(retry_after or bucket.period / bucket.capacity)
+
+    def observe_throttle(
+        self, endpoint: str, body: typing.Mapping[str, typing.Any]
+    ) -> None:
+        """
+        Learns from an xbox live throttle response, which can say what the
+        actual limit is.
+        """
+        bucket = self.buckets[endpoint]
+
+        max_requests = body.get("maxRequests")
+        period = body.get("periodInSeconds")
+        if isinstance(max_requests, int) and isinstance(period, int | float):
+            bucket.learn_limit(max_requests, period)
+
+        if bucket.blocked_until <= time.monotonic():
+            bucket.block_for(bucket.period / bucket.capacity)
+
+    async def on_xbox_response(self, response: "httpx.Response") -> None:
+        # an httpx response hook for the xbox api's session
+        endpoint = _HOST_ENDPOINTS.get(response.url.host)
+        if endpoint is None:
+            return
+
+        self.observe_headers(endpoint, response.headers, response.status_code)
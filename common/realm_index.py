@@ -0,0 +1,221 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import typing
+
+if typing.TYPE_CHECKING:
+    from common.models import GuildConfig
+
+__all__ = ("INDEX", "GuildFlags", "RealmIndex")
+
+logger = logging.getLogger("realms_bot")
+
+
+class GuildFlags(typing.NamedTuple):
+    premium: bool
+    live_playerlist: bool
+    fetch_devices: bool
+    player_watchlist: frozenset[str]
+
+
+class RealmIndex:
+    """
+    Maps realm ids to the guilds linked to them, along with what each of those
+    guilds has turned on.
+    """
+
+    __slots__ = (
+        "_devices",
+        "_guild_realms",
+        "_live",
+        "_realms",
+        "_tasks",
+        "_watchlist",
+    )
+
+    def __init__(self) -> None:
+        # realm id: {guild id: flags}
+        self._realms: dict[str, dict[int, GuildFlags]] = {}
+        self._guild_realms: dict[int, str] = {}
+        # the lookups that happen on every playerlist tick get their own sets
+        self._live: dict[str, set[int]] = {}
+        self._devices: dict[str, set[int]] = {}
+        # "realm id-xuid": guild ids
+        self._watchlist: dict[str, set[int]] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._guild_realms)
+
+    @staticmethod
+    def _add_to(store: dict[str, set[int]], key: str, guild_id: int) -> None:
+        store.setdefault(key, set()).add(guild_id)
+
+    @staticmethod
+    def _remove_from(store: dict[str, set[int]], key: str, guild_id: int) -> None:
+        if (guild_ids := store.get(key)) is not None:
+            guild_ids.discard(guild_id)
+            if not guild_ids:
+                del store[key]
+
+    def remove(self, guild_id: int) -> None:
+        realm_id = self._guild_realms.pop(guild_id, None)
+        if realm_id is None:
+            return
+
+        flags = self._realms[realm_id].pop(guild_id)
+        if not self._realms[realm_id]:
+            del self._realms[realm_id]
+
+        self._remove_from(self._live, realm_id, guild_id)
+        self._remove_from(self._devices, realm_id, guild_id)
+        for xuid in flags.player_watchlist:
+            self._remove_from(self._watchlist, f"{realm_id}-{xuid}", guild_id)
+
+    def update(self, config: "GuildConfig") -> None:
+        guild_id = config.guild_id
+
+        if config.premium_code_id is None:
+            premium = False
+        elif config.premium_code is not None:
+            premium = config.valid_premium
+        else:
+            # the premium code wasn't loaded with the config, so we have to go with
+            # what we knew before
+            old_realm_id = self._guild_realms.get(guild_id)
+            premium = bool(
+                old_realm_id and self._realms[old_realm_id][guild_id].premium
+            )
+
+        self.remove(guild_id)
+
+        realm_id = config.realm_id
+        if not realm_id:
+            return
+
+        flags = GuildFlags(
+            premium=premium,
+            live_playerlist=bool(
+                premium and config.playerlist_chan and config.live_playerlist
+            ),
+            fetch_devices=bool(premium and config.fetch_devices),
+            player_watchlist=frozenset(config.player_watchlist or ()),
+        )
+
+        self._guild_realms[guild_id] = realm_id
+        self._realms.setdefault(realm_id, {})[guild_id] = flags
+
+        if flags.live_playerlist:
+            self._add_to(self._live, realm_id, guild_id)
+        if flags.fetch_devices:
+            self._add_to(self._devices, realm_id, guild_id)
+        for xuid in flags.player_watchlist:
+            self._add_to(self._watchlist, f"{realm_id}-{xuid}", guild_id)
+
+    def clear(self) -> None:
+        self._realms.clear()
+        self._guild_realms.clear()
+        self._live.clear()
+        self._devices.clear()
+        self._watchlist.clear()
+
+    def realm_of(self, guild_id: int) -> str | None:
+        return self._guild_realms.get(guild_id)
+
+    def guilds(self, realm_id: str) -> dict[int, GuildFlags]:
+        return dict(self._realms.get(realm_id, {}))
+
+    def guild_ids(self, realm_id: str) -> set[int]:
+        return set(self._realms.get(realm_id, ()))
+
+    def has_guilds(self, realm_id: str, *, excluding: int | None = None) -> bool:
+        guilds = self._realms.get(realm_id, {})
+        return any(guild_id != excluding for guild_id in guilds)
+
+    def live_playerlist_guilds(self, realm_id: str) -> set[int]:
+        return set(self._live.get(realm_id, ()))
+
+    def has_live_playerlist(self, realm_id: str) -> bool:
+        return realm_id in self._live
+
+    def fetches_devices(self, realm_id: str) -> bool:
+        return realm_id in self._devices
+
+    def watchlist_guilds(self, realm_id: str, xuid: str) -> set[int]:
+        return set(self._watchlist.get(f"{realm_id}-{xuid}", ()))
+
+    def discard_live_playerlist(self, realm_id: str, guild_id: int) -> None:
+        # for when a send finds out the config no longer wants it, but it hasn't
+        # been saved through here (say, it was changed by another process)
+        if flags := self._realms.get(realm_id, {}).get(guild_id):
+            self._realms[realm_id][guild_id] = flags._replace(live_playerlist=False)
+        self._remove_from(self._live, realm_id, guild_id)
+
+    async def rebuild(self) -> list["GuildConfig"]:
+        """
+        Rebuilds the index from scratch, returning every config it was built from.
+        """
+        from common.models import GuildConfig
+
+        configs = await GuildConfig.prisma().find_many(
+            where={"NOT": [{"realm_id": None}]}, include={"premium_code": True}
+        )
+
+        self.clear()
+        for config in configs:
+            self.update(config)
+        return configs
+
+    async def refresh(self, guild_id: int | None) -> None:
+        """
+        Reloads a guild's entry from the database, or everything if no guild is
+        given.
+        """
+        from common.models import GuildConfig
+
+        try:
+            if guild_id is None:
+                await self.rebuild()
+                return
+
+            config = await GuildConfig.prisma().find_unique(
+                where={"guild_id": guild_id}, include={"premium_code": True}
+            )
+        except Exception:
+            logger.exception("Failed to refresh the realm index for %s.", guild_id)
+            return
+
+        if config:
+            self.update(config)
+        else:
+            self.remove(guild_id)
+
+    def schedule_refresh(self, guild_id: int | None) -> None:
+        task = asyncio.get_running_loop().create_task(self.refresh(guild_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+# which guilds are linked to which realm, and what they have turned on, kept in
+# memory for every guild with a realm. this is what the playerlist uses to know
+# who wants live playerlists, devices, or watchlist pings for a realm, and what
+# commands use to know if anyone else is still using a realm
+# it's built at startup and updated every time a config is saved (or dropped), so
+# nothing here needs to go to the database
+# this is module-level since models needs it, so this module shouldn't be reloaded
+INDEX = RealmIndex()
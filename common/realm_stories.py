@@ -16,10 +16,13 @@ Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 
 import datetime
 import typing
+import uuid
 
 import elytra
 
 import common.models as models
+import common.playtime_rollup as playtime_rollup
+import common.stats_cache as stats_cache
 import common.utils as utils
 
 if typing.TYPE_CHECKING:
@@ -63,9 +66,21 @@ async def fill_in_data_from_stories(
 
             online = close_to_now <= end_floored
 
+            if online and bot.online_state.session_id(int(realm_id), xuid):
+                # they already have a session going, and since sessions are
+                # unique by their joined_at too now, a second one would be made
+                continue
+
+            # only online sessions need to be tracked by the online state
+            custom_id = (
+                bot.online_state.add(int(realm_id), xuid, joined_at=start_floored)
+                if online
+                else str(uuid.uuid4())
+            )
+
             player_list.append(
                 {
-                    "custom_id": bot.uuid_cache[f"{realm_id}-{xuid}"],
+                    "custom_id": custom_id,
                     "realm_id": realm_id,
                     "xuid": xuid,
                     "online": online,
@@ -74,11 +89,22 @@ async def fill_in_data_from_stories(
                 }
             )
 
-            if online:
-                bot.online_cache[int(realm_id)].add(xuid)
-
     if player_list:
         await models.PlayerSession.prisma().create_many(
             data=player_list, skip_duplicates=True
         )
+
+        if utils.FEATURE("PLAYTIME_ROLLUPS"):
+            # online sessions will get rolled up with the rest of them later
+            await playtime_rollup.rollup_sessions(
+                bot.db,
+                [
+                    (p["custom_id"], p["joined_at"])
+                    for p in player_list
+                    if not p["online"]
+                ],
+            )
+
+        if utils.FEATURE("STATS_CACHE"):
+            await stats_cache.invalidate(bot.valkey, [realm_id])
     return True
@@ -0,0 +1,301 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import typing
+import zlib
+
+import orjson
+
+import common.models as models
+import common.playerlist_events as pl_events
+import common.playerlist_utils as pl_utils
+from common.online_state import OnlineSession, OnlineState
+
+if typing.TYPE_CHECKING:
+    import elytra
+
+__all__ = (
+    "CLOSED_STREAM",
+    "CLOSED_STREAM_MAXLEN",
+    "DELTA_STREAM",
+    "FetchedTick",
+    "RealmDelta",
+    "RealmDiffer",
+    "TickDeltas",
+    "decode_closed",
+    "decode_tick",
+    "encode_closed",
+    "encode_tick",
+    "in_partition",
+    "merge_finish_events",
+    "stream_entries",
+)
+
+# the valkey stream pollers publish their deltas to
+DELTA_STREAM = "rpl-realm-deltas"
+
+# the valkey stream the bot publishes sessions it closed itself to, so the
+# pollers can forget about them too
+# closing stale sessions is rare, so this never needs to hold much
+CLOSED_STREAM = "rpl-closed-sessions"
+CLOSED_STREAM_MAXLEN = 1000
+
+
+class FetchedTick(typing.NamedTuple):
+    realms: "elytra.ActivityListResponse"
+    timestamp: datetime.datetime
+
+
+class RealmDelta(typing.NamedTuple):
+    realm_id: int
+    joined: list[OnlineSession]
+    left: list[OnlineSession]
+    online: int
+    # if the realm wasn't in the activity list at all this tick
+    missing: bool = False
+
+
+class TickDeltas(typing.NamedTuple):
+    timestamp: datetime.datetime
+    deltas: list[RealmDelta]
+    # every realm that was in the activity list, so that the bot
+    # can tell which offline realms came back
+    seen_realm_ids: list[int]
+    shard: int = 0
+    shard_count: int = 1
+
+
+def in_partition(realm_id: int, shard: int, shard_count: int) -> bool:
+    # crc32 rather than hash() since the latter isn't stable across processes
+    if shard_count <= 1:
+        return True
+    return zlib.crc32(str(realm_id).encode()) % shard_count == shard
+
+
+class RealmDiffer:
+    """
+    Diffs fetched Realm activities against who was online before, producing both
+    the sessions that need to be persisted and the per-Realm joins and leaves.
+
+    Only Realms in the given partition are looked at, which is what lets
+    multiple pollers split up the work.
+    """
+
+    __slots__ = ("online_state", "previous_now", "shard", "shard_count")
+
+    def __init__(
+        self,
+        online_state: OnlineState,
+        *,
+        shard: int = 0,
+        shard_count: int = 1,
+    ) -> None:
+        self.online_state = online_state
+        self.shard = shard
+        self.shard_count = shard_count
+        self.previous_now = datetime.datetime.now(tz=datetime.UTC)
+
+    def diff(
+        self,
+        realms: "elytra.ActivityListResponse",
+        now: datetime.datetime,
+        *,
+        diff_only: bool = True,
+    ) -> tuple[pl_events.PlayerlistParseFinish, TickDeltas]:
+        player_objs: list[models.PlayerSession] = []
+        joined_player_objs: list[models.PlayerSession] = []
+        online_realm_ids: list[str] = []
+        deltas: list[RealmDelta] = []
+        gotten_realm_ids: list[int] = []
+
+        for realm in realms.servers:
+            if not in_partition(realm.id, self.shard, self.shard_count):
+                continue
+
+            gotten_realm_ids.append(realm.id)
+
+            diff = self.online_state.update(
+                realm.id, (str(player.uuid) for player in realm.players), now
+            )
+
+            joined_player_objs.extend(
+                models.PlayerSession(
+                    custom_id=session.custom_id,
+                    realm_id=str(realm.id),
+                    xuid=session.xuid,
+                    online=True,
+                    last_seen=now,
+                    joined_at=now,
+                )
+                for session in diff.joined
+            )
+
+            if diff.stayed:
+                if diff_only:
+                    # players that stayed online only need their last_seen bumped,
+                    # which is done for the whole realm in one statement later
+                    online_realm_ids.append(str(realm.id))
+                else:
+                    joined = {session.xuid for session in diff.joined}
+                    player_objs.extend(
+                        models.PlayerSession(
+                            custom_id=session.custom_id,
+                            realm_id=str(realm.id),
+                            xuid=session.xuid,
+                            online=True,
+                            last_seen=now,
+                            joined_at=session.joined_at,
+                        )
+                        for session in self.online_state.sessions(realm.id)
+                        if session.xuid not in joined
+                    )
+
+            player_objs.extend(
+                models.PlayerSession(
+                    custom_id=session.custom_id,
+                    realm_id=str(realm.id),
+                    xuid=session.xuid,
+                    online=False,
+                    last_seen=self.previous_now,
+                    joined_at=session.joined_at,
+                )
+                for session in diff.left
+            )
+
+            if diff.joined or diff.left:
+                deltas.append(RealmDelta(realm.id, diff.joined, diff.left, diff.online))
+
+        seen = set(gotten_realm_ids)
+        for missed_realm_id in self.online_state.realm_ids():
+            if missed_realm_id in seen:
+                continue
+
+            now_invalid = self.online_state.pop_realm(missed_realm_id) or []
+            player_objs.extend(
+                models.PlayerSession(
+                    custom_id=session.custom_id,
+                    realm_id=str(missed_realm_id),
+                    xuid=session.xuid,
+                    online=False,
+                    last_seen=self.previous_now,
+                    joined_at=session.joined_at,
+                )
+                for session in now_invalid
+            )
+            deltas.append(RealmDelta(missed_realm_id, [], now_invalid, 0, True))
+
+        self.previous_now = now
+
+        finish_event = pl_events.PlayerlistParseFinish(
+            (
+                pl_utils.RealmPlayersContainer(player_sessions=player_objs),
+                pl_utils.RealmPlayersContainer(
+                    player_sessions=joined_player_objs, fields=("joined_at",)
+                ),
+            ),
+            tuple(online_realm_ids),
+            now,
+        )
+        return finish_event, TickDeltas(
+            now, deltas, gotten_realm_ids, self.shard, self.shard_count
+        )
+
+
+def merge_finish_events(
+    older: pl_events.PlayerlistParseFinish, newer: pl_events.PlayerlistParseFinish
+) -> pl_events.PlayerlistParseFinish:
+    """
+    Combines two ticks' worth of sessions to persist into one, for when the older
+    one couldn't be persisted.
+    """
+    # the newer tick's containers go last, so anything it changes wins out
+    # every realm is bumped to the newer timestamp - anyone who left since the
+    # older tick is marked offline before the bump happens, so it skips them
+    return pl_events.PlayerlistParseFinish(
+        (*older.containers, *newer.containers),
+        tuple(dict.fromkeys((*older.online_realm_ids, *newer.online_realm_ids))),
+        newer.timestamp or older.timestamp,
+    )
+
+
+def _decode_session(raw: list[str]) -> OnlineSession:
+    # orjson writes datetimes out as iso 8601 strings, down to the microsecond
+    xuid, custom_id, joined_at = raw
+    return OnlineSession(xuid, custom_id, datetime.datetime.fromisoformat(joined_at))
+
+
+def encode_tick(tick: TickDeltas) -> bytes:
+    return orjson.dumps(
+        {
+            "timestamp": tick.timestamp.timestamp(),
+            "shard": tick.shard,
+            "shard_count": tick.shard_count,
+            "seen": tick.seen_realm_ids,
+            "deltas": [
+                [
+                    delta.realm_id,
+                    [tuple(session) for session in delta.joined],
+                    [tuple(session) for session in delta.left],
+                    delta.online,
+                    delta.missing,
+                ]
+                for delta in tick.deltas
+            ],
+        }
+    )
+
+
+def decode_tick(data: str | bytes) -> TickDeltas:
+    raw = orjson.loads(data)
+    return TickDeltas(
+        datetime.datetime.fromtimestamp(raw["timestamp"], tz=datetime.UTC),
+        [
+            RealmDelta(
+                realm_id,
+                [_decode_session(session) for session in joined],
+                [_decode_session(session) for session in left],
+                online,
+                missing,
+            )
+            for realm_id, joined, left, online, missing in raw["deltas"]
+        ],
+        raw["seen"],
+        raw["shard"],
+        raw["shard_count"],
+    )
+
+
+def encode_closed(sessions: typing.Iterable[tuple[int, str]]) -> bytes:
+    return orjson.dumps([[realm_id, xuid] for realm_id, xuid in sessions])
+
+
+def decode_closed(data: str | bytes) -> list[tuple[int, str]]:
+    return [(realm_id, xuid) for realm_id, xuid in orjson.loads(data)]
+
+
+def stream_entries(
+    response: typing.Any,
+) -> list[tuple[str, dict[str, str]]]:
+    # resp2 and resp3 give back xread responses in slightly different shapes
+    if isinstance(response, dict):
+        return [
+            entry
+            for streams in response.values()
+            for entries in streams
+            for entry in entries
+        ]
+    return [entry for _, entries in response or () for entry in entries]
@@ -0,0 +1,160 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import typing
+
+import common.models as models
+import common.playtime_rollup as playtime_rollup
+
+if typing.TYPE_CHECKING:
+    from prisma import Prisma
+    from prisma.client import Batch
+
+    from common.playerlist_events import PlayerlistParseFinish
+    from common.playerlist_utils import RealmPlayersContainer
+
+__all__ = (
+    "bulk_upsert_sessions",
+    "persist_tick",
+    "queue_bulk_upsert",
+    "queue_last_seen_bump",
+    "upsert_statement",
+)
+
+# the order here matters - it's the order of the unnest arrays
+SESSION_COLUMNS = ("custom_id", "realm_id", "xuid", "online", "last_seen", "joined_at")
+
+# prisma's query engine has no way of doing COPY, so instead, we send every column
+# as one array parameter and have postgres unnest them into rows - it's one
+# statement and one round trip no matter how many sessions there are
+# this is used even for sessions that should already exist, like players leaving -
+# if the write that made one got lost, this makes it again instead of updating
+# nothing. joined_at is part of the primary key (the table is partitioned on it),
+# so postgres only ever has to look in the one partition each session goes in
+_UPSERT_BASE = (
+    'INSERT INTO "realmplayersession"'
+    ' ("custom_id", "realm_id", "xuid", "online", "last_seen", "joined_at")'
+    ' SELECT "custom_id"::uuid, "realm_id", "xuid", "online",'
+    ' "last_seen"::timestamptz, "joined_at"::timestamptz'
+    " FROM unnest($1::text[], $2::text[], $3::text[], $4::boolean[], $5::text[],"
+    ' $6::text[]) AS staging("custom_id", "realm_id", "xuid", "online",'
+    ' "last_seen", "joined_at")'
+    ' ON CONFLICT ("custom_id", "joined_at") DO UPDATE SET '
+)
+_LAST_SEEN_BUMP = (
+    'UPDATE "realmplayersession" SET "last_seen" = $1::timestamptz'
+    ' WHERE "online" = true AND "realm_id" = ANY($2::text[])'
+)
+
+
+def _validate_fields(fields: tuple[str, ...]) -> None:
+    for field in fields:
+        if field not in SESSION_COLUMNS or field == "custom_id":
+            raise ValueError(f"Cannot update session column {field}.")
+
+
+def _update_clause(fields: tuple[str, ...]) -> str:
+    _validate_fields(fields)
+    return ", ".join(f'"{field}" = EXCLUDED."{field}"' for field in fields)
+
+
+def _dedupe(
+    sessions: typing.Iterable[models.PlayerSession],
+) -> list[models.PlayerSession]:
+    # postgres refuses to update the same row twice in one statement,
+    # so make sure every custom id only appears once (last one wins)
+    return list({session.custom_id: session for session in sessions}.values())
+
+
+def upsert_statement(
+    container: "RealmPlayersContainer",
+) -> tuple[str, list[list[typing.Any]]]:
+    """
+    Returns the statement to upsert every session in the container, only updating
+    the container's fields for sessions that already exist.
+    """
+    custom_ids: list[str] = []
+    realm_ids: list[str] = []
+    xuids: list[str] = []
+    online: list[bool] = []
+    last_seens: list[str] = []
+    joined_ats: list[str] = []
+
+    for session in _dedupe(container.player_sessions):
+        # without its joined_at, there's no knowing which session this is
+        # every session the bot persists has one, this is just to be safe
+        if session.joined_at is None:
+            continue
+
+        custom_ids.append(session.custom_id)
+        realm_ids.append(session.realm_id)
+        xuids.append(session.xuid)
+        online.append(session.online)
+        last_seens.append(session.last_seen.isoformat())
+        joined_ats.append(session.joined_at.isoformat())
+
+    query = _UPSERT_BASE + _update_clause(container.fields)
+    return query, [custom_ids, realm_ids, xuids, online, last_seens, joined_ats]
+
+
+def queue_bulk_upsert(batch: "Batch", container: "RealmPlayersContainer") -> None:
+    if not container.player_sessions:
+        return
+
+    query, args = upsert_statement(container)
+    batch.execute_raw(query, *args)  # type: ignore
+
+
+async def bulk_upsert_sessions(
+    db: "Prisma", containers: typing.Iterable["RealmPlayersContainer"]
+) -> None:
+    async with db.batch_() as batch:
+        for container in containers:
+            queue_bulk_upsert(batch, container)
+
+
+def queue_last_seen_bump(
+    batch: "Batch", realm_ids: typing.Sequence[str], timestamp: datetime.datetime
+) -> None:
+    if not realm_ids:
+        return
+
+    batch.execute_raw(_LAST_SEEN_BUMP, timestamp, list(realm_ids))
+
+
+async def persist_tick(
+    db: "Prisma", event: "PlayerlistParseFinish", *, rollup: bool = True
+) -> None:
+    async with db.batch_() as batch:
+        for container in event.containers:
+            queue_bulk_upsert(batch, container)
+
+        if event.timestamp:
+            queue_last_seen_bump(batch, event.online_realm_ids, event.timestamp)
+
+        if rollup:
+            # sessions that just closed can be rolled up right away - the ones
+            # still going are handled periodically
+            playtime_rollup.queue_rollup_sessions(
+                batch,
+                [
+                    (session.custom_id, session.joined_at)
+                    for container in event.containers
+                    for session in container.player_sessions
+                    if not session.online and session.joined_at
+                ],
+            )
@@ -0,0 +1,181 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import logging
+import re
+import typing
+
+import common.metrics as metrics
+import common.session_retention as session_retention
+
+if typing.TYPE_CHECKING:
+    from prisma import Prisma
+
+__all__ = (
+    "PARTITIONS_AHEAD",
+    "PARTITION_LENGTH",
+    "drop_expired_partitions",
+    "ensure_partitions",
+    "partition_name",
+    "week_start",
+)
+
+logger = logging.getLogger("realms_bot")
+
+# "realmplayersession" is range partitioned by week on "joined_at" (see the
+# session_partitions migration)
+# last_seen would be the more natural thing to partition on for retention, but
+# it gets bumped every minute for everyone online, and moving rows between
+# partitions on every bump would be way worse than the deletes this replaces
+# sessions don't last anywhere near as long as the retention period, so a
+# partition whose newest possible joined_at is past the cutoff is almost always
+# entirely made up of expired sessions, and can be dropped in one go
+
+PARTITION_LENGTH = datetime.timedelta(days=7)
+PARTITIONS_AHEAD = 4
+
+_TABLE = "realmplayersession"
+
+_LIST_PARTITIONS = """
+SELECT "child"."relname" AS "name"
+FROM pg_inherits
+JOIN pg_class AS "parent" ON "pg_inherits"."inhparent" = "parent"."oid"
+JOIN pg_class AS "child" ON "pg_inherits"."inhrelid" = "child"."oid"
+WHERE "parent"."relname" = $1
+"""
+# postgres won't make a partition if the default partition has rows that belong in
+# it, which happens if the bot was down for longer than PARTITIONS_AHEAD weeks
+# so the partition is made on its own, those rows are moved into it, and then it's
+# attached - all in one statement, with the default partition locked so nothing
+# new can land in it halfway through
+_CREATE_PARTITION = """
+DO $$
+BEGIN
+    LOCK TABLE "realmplayersession_default" IN ACCESS EXCLUSIVE MODE;
+    CREATE TABLE "{name}" (LIKE "realmplayersession" INCLUDING DEFAULTS);
+    WITH "moved" AS (
+        DELETE FROM "realmplayersession_default"
+        WHERE "joined_at" >= '{start}' AND "joined_at" < '{end}'
+        RETURNING *
+    )
+    INSERT INTO "{name}" SELECT * FROM "moved";
+    ALTER TABLE "realmplayersession" ATTACH PARTITION "{name}"
+        FOR VALUES FROM ('{start}') TO ('{end}');
+END $$
+"""
+_STILL_IN_USE = (
+    'SELECT EXISTS(SELECT 1 FROM "{name}" WHERE "online"'
+    ' OR "last_seen" >= $1::timestamptz) AS "in_use"'
+)
+_DETACH_PARTITION = 'ALTER TABLE "{table}" DETACH PARTITION "{name}"'
+_DROP_PARTITION = 'DROP TABLE "{name}"'
+
+
+def week_start(dt: datetime.datetime) -> datetime.datetime:
+    # partitions start on mondays at midnight utc, same as date_trunc('week')
+    dt = dt.astimezone(datetime.UTC)
+    return datetime.datetime.combine(
+        dt.date() - datetime.timedelta(days=dt.weekday()),
+        datetime.time(),
+        tzinfo=datetime.UTC,
+    )
+
+
+def partition_name(start: datetime.datetime, *, table: str = _TABLE) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def _partition_start(name: str, table: str) -> datetime.datetime | None:
+    if not (match := re.fullmatch(rf"{re.escape(table)}_p(\d{{8}})", name)):
+        return None
+    return datetime.datetime.strptime(match[1], "%Y%m%d").replace(tzinfo=datetime.UTC)
+
+
+async def _partition_names(db: "Prisma", table: str) -> list[str]:
+    return [row["name"] for row in await db.query_raw(_LIST_PARTITIONS, table)]
+
+
+async def ensure_partitions(
+    db: "Prisma", now: datetime.datetime, *, ahead: int = PARTITIONS_AHEAD
+) -> list[str]:
+    """
+    Makes sure there's a partition for the current week and the given amount of
+    weeks after it, returning the names of any partitions that were created.
+
+    Sessions that don't fit in any partition land in the default one, which works
+    but can't be dropped wholesale - so this should be run well before they're needed.
+    Any that are there already are moved into the new partition.
+    """
+    existing = set(await _partition_names(db, _TABLE))
+    created: list[str] = []
+
+    start = week_start(now)
+    for _ in range(ahead + 1):
+        name = partition_name(start)
+        if name not in existing:
+            try:
+                await db.execute_raw(
+                    _CREATE_PARTITION.format(
+                        name=name,
+                        start=start.isoformat(),
+                        end=(start + PARTITION_LENGTH).isoformat(),
+                    )
+                )
+                created.append(name)
+            except Exception:
+                # the weeks after it can still be made
+                metrics.counter("sessions.partitions.failed").inc()
+                logger.exception("Failed to create session partition %s.", name)
+        start += PARTITION_LENGTH
+
+    metrics.counter("sessions.partitions.created").inc(len(created))
+    return created
+
+
+async def drop_expired_partitions(
+    db: "Prisma", cutoff: datetime.datetime, *, table: str = _TABLE
+) -> int:
+    """
+    Gets rid of every offline session last seen before the cutoff.
+
+    Partitions that can only contain sessions that joined before the cutoff are
+    detached and dropped as a whole if nothing in them is still in use - otherwise,
+    they're cleaned up chunk by chunk instead, just like the default partition.
+    The table can be swapped out for a stand-in partitioned the same way.
+    Returns how many partitions were dropped.
+    """
+    dropped = 0
+
+    for name in await _partition_names(db, table):
+        start = _partition_start(name, table)
+
+        if start is not None and start + PARTITION_LENGTH <= cutoff:
+            rows = await db.query_raw(_STILL_IN_USE.format(name=name), cutoff)
+            if not rows[0]["in_use"]:
+                await db.execute_raw(_DETACH_PARTITION.format(table=table, name=name))
+                await db.execute_raw(_DROP_PARTITION.format(name=name))
+                dropped += 1
+                continue
+
+        if start is None or start < cutoff:
+            # partitions that start after the cutoff can't have anything expired
+            # in them, since last_seen can't be before joined_at
+            # the rest (and the default partition) are cleaned up the old way
+            await session_retention.delete_expired(db, cutoff, table=name)
+
+    metrics.counter("sessions.partitions.dropped").inc(dropped)
+    return dropped
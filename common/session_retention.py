@@ -0,0 +1,178 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import time
+import typing
+import uuid
+
+import common.metrics as metrics
+
+if typing.TYPE_CHECKING:
+    from prisma import Prisma
+
+__all__ = (
+    "StaleSession",
+    "batch_size",
+    "batch_sleep",
+    "close_stale_sessions",
+    "delete_expired",
+)
+
+logger = logging.getLogger("realms_bot")
+
+# both of these work through the sessions they touch a chunk at a time, so that
+# no one statement holds its locks for long or builds up a giant result
+# every chunk picks up after the last one by (last_seen, custom_id) - both so
+# that rows already handled don't need to be stepped over again, and so that
+# dead index entries left behind by earlier chunks aren't either
+# the players whose sessions get closed are handed back a chunk at a time too,
+# instead of all being loaded at once beforehand
+
+_MIN_UUID = str(uuid.UUID(int=0))
+
+_DELETE_CHUNK = """
+WITH "chunk" AS (
+    SELECT "custom_id", "joined_at" FROM "{table}"
+    WHERE NOT "online" AND "last_seen" < $1::timestamptz
+        AND ("last_seen", "custom_id") > ($2::timestamptz, $3::uuid)
+    ORDER BY "last_seen", "custom_id"
+    LIMIT $4
+)
+DELETE FROM "{table}" AS "session" USING "chunk"
+WHERE "session"."custom_id" = "chunk"."custom_id"
+    AND "session"."joined_at" = "chunk"."joined_at"
+RETURNING "session"."last_seen", "session"."custom_id"::text
+"""
+_CLOSE_CHUNK = """
+WITH "chunk" AS (
+    SELECT "custom_id", "joined_at" FROM "realmplayersession"
+    WHERE "online" AND "last_seen" < $1::timestamptz
+        AND ("last_seen", "custom_id") > ($2::timestamptz, $3::uuid)
+    ORDER BY "last_seen", "custom_id"
+    LIMIT $4
+)
+UPDATE "realmplayersession" AS "session" SET "online" = false FROM "chunk"
+WHERE "session"."custom_id" = "chunk"."custom_id"
+    AND "session"."joined_at" = "chunk"."joined_at"
+RETURNING "session"."last_seen", "session"."custom_id"::text,
+    "session"."realm_id", "session"."xuid"
+"""
+
+
+class StaleSession(typing.NamedTuple):
+    realm_id: str
+    xuid: str
+
+
+def batch_size() -> int:
+    return int(os.environ.get("RETENTION_BATCH_SIZE", "5000"))
+
+
+def batch_sleep() -> float:
+    return float(os.environ.get("RETENTION_BATCH_SLEEP", "0.5"))
+
+
+def _last_key(rows: list[dict[str, typing.Any]]) -> tuple[datetime.datetime, str]:
+    return max(
+        (datetime.datetime.fromisoformat(row["last_seen"]), row["custom_id"])
+        for row in rows
+    )
+
+
+async def _chunks(
+    db: "Prisma",
+    query: str,
+    cutoff: datetime.datetime,
+    *,
+    name: str,
+    size: int | None,
+    sleep: float | None,
+) -> typing.AsyncGenerator[list[dict[str, typing.Any]], None]:
+    size = size or batch_size()
+    sleep = batch_sleep() if sleep is None else sleep
+
+    last_key: tuple[datetime.datetime, str] = (
+        datetime.datetime.min.replace(tzinfo=datetime.UTC),
+        _MIN_UUID,
+    )
+    chunk_timing = metrics.timing(f"sessions.retention.{name}.chunk")
+    processed = metrics.counter(f"sessions.retention.{name}.rows")
+    last_chunk = metrics.gauge(f"sessions.retention.{name}.last_chunk_rows")
+
+    while True:
+        start = time.perf_counter()
+        rows = await db.query_raw(query, cutoff, *last_key, size)
+        chunk_timing.observe(time.perf_counter() - start)
+
+        processed.inc(len(rows))
+        last_chunk.set(len(rows))
+        logger.debug("Retention %s chunk processed %s rows.", name, len(rows))
+
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+
+        last_key = _last_key(rows)
+        await asyncio.sleep(sleep)
+
+
+async def delete_expired(
+    db: "Prisma",
+    cutoff: datetime.datetime,
+    *,
+    table: str = "realmplayersession",
+    size: int | None = None,
+    sleep: float | None = None,
+) -> int:
+    """
+    Deletes every offline session in the table (or one of its partitions) last
+    seen before the cutoff, RETENTION_BATCH_SIZE sessions at a time.
+    Returns how many sessions were deleted.
+    """
+    deleted = 0
+    async for rows in _chunks(
+        db,
+        _DELETE_CHUNK.format(table=table),
+        cutoff,
+        name="delete",
+        size=size,
+        sleep=sleep,
+    ):
+        deleted += len(rows)
+    return deleted
+
+
+async def close_stale_sessions(
+    db: "Prisma",
+    before: datetime.datetime,
+    *,
+    size: int | None = None,
+    sleep: float | None = None,
+) -> typing.AsyncGenerator[list[StaleSession], None]:
+    """
+    Marks every online session last seen before the given time as offline,
+    RETENTION_BATCH_SIZE sessions at a time, yielding each chunk's players as
+    it goes.
+    """
+    async for rows in _chunks(
+        db, _CLOSE_CHUNK, before, name="close", size=size, sleep=sleep
+    ):
+        yield [StaleSession(row["realm_id"], row["xuid"]) for row in rows]
@@ -0,0 +1,146 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+import typing
+
+import orjson
+
+import common.metrics as metrics
+
+if typing.TYPE_CHECKING:
+    import valkey.asyncio as aiovalkey
+    from valkey.asyncio.client import Pipeline
+
+    from common.playerlist_events import PlayerlistParseFinish
+
+__all__ = (
+    "changed_realm_ids",
+    "fetch",
+    "invalidate",
+    "invalidate_tick",
+    "queue_invalidate",
+    "store",
+)
+
+# caches the results of the stats commands, as several guilds can share the same
+# realm and people love running the same command over and over
+# every entry is keyed by the realm's "generation", which gets bumped whenever
+# sessions for the realm change - when players join or leave, or a realm story
+# is imported. old entries are never read again after that and just expire
+# entries are also keyed by the minute the command was run in by the callers,
+# since the playtime of anyone still online changes every minute anyways
+
+# how long entries last for, in seconds
+CACHE_TTL = 120
+# how many entries can exist at once - the oldest are evicted first
+MAX_ENTRIES = 5_000
+# entries bigger than this (in bytes) aren't worth caching
+MAX_ENTRY_SIZE = 256 * 1024
+
+_INDEX_KEY = "rpl-stats-cache-index"
+
+
+def _generation_key(realm_id: str) -> str:
+    return f"rpl-stats-gen-{realm_id}"
+
+
+async def _entry_key(
+    valkey: "aiovalkey.Valkey", realm_id: str, parts: typing.Iterable[typing.Any]
+) -> str:
+    generation = await valkey.get(_generation_key(realm_id)) or "0"
+    joined_parts = "-".join(str(p) for p in parts)
+    return f"rpl-stats-cache-{realm_id}-{generation}-{joined_parts}"
+
+
+async def fetch(
+    valkey: "aiovalkey.Valkey", realm_id: str, *parts: typing.Any
+) -> tuple[str, typing.Any | None]:
+    """
+    Fetches a cached result for the realm.
+    Returns the key the result is under (to pass to store on a miss) and the
+    result itself, or None if there wasn't one.
+    """
+    key = await _entry_key(valkey, realm_id, parts)
+
+    if (raw := await valkey.get(key)) is None:
+        metrics.counter("stats.cache.miss").inc()
+        return key, None
+
+    metrics.counter("stats.cache.hit").inc()
+    return key, orjson.loads(raw)
+
+
+async def store(valkey: "aiovalkey.Valkey", key: str, value: typing.Any) -> None:
+    raw = orjson.dumps(value)
+    if len(raw) > MAX_ENTRY_SIZE:
+        metrics.counter("stats.cache.too_big").inc()
+        return
+
+    now = time.time()
+
+    async with valkey.pipeline() as pipe:
+        pipe.set(key, raw, ex=CACHE_TTL)
+        pipe.zadd(_INDEX_KEY, {key: now})
+        # entries that have expired by themselves don't need to be kept track of
+        pipe.zremrangebyscore(_INDEX_KEY, "-inf", now - CACHE_TTL)
+        pipe.zcard(_INDEX_KEY)
+        *_, size = await pipe.execute()
+
+    if size > MAX_ENTRIES:
+        evicted = await valkey.zpopmin(_INDEX_KEY, size - MAX_ENTRIES)
+        if evicted:
+            await valkey.delete(*(k for k, _ in evicted))
+            metrics.counter("stats.cache.evicted").inc(len(evicted))
+
+
+def queue_invalidate(pipe: "Pipeline", realm_ids: typing.Iterable[str]) -> None:
+    realm_ids = set(realm_ids)
+
+    for realm_id in realm_ids:
+        pipe.incr(_generation_key(realm_id))
+        # a generation only needs to outlive the entries made with it
+        pipe.expire(_generation_key(realm_id), CACHE_TTL * 10)
+
+    metrics.counter("stats.cache.invalidated").inc(len(realm_ids))
+
+
+async def invalidate(
+    valkey: "aiovalkey.Valkey", realm_ids: typing.Iterable[str]
+) -> None:
+    realm_ids = set(realm_ids)
+    if not realm_ids:
+        return
+
+    async with valkey.pipeline(transaction=False) as pipe:
+        queue_invalidate(pipe, realm_ids)
+        await pipe.execute()
+
+
+def changed_realm_ids(event: "PlayerlistParseFinish") -> set[str]:
+    # realms that only had players stay online aren't in here with diff-only
+    # persistence, which is fine - the minute in the keys takes care of them
+    return {
+        session.realm_id
+        for container in event.containers
+        for session in container.player_sessions
+    }
+
+
+async def invalidate_tick(
+    valkey: "aiovalkey.Valkey", event: "PlayerlistParseFinish"
+) -> None:
+    await invalidate(valkey, changed_realm_ids(event))
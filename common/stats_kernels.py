@@ -0,0 +1,214 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# the number crunching behind the stats commands
+# this only works with numpy arrays of epoch timestamps (already floored to the
+# minute) and plain ints, and purposely only imports numpy, so that everything
+# sent to and from the worker processes stays cheap to pickle
+# see common/compute_pool.py
+
+import numpy as np
+import numpy.typing as npt
+
+__all__ = (
+    "folded_minutes",
+    "grouped_folded_minutes",
+    "grouped_minutes_per_bucket",
+    "grouped_seconds_per_bucket",
+    "leaderboard",
+    "minutes_per_bucket",
+    "seconds_per_bucket",
+)
+
+type EpochArray = npt.NDArray[np.int64]
+type CodeArray = npt.NDArray[np.int32]
+
+
+def _valid(
+    codes: CodeArray, starts: EpochArray, ends: EpochArray
+) -> tuple[CodeArray, EpochArray, EpochArray]:
+    # ranges that don't last at least a minute count for nothing
+    valid = starts < ends
+    return codes[valid], starts[valid], ends[valid]
+
+
+def _single(starts: EpochArray) -> CodeArray:
+    # everything's in the same group
+    return np.zeros(starts.size, dtype=np.int32)
+
+
+def grouped_seconds_per_bucket(
+    codes: CodeArray, starts: EpochArray, ends: EpochArray, count: int, bucket: int
+) -> tuple[int, EpochArray]:
+    """
+    Calculates how many seconds the ranges spent in each bucket, with each range
+    counting towards the group its code says it's a part of.
+    Returns the index of the first bucket (in buckets since the epoch) and the totals
+    for each group (the rows) for each bucket from that one onwards (the columns).
+    """
+    first_buckets = starts // bucket
+    # ends are exclusive, and are always on a minute, so the last minute is what counts
+    last_buckets = (ends - 60) // bucket
+
+    base = int(first_buckets.min())
+    totals = np.zeros((count, int(last_buckets.max()) - base + 2), dtype=np.int64)
+
+    # the first bucket gets everything up to the next bucket
+    # ...except if the range is shorter than a bucket, where it gets the entire
+    # range even if some of it goes into the next bucket - the next bucket still
+    # gets its part too
+    # yes, this double counts. it's how the stats have always been calculated though,
+    # and it's kept so that the graphs don't suddenly change
+    lengths = ends - starts
+    np.add.at(
+        totals,
+        (codes, first_buckets - base),
+        np.where(lengths < bucket, lengths, (first_buckets + 1) * bucket - starts),
+    )
+
+    spans_buckets = last_buckets > first_buckets
+    spanning_codes = codes[spans_buckets]
+    np.add.at(
+        totals,
+        (spanning_codes, last_buckets[spans_buckets] - base),
+        ends[spans_buckets] - last_buckets[spans_buckets] * bucket,
+    )
+
+    # everything in between is a full bucket - mark where those start and stop,
+    # and let cumsum fill in the rest
+    full = np.zeros_like(totals)
+    np.add.at(full, (spanning_codes, first_buckets[spans_buckets] + 1 - base), bucket)
+    np.add.at(full, (spanning_codes, last_buckets[spans_buckets] - base), -bucket)
+    totals += np.cumsum(full, axis=1)
+
+    return base, totals
+
+
+def seconds_per_bucket(
+    starts: EpochArray, ends: EpochArray, bucket: int
+) -> tuple[int, EpochArray]:
+    """
+    Calculates how many seconds the ranges spent in each bucket.
+    Returns the index of the first bucket (in buckets since the epoch) and the totals
+    for each bucket from that one onwards.
+    """
+    base, totals = grouped_seconds_per_bucket(_single(starts), starts, ends, 1, bucket)
+    return base, totals[0]
+
+
+def grouped_minutes_per_bucket(
+    codes: CodeArray,
+    starts: EpochArray,
+    ends: EpochArray,
+    count: int,
+    bucket: int,
+    min_timestamp: int | None,
+    max_timestamp: int | None,
+) -> list[tuple[list[int], list[int]]]:
+    """
+    Returns, for every group, the timestamp of every bucket from the min to the
+    max timestamp and how many minutes were spent in each. If the min or max isn't
+    given, the first or last bucket any group has anything in is used.
+    """
+    codes, starts, ends = _valid(codes, starts, ends)
+
+    if starts.size:
+        base, totals = grouped_seconds_per_bucket(codes, starts, ends, count, bucket)
+        totals //= 60
+    else:
+        base, totals = 0, np.zeros((count, 0), dtype=np.int64)
+
+    # only buckets that have been touched count for the default min and max
+    touched = np.flatnonzero(totals.any(axis=0))
+    if min_timestamp is None:
+        min_timestamp = (base + int(touched.min())) * bucket
+    if max_timestamp is None:
+        max_timestamp = (base + int(touched.max())) * bucket
+
+    keys = np.arange(min_timestamp, max_timestamp + 1, bucket, dtype=np.int64)
+    indexes = keys // bucket - base
+    in_range = (indexes >= 0) & (indexes < totals.shape[1])
+
+    values = np.zeros((count, keys.size), dtype=np.int64)
+    values[:, in_range] = totals[:, indexes[in_range]]
+
+    key_list = keys.tolist()
+    return [(key_list, row) for row in values.tolist()]
+
+
+def minutes_per_bucket(
+    starts: EpochArray,
+    ends: EpochArray,
+    bucket: int,
+    min_timestamp: int | None,
+    max_timestamp: int | None,
+) -> tuple[list[int], list[int]]:
+    """
+    Returns the timestamp of every bucket from the min to the max timestamp, and
+    how many minutes were spent in each. If the min or max isn't given, the
+    first or last bucket with anything in it is used.
+    """
+    return grouped_minutes_per_bucket(
+        _single(starts), starts, ends, 1, bucket, min_timestamp, max_timestamp
+    )[0]
+
+
+def grouped_folded_minutes(
+    codes: CodeArray,
+    starts: EpochArray,
+    ends: EpochArray,
+    count: int,
+    bucket: int,
+    period: int,
+    offset: int,
+) -> list[list[int]]:
+    # sums up buckets that land on the same spot in a period, ie the same
+    # hour of the day, for every group
+    codes, starts, ends = _valid(codes, starts, ends)
+    if not starts.size:
+        return [[0] * period for _ in range(count)]
+
+    base, totals = grouped_seconds_per_bucket(codes, starts, ends, count, bucket)
+    positions = (np.arange(totals.shape[1], dtype=np.int64) + base + offset) % period
+
+    folded = np.zeros((count, period), dtype=np.int64)
+    # done on the transposes so the positions index the buckets, not the groups
+    np.add.at(folded.T, positions, (totals // 60).T)
+    return folded.tolist()
+
+
+def folded_minutes(
+    starts: EpochArray, ends: EpochArray, bucket: int, period: int, offset: int
+) -> list[int]:
+    return grouped_folded_minutes(
+        _single(starts), starts, ends, 1, bucket, period, offset
+    )[0]
+
+
+def leaderboard(
+    codes: CodeArray, starts: EpochArray, ends: EpochArray, count: int
+) -> list[tuple[int, int]]:
+    """
+    Totals up the seconds played by every player, identified by their code, and
+    returns the codes and totals of everyone who played, most played first.
+    Ties are kept in the order the players first showed up in.
+    """
+    totals = np.zeros(count, dtype=np.int64)
+    np.add.at(totals, codes, np.maximum(ends - starts, 0))
+
+    played = np.flatnonzero(totals > 0)
+    order = played[np.argsort(-totals[played], kind="stable")]
+    return list(zip(order.tolist(), totals[order].tolist(), strict=True))
@@ -17,14 +17,20 @@ Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 import datetime
 import io
 import typing
-from collections import Counter, defaultdict
 from enum import IntEnum
 
 import interactions as ipy
+import numpy as np
+import numpy.typing as npt
 from prisma.types import PlayerSessionWhereInput
 
+import common.compute_pool as compute_pool
 import common.graph_template as graph_template
+import common.leaderboards as leaderboards
 import common.models as models
+import common.playtime_rollup as playtime_rollup
+import common.stats_cache as stats_cache
+import common.stats_kernels as stats_kernels
 import common.utils as utils
 
 VALID_TIME_DICTS = typing.Union[
@@ -39,6 +45,13 @@ INTERNATIONAL_FORMAT_DATE = "%d/%m/%y"
 INTERNATIONAL_FORMAT = f"{INTERNATIONAL_FORMAT_DATE} {INTERNATIONAL_FORMAT_TIME}"
 DAY_OF_THE_WEEK = "%A"
 
+# how many ranges it takes before stats get calculated in a worker process
+COMPUTE_INLINE_UNDER = 5_000
+
+# interaction tokens last for 15 minutes, and responding to one takes a bit
+INTERACTION_LIFETIME = datetime.timedelta(minutes=15)
+SEND_MARGIN = datetime.timedelta(seconds=30)
+
 SHOWABLE_FORMAT = {
     US_FORMAT_TIME: "HH AM/PM",
     US_FORMAT_DATE: "MM/DD/YY",
@@ -121,160 +134,214 @@ class GatherDatetimesReturn(typing.NamedTuple):
     last_seen: datetime.datetime
 
 
-def get_minutes_per_hour(
+def _to_epoch_arrays(
     ranges: typing.Iterable[GatherDatetimesReturn],
-    *,
-    min_datetime: typing.Optional[datetime.datetime] = None,
-    max_datetime: typing.Optional[datetime.datetime] = None,
-) -> dict[datetime.datetime, int]:
-    minutes_per_hour: defaultdict[int, int] = defaultdict(int)
-
-    for _, start, end in ranges:
-        end_time = int(end.timestamp()) // 60 * 60
-        current_hour = int(start.timestamp()) // 60 * 60
-
-        while current_hour < end_time:
-            # comments arent repeated for every function, use this one as ref
-
-            # you may be asking "what is hour floored?"
-            # basically, it's the exact second the hour starts
-            # so, say, instead of being 1:32:21, it'll be 1:00:00
-            hour_floored = current_hour // InSeconds.HOUR * InSeconds.HOUR
-            next_hour = hour_floored + InSeconds.HOUR
-
-            # if the current hour + one hour is greater than the end time,
-            # calculate the seconds between the end time and the current hour
-            # else, calculate the seconds between the next hour and the current
-            # hour time
-            # note that we do not want to round current hour here or make assumptions
-            # that it is floored as if it is, say, 1:32, and our end time is 1:54, we
-            # want to make sure to calculate between 54 and 32, not 54 and 00
-            minutes_in_hour = (
-                (next_hour - current_hour) // 60
-                if current_hour + InSeconds.HOUR <= end_time
-                else (end_time - current_hour) // 60
-            )
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    # converts the ranges into arrays of their starts and ends, floored to the minute
+    timestamps = np.array(
+        [(start.timestamp(), end.timestamp()) for _, start, end in ranges],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    # astype truncates just like int() does
+    floored = timestamps.astype(np.int64) // 60 * 60
+    return floored[:, 0], floored[:, 1]
 
-            minutes_per_hour[hour_floored] += minutes_in_hour
-            current_hour = next_hour
 
-    min_timestamp = (
-        get_nearest_hour_timestamp(min_datetime)
-        if min_datetime
-        else min(minutes_per_hour.keys())
-    )
-    max_timestamp = (
-        get_nearest_hour_timestamp(max_datetime)
-        if max_datetime
-        else max(minutes_per_hour.keys())
-    )
+class _Bucketing(typing.NamedTuple):
+    kernel: typing.Callable[..., typing.Any]
+    grouped_kernel: typing.Callable[..., list[typing.Any]]
+    args: tuple[typing.Any, ...]
+    finish: typing.Callable[[typing.Any], VALID_TIME_DICTS]
+
 
+def _datetime_keys(result: tuple[list[int], list[int]]) -> dict[datetime.datetime, int]:
     return {
-        datetime.datetime.fromtimestamp(k, tz=datetime.UTC): minutes_per_hour[k]
-        for k in range(min_timestamp, max_timestamp + 1, InSeconds.HOUR)
+        datetime.datetime.fromtimestamp(k, tz=datetime.UTC): v
+        for k, v in zip(*result, strict=True)
     }
 
 
-def get_minutes_per_day(
+def _bucketing_for(
+    func: typing.Callable[..., VALID_TIME_DICTS],
+    min_datetime: typing.Optional[datetime.datetime],
+    max_datetime: typing.Optional[datetime.datetime],
+) -> _Bucketing:
+    # the arguments are all plain ints so that they're cheap to send to
+    # a worker process
+    match func.__name__:
+        case "get_minutes_per_hour":
+            return _Bucketing(
+                stats_kernels.minutes_per_bucket,
+                stats_kernels.grouped_minutes_per_bucket,
+                (
+                    int(InSeconds.HOUR),
+                    get_nearest_hour_timestamp(min_datetime) if min_datetime else None,
+                    get_nearest_hour_timestamp(max_datetime) if max_datetime else None,
+                ),
+                _datetime_keys,
+            )
+        case "get_minutes_per_day":
+            return _Bucketing(
+                stats_kernels.minutes_per_bucket,
+                stats_kernels.grouped_minutes_per_bucket,
+                (
+                    int(InSeconds.DAY),
+                    get_nearest_day_timestamp(min_datetime) if min_datetime else None,
+                    get_nearest_day_timestamp(max_datetime) if max_datetime else None,
+                ),
+                _datetime_keys,
+            )
+        case "timespan_minutes_per_hour":
+            # hours since the epoch line up with hours of the day nicely
+            return _Bucketing(
+                stats_kernels.folded_minutes,
+                stats_kernels.grouped_folded_minutes,
+                (int(InSeconds.HOUR), 24, 0),
+                lambda result: {datetime.time(hour=k): v for k, v in enumerate(result)},
+            )
+        case "timespan_minutes_per_day_of_the_week":
+            # https://stackoverflow.com/questions/36389130/how-to-calculate-the-day-of-the-week-based-on-unix-time
+            return _Bucketing(
+                stats_kernels.folded_minutes,
+                stats_kernels.grouped_folded_minutes,
+                (int(InSeconds.DAY), 7, 4),
+                lambda result: {
+                    datetime.date(year=1970, month=1, day=(k - 3) + 7): v
+                    for k, v in enumerate(result)
+                },
+            )
+
+    raise ValueError(f"{func.__name__} is not a bucketing function.")
+
+
+def _bucket(
+    func: typing.Callable[..., VALID_TIME_DICTS],
     ranges: typing.Iterable[GatherDatetimesReturn],
-    *,
     min_datetime: typing.Optional[datetime.datetime] = None,
     max_datetime: typing.Optional[datetime.datetime] = None,
-) -> dict[datetime.datetime, int]:
-    minutes_per_day: defaultdict[int, int] = defaultdict(int)
-
-    for _, start, end in ranges:
-        end_time = int(end.timestamp()) // 60 * 60
-        current_day = int(start.timestamp()) // 60 * 60
+) -> typing.Any:
+    bucketing = _bucketing_for(func, min_datetime, max_datetime)
+    return bucketing.finish(
+        bucketing.kernel(*_to_epoch_arrays(ranges), *bucketing.args)
+    )
 
-        while current_day < end_time:
-            day_floored = current_day // InSeconds.DAY * InSeconds.DAY
-            next_day = day_floored + InSeconds.DAY
 
-            minutes_in_day = (
-                (next_day - current_day) // 60
-                if current_day + InSeconds.DAY <= end_time
-                else (end_time - current_day) // 60
-            )
+def get_minutes_per_hour(
+    ranges: typing.Iterable[GatherDatetimesReturn],
+    *,
+    min_datetime: typing.Optional[datetime.datetime] = None,
+    max_datetime: typing.Optional[datetime.datetime] = None,
+) -> dict[datetime.datetime, int]:
+    return _bucket(get_minutes_per_hour, ranges, min_datetime, max_datetime)
 
-            minutes_per_day[day_floored] += minutes_in_day
-            current_day = next_day
 
-    min_timestamp = (
-        get_nearest_day_timestamp(min_datetime)
-        if min_datetime
-        else min(minutes_per_day.keys())
-    )
-    max_timestamp = (
-        get_nearest_day_timestamp(max_datetime)
-        if max_datetime
-        else max(minutes_per_day.keys())
-    )
-
-    return {
-        datetime.datetime.fromtimestamp(k, tz=datetime.UTC): minutes_per_day[k]
-        for k in range(min_timestamp, max_timestamp + 1, InSeconds.DAY)
-    }
+def get_minutes_per_day(
+    ranges: typing.Iterable[GatherDatetimesReturn],
+    *,
+    min_datetime: typing.Optional[datetime.datetime] = None,
+    max_datetime: typing.Optional[datetime.datetime] = None,
+) -> dict[datetime.datetime, int]:
+    return _bucket(get_minutes_per_day, ranges, min_datetime, max_datetime)
 
 
 def timespan_minutes_per_hour(
     ranges: typing.Iterable[GatherDatetimesReturn],
     **_: typing.Any,
 ) -> dict[datetime.time, int]:
-    # we want the dict to start at 0, so make the dict first
-    minutes_per_hour: dict[int, int] = {i: 0 for i in range(24)}
-
-    for _, start, end in ranges:
-        end_time = int(end.timestamp()) // 60 * 60
-        current_hour = int(start.timestamp()) // 60 * 60
-
-        while current_hour < end_time:
-            next_hour = (
-                current_hour // InSeconds.HOUR * InSeconds.HOUR
-            ) + InSeconds.HOUR
-
-            minutes_in_hour = (
-                (next_hour - current_hour) // 60
-                if current_hour + InSeconds.HOUR <= end_time
-                else (end_time - current_hour) // 60
-            )
-
-            # represents the hour of the day the time is in
-            minutes_per_hour[
-                current_hour % InSeconds.DAY // InSeconds.HOUR
-            ] += minutes_in_hour
-            current_hour = next_hour
-
-    return {datetime.time(hour=k): v for k, v in minutes_per_hour.items()}
+    return _bucket(timespan_minutes_per_hour, ranges)
 
 
 def timespan_minutes_per_day_of_the_week(
     ranges: typing.Iterable[GatherDatetimesReturn],
     **_: typing.Any,
 ) -> dict[datetime.date, int]:
-    minutes_per_day_of_the_week: dict[int, int] = {i: 0 for i in range(7)}
-
-    for _, start, end in ranges:
-        end_time = int(end.timestamp()) // 60 * 60
-        current_day = int(start.timestamp()) // 60 * 60
-
-        while current_day < end_time:
-            next_day = (current_day // InSeconds.DAY * InSeconds.DAY) + InSeconds.DAY
-            minutes_in_day = (
-                (next_day - current_day) // 60
-                if current_day + InSeconds.DAY <= end_time
-                else (end_time - current_day) // 60
-            )
+    return _bucket(timespan_minutes_per_day_of_the_week, ranges)
 
-            # https://stackoverflow.com/questions/36389130/how-to-calculate-the-day-of-the-week-based-on-unix-time
-            minutes_per_day_of_the_week[
-                ((current_day // InSeconds.DAY) + 4) % 7
-            ] += minutes_in_day
-            current_day = next_day
 
+def interaction_deadline(
+    ctx: utils.RealmContext | utils.RealmModalContext,
+) -> datetime.datetime:
+    # interactions can only be responded to for so long - there's no point in
+    # working out a graph past that, and some time is needed to send it (or the
+    # error saying it took too long) anyways
+    return ctx.id.created_at + INTERACTION_LIFETIME - SEND_MARGIN
+
+
+async def _compute[
+    T
+](
+    kernel: typing.Callable[..., T],
+    *args: typing.Any,
+    size: int,
+    deadline: datetime.datetime | None,
+) -> T:
+    # sending small inputs to a worker process costs more than just doing it here
+    if size < COMPUTE_INLINE_UNDER:
+        return kernel(*args)
+
+    try:
+        return await compute_pool.run(kernel, *args, deadline=deadline)
+    except TimeoutError:
+        raise utils.CustomCheckFailure(
+            "Calculating this took too long. Please try again later or try a shorter"
+            " period."
+        ) from None
+
+
+async def compute_minutes(
+    func: typing.Callable[..., VALID_TIME_DICTS],
+    ranges: typing.Iterable[GatherDatetimesReturn],
+    *,
+    min_datetime: typing.Optional[datetime.datetime] = None,
+    max_datetime: typing.Optional[datetime.datetime] = None,
+    deadline: datetime.datetime | None = None,
+) -> VALID_TIME_DICTS:
+    """
+    Does the same thing as calling func with the ranges, but in a worker process
+    if there's enough data to make that worth it.
+    If that's still going by the deadline, the user is told it took too long.
+    """
+    bucketing = _bucketing_for(func, min_datetime, max_datetime)
+    starts, ends = _to_epoch_arrays(ranges)
+    result = await _compute(
+        bucketing.kernel,
+        starts,
+        ends,
+        *bucketing.args,
+        size=starts.size,
+        deadline=deadline,
+    )
+    return bucketing.finish(result)
+
+
+async def compute_grouped_minutes(
+    func: typing.Callable[..., VALID_TIME_DICTS],
+    ranges: typing.Iterable[GatherDatetimesReturn],
+    xuids: typing.Sequence[str],
+    *,
+    min_datetime: typing.Optional[datetime.datetime] = None,
+    max_datetime: typing.Optional[datetime.datetime] = None,
+    deadline: datetime.datetime | None = None,
+) -> dict[str, VALID_TIME_DICTS]:
+    """
+    Like compute_minutes, but buckets every player's ranges separately in one go.
+    Players without any ranges still get an entry - full of zeros.
+    """
+    bucketing = _bucketing_for(func, min_datetime, max_datetime)
+    all_xuids, codes, starts, ends = _coded_arrays(ranges, xuids)
+    results = await _compute(
+        bucketing.grouped_kernel,
+        codes,
+        starts,
+        ends,
+        len(all_xuids),
+        *bucketing.args,
+        size=codes.size,
+        deadline=deadline,
+    )
     return {
-        datetime.date(year=1970, month=1, day=(k - 3) + 7): v
-        for k, v in minutes_per_day_of_the_week.items()
+        xuid: bucketing.finish(result)
+        for xuid, result in zip(all_xuids, results, strict=True)
     }
 
 
@@ -288,30 +355,46 @@ def calc_timespan(joined_at: datetime.datetime, last_seen: datetime.datetime) ->
     return 0 if end <= start else end - start
 
 
-def calc_leaderboard(
+def _coded_arrays(
     ranges: typing.Iterable[GatherDatetimesReturn],
-) -> list[tuple[str, int]]:
-    leaderboard_counter: Counter[str] = Counter()
+    xuids: typing.Iterable[str] = (),
+) -> tuple[
+    list[str], npt.NDArray[np.int32], npt.NDArray[np.int64], npt.NDArray[np.int64]
+]:
+    # players are turned into codes based on the order they're given in, and then
+    # the order they first show up in
+    xuid_codes: dict[str, int] = {xuid: index for index, xuid in enumerate(xuids)}
+    codes: list[int] = []
+    ranges = list(ranges)
 
     for datetime_entry in ranges:
-        leaderboard_counter[datetime_entry.xuid] += calc_timespan(
-            datetime_entry.joined_at, datetime_entry.last_seen
-        )
+        codes.append(xuid_codes.setdefault(datetime_entry.xuid, len(xuid_codes)))
 
-    leaderboard_counter = +leaderboard_counter  # filters out 0s somehow?
-    return [e for e in leaderboard_counter.most_common() if e[0]]
+    starts, ends = _to_epoch_arrays(ranges)
+    return list(xuid_codes), np.array(codes, dtype=np.int32), starts, ends
 
 
-async def gather_datetimes(
+def _finish_leaderboard(
+    xuids: list[str], result: list[tuple[int, int]]
+) -> list[tuple[str, int]]:
+    return [(xuids[code], total) for code, total in result if xuids[code]]
+
+
+def calc_leaderboard(
+    ranges: typing.Iterable[GatherDatetimesReturn],
+) -> list[tuple[str, int]]:
+    xuids, codes, starts, ends = _coded_arrays(ranges)
+    return _finish_leaderboard(
+        xuids, stats_kernels.leaderboard(codes, starts, ends, len(xuids))
+    )
+
+
+async def _find_datetimes(
     config: models.GuildConfig,
     min_datetime: datetime.datetime,
-    *,
-    gamertag: typing.Optional[str] = None,
-    **filter_kwargs: typing.Unpack[PlayerSessionWhereInput],
+    filter_kwargs: dict[str, typing.Any],
 ) -> list[GatherDatetimesReturn]:
-    filter_kwargs = {k: v for k, v in filter_kwargs.items() if v is not None}
-
-    datetimes_to_use: list[GatherDatetimesReturn] = [
+    return [
         GatherDatetimesReturn(entry.xuid, entry.joined_at, entry.last_seen)
         for entry in await models.PlayerSession.prisma().find_many(
             where={
@@ -322,20 +405,108 @@ async def gather_datetimes(
         )
         if entry.joined_at and entry.last_seen
     ]
+
+
+async def gather_datetimes(
+    config: models.GuildConfig,
+    min_datetime: datetime.datetime,
+    *,
+    gamertag: typing.Optional[str] = None,
+    **filter_kwargs: typing.Unpack[PlayerSessionWhereInput],
+) -> list[GatherDatetimesReturn]:
+    filter_kwargs = {k: v for k, v in filter_kwargs.items() if v is not None}
+
+    datetimes_to_use = await _find_datetimes(config, min_datetime, filter_kwargs)
+    if not datetimes_to_use:
+        raise no_data_error(gamertag)
+
+    return datetimes_to_use
+
+
+def _rollup_graphs() -> bool:
+    # graphs made from the rollups don't come out quite the same as ones made from
+    # sessions (see playtime_rollup.fetch_hourly) - they don't double-count
+    # sessions shorter than a bucket, which is arguably more correct anyways
+    # the leaderboard doesn't have this problem, and uses the rollups regardless
+    return utils.FEATURE("PLAYTIME_ROLLUPS") and utils.FEATURE("ROLLUP_GRAPHS")
+
+
+async def gather_hourly_datetimes(
+    config: models.GuildConfig,
+    min_datetime: datetime.datetime,
+    *,
+    gamertag: typing.Optional[str] = None,
+    **filter_kwargs: typing.Unpack[PlayerSessionWhereInput],
+) -> list[GatherDatetimesReturn]:
+    """
+    Like gather_datetimes, but reads from the hourly playtime rollups if
+    ROLLUP_GRAPHS is on.
+    Each entry is the minutes played in an hour rather than a session, so this
+    works for anything that only cares about minutes played, like graphs and
+    leaderboards - but not for things that need actual sessions.
+    """
+    filter_kwargs = {k: v for k, v in filter_kwargs.items() if v is not None}
+    if not _rollup_graphs() or filter_kwargs.keys() - {"xuid"}:
+        # the rollups only know about xuids
+        return await gather_datetimes(
+            config, min_datetime, gamertag=gamertag, **filter_kwargs
+        )
+
+    datetimes_to_use = [
+        GatherDatetimesReturn(*entry)
+        for entry in await playtime_rollup.fetch_hourly(
+            str(config.realm_id),
+            min_datetime,
+            xuids=[filter_kwargs["xuid"]] if "xuid" in filter_kwargs else None,
+        )
+    ]
     if not datetimes_to_use:
-        if gamertag:
-            raise utils.CustomCheckFailure(
-                f"There's no data for `{gamertag}` on the linked Realm for this"
-                " timespan."
-            )
-        else:
-            raise utils.CustomCheckFailure(
-                "There's no data for the linked Realm for this timespan."
+        raise no_data_error(gamertag)
+
+    return datetimes_to_use
+
+
+async def gather_players_hourly_datetimes(
+    config: models.GuildConfig,
+    min_datetime: datetime.datetime,
+    xuid_list: typing.Sequence[str],
+    gamertag_list: typing.Sequence[str],
+) -> list[GatherDatetimesReturn]:
+    """
+    Like gather_hourly_datetimes, but for several players at once, in one query.
+    Errors out on the first player without any data, like gathering for each
+    player one by one would.
+    """
+    if _rollup_graphs():
+        datetimes_to_use = [
+            GatherDatetimesReturn(*entry)
+            for entry in await playtime_rollup.fetch_hourly(
+                str(config.realm_id), min_datetime, xuids=xuid_list
             )
+        ]
+    else:
+        datetimes_to_use = await _find_datetimes(
+            config, min_datetime, {"xuid": {"in": list(xuid_list)}}
+        )
+
+    xuids_with_data = {d.xuid for d in datetimes_to_use}
+    for xuid, gamertag in zip(xuid_list, gamertag_list, strict=True):
+        if xuid not in xuids_with_data:
+            raise no_data_error(gamertag)
 
     return datetimes_to_use
 
 
+def no_data_error(gamertag: typing.Optional[str] = None) -> utils.CustomCheckFailure:
+    if gamertag:
+        return utils.CustomCheckFailure(
+            f"There's no data for `{gamertag}` on the linked Realm for this timespan."
+        )
+    return utils.CustomCheckFailure(
+        "There's no data for the linked Realm for this timespan."
+    )
+
+
 async def period_parse(
     bot: utils.RealmBotBase,
     user_id: ipy.Snowflake_Type,
@@ -344,8 +515,11 @@ async def period_parse(
 ) -> tuple[int, str]:
     if period not in PERIODS:
         if period in GATED_PERIODS:
+            # longer periods were only gated because of how much they cost to
+            # work out from sessions - the rollups make them cheap
             if (
-                utils.SHOULD_VOTEGATE
+                not _rollup_graphs()
+                and utils.SHOULD_VOTEGATE
                 and not config.valid_premium
                 and await bot.valkey.get(f"rpl-voted-{user_id}") != "1"
             ):
@@ -379,8 +553,11 @@ async def summary_parse(
 ) -> tuple[int, str]:
     if summarize_by not in SUMMARIES:
         if summarize_by in GATED_SUMMARIES:
+            # longer periods were only gated because of how much they cost to
+            # work out from sessions - the rollups make them cheap
             if (
-                utils.SHOULD_VOTEGATE
+                not _rollup_graphs()
+                and utils.SHOULD_VOTEGATE
                 and not config.valid_premium
                 and await bot.valkey.get(f"rpl-voted-{user_id}") != "1"
             ):
@@ -479,9 +656,11 @@ async def process_summary(
     num_days, actual_summarize_by = await summary_parse(
         ctx.bot, ctx.author_id, config, summarize_by
     )
+    # truncated so that it (and so the cache key it's part of) only changes
+    # every minute rather than every second
     min_datetime = (
         now - datetime.timedelta(days=num_days) + datetime.timedelta(minutes=1)
-    )
+    ).replace(second=0, microsecond=0)
 
     if actual_summarize_by == "H":
         func_to_use = timespan_minutes_per_hour
@@ -506,7 +685,54 @@ async def process_summary(
     )
 
 
+_TIME_KEY_PARSERS: dict[str, typing.Callable[[str], typing.Any]] = {
+    "get_minutes_per_hour": datetime.datetime.fromisoformat,
+    "get_minutes_per_day": datetime.datetime.fromisoformat,
+    "timespan_minutes_per_hour": datetime.time.fromisoformat,
+    "timespan_minutes_per_day_of_the_week": datetime.date.fromisoformat,
+}
+
+
+def _encode_time_data(time_data: VALID_TIME_DICTS) -> list[tuple[str, int]]:
+    return [(k.isoformat(), v) for k, v in time_data.items()]
+
+
+def _decode_time_data(
+    func: typing.Callable[..., VALID_TIME_DICTS], raw: list[list[typing.Any]]
+) -> VALID_TIME_DICTS:
+    parser = _TIME_KEY_PARSERS[func.__name__]
+    return {parser(k): v for k, v in raw}
+
+
+def _minute_watermark(now: datetime.datetime) -> int:
+    return int(now.timestamp()) // 60
+
+
+async def _with_cache[
+    T
+](
+    bot: utils.RealmBotBase,
+    config: models.GuildConfig,
+    parts: tuple[typing.Any, ...],
+    compute: typing.Callable[[], typing.Awaitable[T]],
+    *,
+    encode: typing.Callable[[T], typing.Any],
+    decode: typing.Callable[[typing.Any], T],
+) -> T:
+    if not utils.FEATURE("STATS_CACHE"):
+        return await compute()
+
+    key, cached = await stats_cache.fetch(bot.valkey, str(config.realm_id), *parts)
+    if cached is not None:
+        return decode(cached)
+
+    result = await compute()
+    await stats_cache.store(bot.valkey, key, encode(result))
+    return result
+
+
 async def process_single_graph_data(
+    bot: utils.RealmBotBase,
     config: models.GuildConfig,
     *,
     min_datetime: datetime.datetime,
@@ -514,25 +740,48 @@ async def process_single_graph_data(
     func_to_use: typing.Callable[..., VALID_TIME_DICTS],
     gamertag: typing.Optional[str] = None,
     filter_kwargs: typing.Optional[dict[str, typing.Any]] = None,
-) -> tuple[VALID_TIME_DICTS, list[GatherDatetimesReturn]]:
+    deadline: datetime.datetime | None = None,
+) -> tuple[VALID_TIME_DICTS, datetime.datetime]:
     if filter_kwargs is None:
         filter_kwargs = {}
 
-    datetimes_to_use = await gather_datetimes(
-        config, min_datetime, gamertag=gamertag, **filter_kwargs
-    )
-
-    return (
-        func_to_use(
+    async def compute() -> tuple[VALID_TIME_DICTS, datetime.datetime]:
+        datetimes_to_use = await gather_hourly_datetimes(
+            config, min_datetime, gamertag=gamertag, **filter_kwargs
+        )
+        time_data = await compute_minutes(
+            func_to_use,
             datetimes_to_use,
             min_datetime=min_datetime,
             max_datetime=now,
+            deadline=deadline,
+        )
+        return time_data, min(d.last_seen for d in datetimes_to_use)
+
+    return await _with_cache(
+        bot,
+        config,
+        (
+            "single",
+            func_to_use.__name__,
+            int(min_datetime.timestamp()),
+            _minute_watermark(now),
+            *(f"{k}={v}" for k, v in sorted(filter_kwargs.items())),
+        ),
+        compute,
+        encode=lambda result: {
+            "data": _encode_time_data(result[0]),
+            "earliest": result[1].isoformat(),
+        },
+        decode=lambda raw: (
+            _decode_time_data(func_to_use, raw["data"]),
+            datetime.datetime.fromisoformat(raw["earliest"]),
         ),
-        datetimes_to_use,
     )
 
 
 async def process_multi_graph_data(
+    bot: utils.RealmBotBase,
     config: models.GuildConfig,
     xuid_list: list[str],
     *,
@@ -540,29 +789,83 @@ async def process_multi_graph_data(
     min_datetime: datetime.datetime,
     now: datetime.datetime,
     func_to_use: typing.Callable[..., VALID_TIME_DICTS],
+    deadline: datetime.datetime | None = None,
 ) -> tuple[dict[str, VALID_TIME_DICTS], datetime.datetime]:
-    xuid_datetime_map: dict[str, list[GatherDatetimesReturn]] = {}
-
-    for xuid, gamertag in zip(xuid_list, gamertag_list, strict=True):
-        xuid_datetime_map[xuid] = await gather_datetimes(
-            config, min_datetime, gamertag=gamertag, xuid=xuid
+    async def compute() -> tuple[dict[str, VALID_TIME_DICTS], datetime.datetime]:
+        datetimes_to_use = await gather_players_hourly_datetimes(
+            config, min_datetime, xuid_list, gamertag_list
         )
-
-    earliest_datetime = min(
-        d.last_seen
-        for d in (
-            entry
-            for datetime_lists in xuid_datetime_map.values()
-            for entry in datetime_lists
+        minutes_per_period_map = await compute_grouped_minutes(
+            func_to_use,
+            datetimes_to_use,
+            xuid_list,
+            min_datetime=min_datetime,
+            max_datetime=now,
+            deadline=deadline,
         )
+        return minutes_per_period_map, min(d.last_seen for d in datetimes_to_use)
+
+    return await _with_cache(
+        bot,
+        config,
+        (
+            "multi",
+            func_to_use.__name__,
+            int(min_datetime.timestamp()),
+            _minute_watermark(now),
+            ",".join(xuid_list),
+        ),
+        compute,
+        encode=lambda result: {
+            "data": {xuid: _encode_time_data(d) for xuid, d in result[0].items()},
+            "earliest": result[1].isoformat(),
+        },
+        decode=lambda raw: (
+            {
+                xuid: _decode_time_data(func_to_use, d)
+                for xuid, d in raw["data"].items()
+            },
+            datetime.datetime.fromisoformat(raw["earliest"]),
+        ),
     )
 
-    minutes_per_period_map = {
-        xuid: func_to_use(datetimes_to_use, min_datetime=min_datetime, max_datetime=now)
-        for xuid, datetimes_to_use in xuid_datetime_map.items()
-    }
 
-    return minutes_per_period_map, earliest_datetime
+async def process_leaderboard_page(
+    bot: utils.RealmBotBase,
+    config: models.GuildConfig,
+    page: int,
+    *,
+    min_datetime: datetime.datetime,
+    now: datetime.datetime,
+) -> leaderboards.LeaderboardPage:
+    async def compute() -> leaderboards.LeaderboardPage:
+        return await leaderboards.fetch_page(
+            str(config.realm_id),
+            min_datetime,
+            page,
+            rollups=utils.FEATURE("PLAYTIME_ROLLUPS"),
+        )
+
+    return await _with_cache(
+        bot,
+        config,
+        ("leaderboard", int(min_datetime.timestamp()), _minute_watermark(now), page),
+        compute,
+        encode=lambda result: {
+            "entries": result.entries,
+            "total": result.total,
+            "earliest": result.earliest.isoformat() if result.earliest else None,
+        },
+        decode=lambda raw: leaderboards.LeaderboardPage(
+            [(xuid, playtime) for xuid, playtime in raw["entries"]],
+            raw["total"],
+            (
+                datetime.datetime.fromisoformat(raw["earliest"])
+                if raw["earliest"]
+                else None
+            ),
+        ),
+    )
 
 
 def create_single_graph(
@@ -0,0 +1,201 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import datetime
+import logging
+import math
+import typing
+
+import common.metrics as metrics
+import common.utils as utils
+
+logger = logging.getLogger("realms_bot")
+
+# how many times persisting a tick is tried before giving up on it for now, and
+# how long to wait (in seconds) before the first retry - this doubles every time
+PERSIST_ATTEMPTS = 3
+PERSIST_BACKOFF = 2.0
+# how many ticks in a row can fail to persist and be merged into the next one
+# before they're dropped for good
+MAX_CARRIED_TICKS = 30
+
+
+def next_minute() -> datetime.datetime:
+    now = datetime.datetime.now(tz=datetime.UTC)
+    # margin of error
+    multiplicity = math.ceil((now.timestamp() + 0.1) / 60)
+    return datetime.datetime.fromtimestamp(multiplicity * 60, tz=datetime.UTC)
+
+
+class TickPipeline[FetchT, DiffT]:
+    """
+    Runs the per-minute Realm processing as three stages - fetching, diffing, and
+    persisting - that each run in their own task and hand off to each other
+    through single-slot queues.
+
+    This way, a slow database write doesn't stop the next minute's fetch from
+    happening. If diffing is behind, the fetch stage replaces the stale tick
+    with the fresh one rather than letting them pile up, and if persisting is
+    behind, diffing waits for it.
+
+    Persisting is retried a few times if it fails. If it still can't be done and
+    merge is given, the tick is merged into the next one and persisted with it -
+    otherwise it's dropped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        fetch: typing.Callable[[], typing.Awaitable[FetchT | None]],
+        diff: typing.Callable[[FetchT], typing.Awaitable[DiffT]],
+        persist: typing.Callable[[DiffT], typing.Awaitable[None]],
+        merge: typing.Callable[[DiffT, DiffT], DiffT] | None = None,
+        ready: asyncio.Event | None = None,
+        fetch_timeout: float = 55,
+    ) -> None:
+        self.name = name
+        self.fetch = fetch
+        self.diff = diff
+        self.persist = persist
+        self.merge = merge
+        self.ready = ready
+        self.fetch_timeout = fetch_timeout
+
+        self.fetch_queue: asyncio.Queue[FetchT] = asyncio.Queue(maxsize=1)
+        self.persist_queue: asyncio.Queue[DiffT] = asyncio.Queue(maxsize=1)
+        self.tasks: list[asyncio.Task] = []
+
+    def start(
+        self,
+        create_task: typing.Callable[
+            [typing.Coroutine], asyncio.Task
+        ] = asyncio.create_task,
+    ) -> None:
+        self.tasks = [
+            create_task(self._fetch_runner()),
+            create_task(self._diff_runner()),
+            create_task(self._persist_runner()),
+        ]
+
+    def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def _metric(self, name: str) -> str:
+        return f"{self.name}.{name}"
+
+    def queue_fetched(self, fetched: FetchT) -> None:
+        if self.fetch_queue.full():
+            # diffing hasn't gotten to the last tick yet - it's stale now,
+            # so drop it in favor of this one
+            self.fetch_queue.get_nowait()
+            metrics.counter(self._metric("tick.coalesced")).inc()
+
+        self.fetch_queue.put_nowait(fetched)
+
+    async def _fetch_runner(self) -> None:
+        if self.ready:
+            await self.ready.wait()
+        await utils.sleep_until(next_minute())
+
+        while True:
+            next_time = next_minute()
+            try:
+                # a fetch that takes longer than a minute is useless anyways,
+                # and would otherwise stop the next one from happening
+                async with asyncio.timeout(self.fetch_timeout):
+                    with metrics.timing(self._metric("stage.fetch")).time():
+                        fetched = await self.fetch()
+
+                if fetched is not None:
+                    self.queue_fetched(fetched)
+            except TimeoutError:
+                metrics.counter(self._metric("fetch.timed_out")).inc()
+                logger.warning("Fetching for %s took too long, skipping.", self.name)
+            except Exception as e:
+                metrics.counter(self._metric("fetch.failed")).inc()
+                await utils.error_handle(e)
+
+            await utils.sleep_until(next_time)
+
+    async def _diff_runner(self) -> None:
+        while True:
+            fetched = await self.fetch_queue.get()
+            try:
+                with metrics.timing(self._metric("stage.diff")).time():
+                    diffed = await self.diff(fetched)
+
+                # if persisting is behind, this is where we wait for it
+                with metrics.timing(self._metric("stage.persist_wait")).time():
+                    await self.persist_queue.put(diffed)
+            except Exception as e:
+                await utils.error_handle(e)
+
+    async def _persist_with_retries(self, diffed: DiffT) -> bool:
+        for attempt in range(PERSIST_ATTEMPTS):
+            try:
+                with metrics.timing(self._metric("stage.persist")).time():
+                    await self.persist(diffed)
+                return True
+            except Exception as e:
+                metrics.counter(self._metric("persist.failed")).inc()
+                if attempt + 1 == PERSIST_ATTEMPTS:
+                    await utils.error_handle(e)
+                    return False
+
+                # diffing waits on us in the meantime, and fetching keeps on
+                # replacing its stale ticks, so nothing piles up
+                await asyncio.sleep(PERSIST_BACKOFF * 2**attempt)
+
+        return False
+
+    async def _persist_runner(self) -> None:
+        # a tick that couldn't be persisted, and how many ticks are merged into it
+        carried: DiffT | None = None
+        carried_ticks = 0
+
+        while True:
+            diffed = await self.persist_queue.get()
+            if carried is not None and self.merge:
+                diffed = self.merge(carried, diffed)
+                carried = None
+
+            if await self._persist_with_retries(diffed):
+                carried_ticks = 0
+            elif self.merge and carried_ticks < MAX_CARRIED_TICKS:
+                # with diff-only persistence, a dropped tick's joins and leaves
+                # would never be written, so keep them around for the next one
+                carried = diffed
+                carried_ticks += 1
+                metrics.counter(self._metric("persist.carried")).inc()
+            else:
+                logger.error(
+                    "Dropping %s unpersisted tick(s) for %s.",
+                    carried_ticks + 1,
+                    self.name,
+                )
+                metrics.counter(self._metric("persist.dropped")).inc(carried_ticks + 1)
+                carried_ticks = 0
+
+            if datetime.datetime.now(tz=datetime.UTC).minute in {0, 30}:
+                logger.info(
+                    "Tick stage latencies for %s:\n%s",
+                    self.name,
+                    metrics.render(self._metric("stage.")),
+                )
@@ -32,6 +32,7 @@ import orjson
 import sentry_sdk
 from interactions.ext import prefixed_commands as prefixed
 
+import common.config_cache as config_cache
 from common.models import GuildConfig
 
 SENTRY_ENABLED = bool(os.environ.get("SENTRY_DSN", False))  # type: ignore
@@ -53,6 +54,15 @@ _debug_defaults = {
     "SECURITY_CHECK": True,
     "RUN_MIGRATIONS_AUTOMATICALLY": True,
     "VOTEGATING": True,
+    "DIFF_ONLY_PERSISTENCE": True,
+    "EXTERNAL_POLLERS": False,
+    "PLAYTIME_ROLLUPS": True,
+    "ROLLUP_GRAPHS": True,
+    "GAMERTAG_REFRESH": True,
+    "STATS_CACHE": True,
+    "LOCAL_GAMERTAG_CACHE": True,
+    "PLAYER_PROFILES": True,
+    "CONFIG_CACHE": True,
 }
 
 REOCCURRING_LB_FREQUENCY: dict[int, str] = {
@@ -397,7 +407,12 @@ if typing.TYPE_CHECKING:
     from prisma import Prisma
 
     from .classes import OrderedSet
+    from .gamertag_cache import GamertagCache
+    from .gamertag_resolver import GamertagResolver
     from .help_tools import MiniCommand, PermissionsResolver
+    from .live_online import LiveOnlineRenderer
+    from .online_state import OnlineState
+    from .ratelimits import RateLimitScheduler
 
     class RealmBotBase(ipy.AutoShardedClient):
         prefixed: prefixed.PrefixedManager
@@ -407,7 +422,6 @@ if typing.TYPE_CHECKING:
         color: ipy.Color
         init_load: bool
         fully_ready: asyncio.Event
-        pl_sem: asyncio.Semaphore
 
         db: Prisma
         session: aiohttp.ClientSession
@@ -418,15 +432,15 @@ if typing.TYPE_CHECKING:
         own_gamertag: str
         background_tasks: set[asyncio.Task]
 
-        online_cache: defaultdict[int, set[str]]
+        online_state: OnlineState
+        gamertag_cache: GamertagCache
+        gamertag_resolver: GamertagResolver
+        live_online: LiveOnlineRenderer
+        ratelimits: RateLimitScheduler
         slash_perms_cache: defaultdict[int, dict[int, PermissionsResolver]]
         mini_commands_per_scope: dict[int, dict[str, MiniCommand]]
-        live_playerlist_store: defaultdict[str, set[int]]
-        player_watchlist_store: defaultdict[str, set[int]]
-        uuid_cache: defaultdict[str, str]
         offline_realms: OrderedSet[int]
         dropped_offline_realms: set[int]
-        fetch_devices_for: set[str]
         blacklist: set[int]
 
         @property
@@ -463,9 +477,10 @@ class RealmContextMixin:
         if self.config:
             return self.config
 
-        config = await GuildConfig.get_or_none(
-            self.guild_id
-        ) or await GuildConfig.prisma().create(data={"guild_id": self.guild_id})
+        config = await GuildConfig.get_or_none(self.guild_id)
+        if not config:
+            config = await GuildConfig.prisma().create(data={"guild_id": self.guild_id})
+            config_cache.CACHE.put(config)
 
         self.config = config
         return config
@@ -17,14 +17,21 @@ Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 import asyncio
 import contextlib
 import datetime
+import functools
 import importlib
 
 import interactions as ipy
 
 import common.classes as cclasses
+import common.gamertag_refresh as gamertag_refresh
 import common.models as models
 import common.playerlist_events as pl_events
 import common.playerlist_utils as pl_utils
+import common.playtime_rollup as playtime_rollup
+import common.ratelimits as ratelimits
+import common.realm_ticks as realm_ticks
+import common.session_partitions as session_partitions
+import common.session_retention as session_retention
 import common.utils as utils
 
 UPSELLS = [
@@ -88,11 +95,21 @@ class Autorunners(utils.Extension):
         self.playerlist_task = self.bot.create_task(self._start_playerlist())
         self.reoccuring_lb_task = self.bot.create_task(self._start_reoccurring_lb())
         self.player_session_delete.start()
+        if utils.FEATURE("PLAYTIME_ROLLUPS"):
+            self.playtime_rollup_task.start()
+
+        self.gamertag_refresher = gamertag_refresh.GamertagRefresher()
+        if utils.FEATURE("GAMERTAG_REFRESH"):
+            self.gamertag_refresh_task.start()
 
     def drop(self) -> None:
         self.playerlist_task.cancel()
         self.reoccuring_lb_task.cancel()
         self.player_session_delete.stop()
+        if utils.FEATURE("PLAYTIME_ROLLUPS"):
+            self.playtime_rollup_task.stop()
+        if utils.FEATURE("GAMERTAG_REFRESH"):
+            self.gamertag_refresh_task.stop()
         super().drop()
 
     async def _start_playerlist(self) -> None:
@@ -158,7 +175,9 @@ class Autorunners(utils.Extension):
         )
 
         gamertag_map = await pl_utils.get_xuid_to_gamertag_map(
-            self.bot, [p.xuid for p in player_sessions]
+            self.bot,
+            [p.xuid for p in player_sessions],
+            priority=ratelimits.Priority.AUTORUNNER,
         )
 
         to_run = [
@@ -327,7 +346,7 @@ class Autorunners(utils.Extension):
             return
 
         if not config.valid_premium:
-            await pl_utils.invalidate_premium(self.bot, config)
+            await pl_utils.invalidate_premium(config)
             return
 
         # make a fake context to make things easier
@@ -371,25 +390,68 @@ class Autorunners(utils.Extension):
     async def player_session_delete(self) -> None:
         now = datetime.datetime.now(tz=datetime.UTC)
         time_back = now - datetime.timedelta(days=31)
-        await models.PlayerSession.prisma().delete_many(
-            where={"online": False, "last_seen": {"lt": time_back}}
-        )
 
-        too_far_ago = now - datetime.timedelta(hours=1)
-        online_for_too_long = await models.PlayerSession.prisma().find_many(
-            where={"online": True, "last_seen": {"lt": too_far_ago}}
-        )
-        await models.PlayerSession.prisma().update_many(
-            data={"online": False},
-            where={"online": True, "last_seen": {"lt": too_far_ago}},
+        # every step is run even if the ones before it fail - not being able to
+        # make next week's partition shouldn't stop old sessions from being cleaned up
+        steps = (
+            # old sessions are dropped a whole partition at a time, which is a lot
+            # kinder to the database than deleting them row by row
+            functools.partial(session_partitions.ensure_partitions, self.bot.db, now),
+            functools.partial(
+                session_partitions.drop_expired_partitions, self.bot.db, time_back
+            ),
+            functools.partial(playtime_rollup.prune_rollups, self.bot.db, time_back),
+            functools.partial(
+                self.close_stale_sessions, now - datetime.timedelta(hours=1)
+            ),
         )
 
-        for session in online_for_too_long:
-            self.bot.online_cache[int(session.realm_id)].discard(session.xuid)
+        for step in steps:
+            try:
+                await step()
+            except Exception as e:
+                await utils.error_handle(e)
+
+    async def close_stale_sessions(self, too_far_ago: datetime.datetime) -> None:
+        async for chunk in session_retention.close_stale_sessions(
+            self.bot.db, too_far_ago
+        ):
+            closed = [(int(session.realm_id), session.xuid) for session in chunk]
+            for realm_id, xuid in closed:
+                self.bot.online_state.discard(realm_id, xuid)
+
+            if closed and utils.FEATURE("EXTERNAL_POLLERS"):
+                # the pollers have their own idea of who's online, which would
+                # otherwise keep thinking these players never left
+                await self.bot.valkey.xadd(
+                    realm_ticks.CLOSED_STREAM,
+                    {"data": realm_ticks.encode_closed(closed)},
+                    maxlen=realm_ticks.CLOSED_STREAM_MAXLEN,
+                    approximate=True,
+                )
+
+    @ipy.Task.create(ipy.IntervalTrigger(hours=1))
+    async def playtime_rollup_task(self) -> None:
+        # closed sessions are rolled up as soon as they close, so this is mostly
+        # for players who are still online
+        # going back two days also catches anything that got closed some other way
+        since = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(days=2)
+        await playtime_rollup.rollup_recent(self.bot.db, since)
+
+    @ipy.Task.create(ipy.IntervalTrigger(minutes=10))
+    async def gamertag_refresh_task(self) -> None:
+        # see common/gamertag_refresh.py - keeps active players' gamertags from
+        # all expiring at once
+        await self.bot.fully_ready.wait()
+        await self.gamertag_refresher.run(self.bot)
 
 
 def setup(bot: utils.RealmBotBase) -> None:
     importlib.reload(utils)
     importlib.reload(pl_utils)
+    importlib.reload(playtime_rollup)
+    importlib.reload(session_retention)
+    importlib.reload(session_partitions)
+    importlib.reload(gamertag_refresh)
     importlib.reload(cclasses)
     Autorunners(bot)
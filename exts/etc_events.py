@@ -23,7 +23,9 @@ import elytra
 import interactions as ipy
 import msgspec
 
+import common.config_cache as config_cache
 import common.models as models
+import common.realm_index as realm_index
 import common.utils as utils
 
 
@@ -58,11 +60,8 @@ class EtcEvents(utils.Extension):
         if config := await models.GuildConfig.get_or_none(int(event.guild_id)):
             if (
                 config.realm_id
-                and await models.GuildConfig.prisma().count(
-                    where={
-                        "realm_id": config.realm_id,
-                        "guild_id": {"not": int(event.guild_id)},
-                    }
+                and len(
+                    realm_index.INDEX.guild_ids(config.realm_id) - {int(event.guild_id)}
                 )
                 == 1
             ):
@@ -77,6 +76,8 @@ class EtcEvents(utils.Extension):
             await models.GuildConfig.prisma().delete(
                 where={"guild_id": int(event.guild_id)}
             )
+            realm_index.INDEX.remove(int(event.guild_id))
+            await config_cache.CACHE.invalidate(int(event.guild_id))
 
     def _update_tokens(self) -> None:
         with open(os.environ["XAPI_TOKENS_LOCATION"], mode="wb") as f:
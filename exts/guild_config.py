@@ -32,6 +32,7 @@ import common.device_code as device_code
 import common.models as models
 import common.playerlist_utils as pl_utils
 import common.premium_utils as premium_utils
+import common.realm_index as realm_index
 import common.realm_stories as realm_stories
 import common.utils as utils
 
@@ -91,7 +92,7 @@ class GuildConfig(utils.Extension):
         if not config.premium_code and (
             config.live_playerlist or config.fetch_devices or config.live_online_channel
         ):
-            await pl_utils.invalidate_premium(self.bot, config)
+            await pl_utils.invalidate_premium(config)
 
         embed = await utils.config_info_generate(
             ctx, config, diagnostic_info=diagnostic_info
@@ -181,33 +182,21 @@ class GuildConfig(utils.Extension):
         config.live_playerlist = False
         config.fetch_devices = False
         config.live_online_channel = None
-        old_player_watchlist = config.player_watchlist
         config.player_watchlist = []
         config.player_watchlist_role = None
 
+        # this takes the guild out of the realm index too
         await config.save()
 
         if not realm_id:
             return
 
-        self.bot.live_playerlist_store[realm_id].discard(config.guild_id)
         await self.bot.valkey.delete(
             f"invalid-playerlist3-{config.guild_id}",
             f"invalid-playerlist7-{config.guild_id}",
         )
 
-        if old_player_watchlist:
-            for player_xuid in old_player_watchlist:
-                self.bot.player_watchlist_store[f"{realm_id}-{player_xuid}"].discard(
-                    config.guild_id
-                )
-
-        if not await models.GuildConfig.prisma().count(
-            where={"realm_id": realm_id, "fetch_devices": True}
-        ):
-            self.bot.fetch_devices_for.discard(realm_id)
-
-        if not await models.GuildConfig.prisma().count(where={"realm_id": realm_id}):
+        if not realm_index.INDEX.has_guilds(realm_id):
             try:
                 await self.bot.realms.leave_realm(realm_id)
             except elytra.MicrosoftAPIException as e:
@@ -511,9 +500,9 @@ class GuildConfig(utils.Extension):
                             "You are not an operator of this Realm."
                         )
                 except ipy.errors.BadArgument as e:
-                    if not await models.GuildConfig.prisma().count(
-                        where={"realm_id": str(realm.id)}
-                    ) and utils.FEATURE("HANDLE_MISSING_REALMS"):
+                    if not realm_index.INDEX.has_guilds(str(realm.id)) and (
+                        utils.FEATURE("HANDLE_MISSING_REALMS")
+                    ):
                         try:
                             await ctx.bot.realms.leave_realm(realm.id)
                         except elytra.MicrosoftAPIException as e:
@@ -592,7 +581,7 @@ class GuildConfig(utils.Extension):
             realm_name=utils.FORMAT_CODE_REGEX.sub("", realm.name),
         )
 
-        if len(realm.players) <= 20:
+        if pag.last_page_index == 0:
             data = await pag.to_dict()
             embed = data["embeds"][0]
             embed.pop("author", None)
@@ -655,9 +644,6 @@ class GuildConfig(utils.Extension):
                 f"invalid-playerlist7-{config.guild_id}",
             )
 
-            if config.realm_id:
-                self.bot.live_playerlist_store[config.realm_id].discard(config.guild_id)
-
             await ctx.send(
                 embeds=utils.make_embed("Unset the autorunning playerlist channel.")
             )
@@ -1043,9 +1029,6 @@ class GuildConfig(utils.Extension):
             raise ipy.errors.BadArgument("This user is already in your watchlist.")
 
         config.player_watchlist.append(xuid)
-        self.bot.player_watchlist_store[f"{config.realm_id}-{xuid}"].add(
-            config.guild_id
-        )
         await config.save()
 
         await ctx.send(
@@ -1078,10 +1061,6 @@ class GuildConfig(utils.Extension):
                 "This user is not in your watchlist."
             ) from None
 
-        self.bot.player_watchlist_store[f"{config.realm_id}-{xuid}"].discard(
-            config.guild_id
-        )
-
         await ctx.send(
             embeds=utils.make_embed(f"Removed `{gamertag}` from the player watchlist.")
         )
@@ -33,6 +33,9 @@ from interactions.ext import paginators
 from interactions.ext import prefixed_commands as prefixed
 from interactions.ext.debug_extension.utils import debug_embed, get_cache_state
 
+import common.config_cache as config_cache
+import common.metrics as metrics
+import common.realm_index as realm_index
 import common.realm_stories as realm_stories
 import common.utils as utils
 from common.models import GuildConfig
@@ -106,6 +109,8 @@ class OwnerCMDs(utils.Extension):
             data["playerlist_chan"] = int(playerlist_chan)
 
         await GuildConfig.prisma().create(data=data)
+        # the realm index picks this up from here
+        await config_cache.CACHE.invalidate(int(guild_id))
         await ctx.send("Done!")
 
     @tansy.slash_command(
@@ -162,6 +167,8 @@ class OwnerCMDs(utils.Extension):
         guild_id: str = tansy.Option("The guild ID for the guild to remove."),
     ) -> None:
         await GuildConfig.prisma().delete(where={"guild_id": int(guild_id)})
+        realm_index.INDEX.remove(int(guild_id))
+        await config_cache.CACHE.invalidate(int(guild_id))
         await ctx.send("Deleted!")
 
     @prefixed.prefixed_command(aliases=["jsk"])
@@ -196,6 +203,49 @@ class OwnerCMDs(utils.Extension):
         e = debug_embed("Cache")
 
         e.description = f"```prolog\n{get_cache_state(self.bot)}\n```"
+
+        # the stats cache lives in valkey, so all we can really show is how it's doing
+        hits = metrics.counter("stats.cache.hit").value
+        misses = metrics.counter("stats.cache.miss").value
+        hit_rate = f" ({hits / (hits + misses):.1%} hit rate)" if hits + misses else ""
+        e.add_field("Stats Results", f"{hits} hits, {misses} misses{hit_rate}")
+
+        local_hits = metrics.counter("gamertags.cache.local_hit").value
+        valkey_hits = metrics.counter("gamertags.cache.valkey_hit").value
+        misses = metrics.counter("gamertags.cache.miss").value
+        total = local_hits + valkey_hits + misses
+        hit_rate = (
+            f" ({local_hits / total:.1%} local, {valkey_hits / total:.1%} valkey)"
+            if total
+            else ""
+        )
+        e.add_field(
+            "Gamertags",
+            f"{len(self.bot.gamertag_cache)} in memory, {local_hits} local hits,"
+            f" {valkey_hits} valkey hits, {misses} misses{hit_rate}",
+        )
+
+        config_hits = metrics.counter("configs.cache.hit").value
+        config_misses = metrics.counter("configs.cache.miss").value
+        config_total = config_hits + config_misses
+        e.add_field(
+            "Guild Configs",
+            f"{len(config_cache.CACHE)} in memory, {config_hits} hits,"
+            f" {config_misses} misses"
+            + (f" ({config_hits / config_total:.1%})" if config_total else ""),
+        )
+
+        await ctx.reply(embeds=[e])
+
+    @debug.subcommand(aliases=["metrics", "stats"])
+    async def metrics_info(
+        self, ctx: prefixed.PrefixedContext, prefix: str = ""
+    ) -> None:
+        """Get the bot's internal metrics, optionally filtered by a prefix."""
+        e = debug_embed("Metrics")
+
+        rendered = metrics.render(prefix) or "No metrics recorded yet."
+        e.description = f"```prolog\n{rendered[:4000]}\n```"
         await ctx.reply(embeds=[e])
 
     @debug.subcommand()
@@ -14,50 +14,127 @@ You should have received a copy of the GNU Affero General Public License along w
 Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import contextlib
+import datetime
 import importlib
 import logging
 import os
-import typing
+import uuid
 
 import elytra
 import interactions as ipy
 
+import common.metrics as metrics
 import common.models as models
 import common.playerlist_events as pl_events
 import common.playerlist_utils as pl_utils
+import common.ratelimits as ratelimits
+import common.realm_index as realm_index
 import common.utils as utils
 
 logger = logging.getLogger("realms_bot")
 
 
+# how many live playerlist messages can be on their way to discord at once
+# discord's global ratelimit is 50 requests a second, and everything else the bot
+# does needs some of that too
+LIVE_SEND_CONCURRENCY = 20
+
+
+def _seconds_since(timestamp: datetime.datetime) -> float:
+    return (datetime.datetime.now(tz=datetime.UTC) - timestamp).total_seconds()
+
+
+def _sorted_lines(mapping: dict[str, str], xuids: set[str]) -> str:
+    return "\n".join(sorted((mapping[p] for p in xuids), key=lambda x: x.lower()))
+
+
+class _LiveRender:
+    """
+    A tick's live playerlist, rendered once and shared between every guild it goes
+    to. Guilds with nicknames for any of its players get their own render, with
+    only those players' entries changed.
+    """
+
+    __slots__ = ("_embeds", "base_embed", "event", "full_mapping", "mapping", "players")
+
+    def __init__(
+        self,
+        event: pl_events.LivePlayerlistSend,
+        players: list[models.PlayerSession],
+        base_embed: ipy.Embed,
+    ) -> None:
+        self.event = event
+        self.base_embed = base_embed
+        self.players = {p.xuid: p for p in players}
+        self.mapping = {xuid: p.base_display() for xuid, p in self.players.items()}
+        self.full_mapping = {xuid: p.display() for xuid, p in self.players.items()}
+        # serialized embeds, keyed by the nicknames that apply to them
+        self._embeds: dict[tuple[tuple[str, str], ...], dict] = {}
+
+    def nicknames_for(self, config: models.GuildConfig) -> tuple[tuple[str, str], ...]:
+        if not config.nicknames:
+            return ()
+        return tuple(
+            sorted(
+                (xuid, config.nicknames[xuid])
+                for xuid in self.players.keys() & config.nicknames.keys()
+            )
+        )
+
+    def full_mapping_for(
+        self, nicknames: tuple[tuple[str, str], ...]
+    ) -> dict[str, str]:
+        if not nicknames:
+            return self.full_mapping
+        return self.full_mapping | {
+            xuid: self.players[xuid].display(nickname) for xuid, nickname in nicknames
+        }
+
+    def embed_for(self, nicknames: tuple[tuple[str, str], ...]) -> dict:
+        if (embed := self._embeds.get(nicknames)) is not None:
+            return embed
+
+        mapping = self.mapping
+        if nicknames:
+            mapping = mapping | {
+                xuid: self.players[xuid].base_display(nickname)
+                for xuid, nickname in nicknames
+            }
+
+        rendered = ipy.Embed.from_dict(self.base_embed.to_dict())
+        if self.event.joined:
+            rendered.add_field(
+                name=f"{os.environ['GREEN_CIRCLE_EMOJI']} Joined",
+                value=_sorted_lines(mapping, self.event.joined),
+            )
+        if self.event.left:
+            rendered.add_field(
+                name=f"{os.environ['GRAY_CIRCLE_EMOJI']} Left",
+                value=_sorted_lines(mapping, self.event.left),
+            )
+
+        embed = self._embeds[nicknames] = rendered.to_dict()
+        return embed
+
+
 class PlayerlistEventHandling(utils.Extension):
     def __init__(self, bot: utils.RealmBotBase) -> None:
         self.bot: utils.RealmBotBase = bot
         self.name = "Playerlist Event Handling"
-
-    @ipy.listen("playerlist_parse_finish", is_default_listener=True)
-    async def on_playerlist_finish(
-        self, event: pl_events.PlayerlistParseFinish
-    ) -> None:
-        async with self.bot.db.batch_() as batch:
-            for container in event.containers:
-                for session in container.player_sessions:
-                    batch.playersession.upsert(
-                        where={"custom_id": session.custom_id},
-                        data={
-                            "create": session.model_dump(exclude_defaults=True),
-                            "update": session.model_dump(include=set(container.fields)),
-                        },  # type: ignore
-                    )
+        self.live_send_sem = asyncio.Semaphore(LIVE_SEND_CONCURRENCY)
 
     @ipy.listen("live_playerlist_send", is_default_listener=True)
     async def on_live_playerlist_send(
         self, event: pl_events.LivePlayerlistSend
     ) -> None:
+        # these sessions are only used for display, so the custom id is
+        # just whatever is handy
         player_sessions = [
             models.PlayerSession(
-                custom_id=self.bot.uuid_cache[f"{event.realm_id}-{p}"],
+                custom_id=self.bot.online_state.session_id(int(event.realm_id), p)
+                or str(uuid.uuid4()),
                 realm_id=event.realm_id,
                 xuid=p,
                 online=True,
@@ -69,7 +146,7 @@ class PlayerlistEventHandling(utils.Extension):
         ]
         player_sessions.extend(
             models.PlayerSession(
-                custom_id=self.bot.uuid_cache[f"{event.realm_id}-{p}"],
+                custom_id=str(uuid.uuid4()),
                 realm_id=event.realm_id,
                 xuid=p,
                 online=False,
@@ -80,13 +157,14 @@ class PlayerlistEventHandling(utils.Extension):
         )
 
         bypass_cache_for = set()
-        if event.realm_id in self.bot.fetch_devices_for:
+        if realm_index.INDEX.fetches_devices(event.realm_id):
             bypass_cache_for.update(p.xuid for p in player_sessions if p.online)
 
         players = await pl_utils.fill_in_gamertags_for_sessions(
             self.bot,
             player_sessions,
             bypass_cache_for=bypass_cache_for,
+            priority=ratelimits.Priority.LIVE,
         )
 
         base_embed = ipy.Embed(
@@ -94,39 +172,42 @@ class PlayerlistEventHandling(utils.Extension):
             timestamp=ipy.Timestamp.fromdatetime(event.timestamp),
         )
         base_embed.set_footer(
-            f"{len(self.bot.online_cache[int(event.realm_id)])} players online"
+            f"{self.bot.online_state.count(int(event.realm_id))} players online"
         )
 
-        for guild_id in self.bot.live_playerlist_store[event.realm_id].copy():
-            config = await models.GuildConfig.get_or_none(guild_id)
+        guild_ids = realm_index.INDEX.live_playerlist_guilds(event.realm_id)
+        if not guild_ids:
+            return
 
-            if not config:
-                self.bot.live_playerlist_store[event.realm_id].discard(guild_id)
-                continue
+        render = _LiveRender(event, players, base_embed)
+
+        # one query for every guild (if that), rather than one per guild
+        configs = await event.live_configs(guild_ids)
+        for guild_id in guild_ids.difference(config.guild_id for config in configs):
+            realm_index.INDEX.remove(guild_id)
+
+        to_send: dict[int, list[tuple[models.GuildConfig, dict]]] = {}
+
+        for config in configs:
+            guild_id = config.guild_id
 
             if not config.valid_premium:
-                await pl_utils.invalidate_premium(self.bot, config)
+                await pl_utils.invalidate_premium(config)
                 continue
 
-            if not config.live_playerlist:
-                self.bot.live_playerlist_store[event.realm_id].discard(guild_id)
+            if not config.live_playerlist or config.realm_id != event.realm_id:
+                realm_index.INDEX.update(config)
                 continue
 
             if not config.playerlist_chan:
                 config.live_playerlist = False
-                self.bot.live_playerlist_store[event.realm_id].discard(guild_id)
                 await config.save()
                 continue
 
             if guild_id in self.bot.unavailable_guilds:
                 continue
 
-            gamertag_mapping = {
-                p.xuid: p.base_display(config.nicknames.get(p.xuid)) for p in players
-            }
-            full_gamertag_mapping = {
-                p.xuid: p.display(config.nicknames.get(p.xuid)) for p in players
-            }
+            nicknames = render.nicknames_for(config)
 
             if config.live_online_channel:
                 self.bot.dispatch(
@@ -135,107 +216,63 @@ class PlayerlistEventHandling(utils.Extension):
                         event.joined,
                         event.left,
                         event.timestamp,
-                        full_gamertag_mapping,
+                        render.full_mapping_for(nicknames),
                         config,
                         realm_down_event=event.realm_down_event,
                     )
                 )
 
-            embed = ipy.Embed.from_dict(base_embed.to_dict())
+            embed = render.embed_for(nicknames)
+            to_send.setdefault(config.playerlist_chan, []).append((config, embed))
 
-            if event.joined:
-                embed.add_field(
-                    name=f"{os.environ['GREEN_CIRCLE_EMOJI']} Joined",
-                    value="\n".join(
-                        sorted(
-                            (gamertag_mapping[p] for p in event.joined),
-                            key=lambda x: x.lower(),
-                        )
-                    ),
-                )
-            if event.left:
-                embed.add_field(
-                    name=f"{os.environ['GRAY_CIRCLE_EMOJI']} Left",
-                    value="\n".join(
-                        sorted(
-                            (gamertag_mapping[p] for p in event.left),
-                            key=lambda x: x.lower(),
-                        )
-                    ),
-                )
-
-            try:
-                chan = utils.partial_channel(self.bot, config.playerlist_chan)
-                await chan.send(embeds=embed)
-            except ValueError:
-                continue
-            except ipy.errors.HTTPException as e:
-                if e.status < 500:
-                    await pl_utils.eventually_invalidate(self.bot, config)
-                    continue
-
-    @ipy.listen("live_online_update", is_default_listener=True)
-    async def on_live_online_update(self, event: pl_events.LiveOnlineUpdate) -> None:
-        xuid_str: str | None = await self.bot.valkey.hget(
-            event.live_online_channel, "xuids"
-        )
-        gamertag_str: str | None = await self.bot.valkey.hget(
-            event.live_online_channel, "gamertags"
-        )
-
-        if typing.TYPE_CHECKING:
-            # a lie, but a harmless one and one needed to make typehints properly work
-            assert isinstance(xuid_str, str)
-            assert isinstance(gamertag_str, str)
-
-        xuids_init: list[str] = xuid_str.split(",") if xuid_str else []
-        gamertags: list[str] = gamertag_str.splitlines() if gamertag_str else []
-
-        event.gamertag_mapping.update(dict(zip(xuids_init, gamertags, strict=True)))
-        reverse_gamertag_map = {v: k for k, v in event.gamertag_mapping.items()}
-
-        xuids: set[str] = set(xuids_init)
-        xuids = xuids.union(event.joined).difference(event.left)
+        if not to_send:
+            return
 
-        gamertag_list = sorted(
-            (event.gamertag_mapping[xuid] for xuid in xuids), key=lambda g: g.lower()
-        )
-        xuid_list = [reverse_gamertag_map[g] for g in gamertag_list]
-
-        new_gamertag_str = "\n".join(gamertag_list)
-
-        await self.bot.valkey.hset(
-            event.live_online_channel, "xuids", ",".join(xuid_list)
-        )
-        await self.bot.valkey.hset(
-            event.live_online_channel, "gamertags", new_gamertag_str
+        # messages to the same channel share a ratelimit bucket on discord's end,
+        # so those go one after another - everything else goes out at once
+        await asyncio.gather(
+            *(
+                self._send_live_playerlists(event, channel_id, sends)
+                for channel_id, sends in to_send.items()
+            )
         )
-
-        if event.realm_down_event:
-            new_gamertag_str = f"{os.environ['GRAY_CIRCLE_EMOJI']} *Realm is offline.*"
-
-        embed = ipy.Embed(
-            title=f"{len(xuids)}/10 people online",
-            description=new_gamertag_str or "*No players online.*",
-            color=self.bot.color,
-            timestamp=event.timestamp,  # type: ignore
+        metrics.timing("live_playerlist.delivery.last").observe(
+            _seconds_since(event.timestamp)
         )
-        embed.set_footer("As of")
 
-        chan_id, msg_id = event.live_online_channel.split("|")
+    async def _send_live_playerlists(
+        self,
+        event: pl_events.LivePlayerlistSend,
+        channel_id: int,
+        sends: list[tuple[models.GuildConfig, dict]],
+    ) -> None:
+        for config, embed in sends:
+            async with self.live_send_sem:
+                try:
+                    chan = utils.partial_channel(self.bot, channel_id)
+                    await chan.send(embeds=embed)
+                except ValueError:
+                    continue
+                except ipy.errors.HTTPException as e:
+                    metrics.counter("live_playerlist.failed").inc()
+                    if e.status < 500:
+                        await pl_utils.eventually_invalidate(self.bot, config)
+                    continue
 
-        fake_msg = ipy.Message(client=self.bot, id=int(msg_id), channel_id=int(chan_id))  # type: ignore
+            metrics.counter("live_playerlist.sent").inc()
+            metrics.timing("live_playerlist.delivery").observe(
+                _seconds_since(event.timestamp)
+            )
 
-        try:
-            await fake_msg.edit(embed=embed)
-        except ipy.errors.HTTPException as e:
-            if e.status < 500:
-                await pl_utils.eventually_invalidate_live_online(self.bot, event.config)
+    @ipy.listen("live_online_update", is_default_listener=True)
+    async def on_live_online_update(self, event: pl_events.LiveOnlineUpdate) -> None:
+        # merged with any other updates for the message that come in soon after
+        self.bot.live_online.submit(event)
 
     @ipy.listen("realm_down", is_default_listener=True)
     async def realm_down(self, event: pl_events.RealmDown) -> None:
         # live playerlists are time sensitive, get them out first
-        if self.bot.live_playerlist_store[event.realm_id]:
+        if realm_index.INDEX.has_live_playerlist(event.realm_id):
             self.bot.dispatch(
                 pl_events.LivePlayerlistSend(
                     event.realm_id,
@@ -292,11 +329,6 @@ class PlayerlistEventHandling(utils.Extension):
 
         for config in await event.configs():
             if not config.playerlist_chan:
-                if config.realm_id and config.live_playerlist:
-                    self.bot.live_playerlist_store[config.realm_id].discard(
-                        config.guild_id
-                    )
-
                 if config.realm_id:
                     self.bot.offline_realms.discard(int(config.realm_id))
 
@@ -349,8 +381,8 @@ class PlayerlistEventHandling(utils.Extension):
                 await chan.send(content=content)
 
         if all(no_playerlist_chan) or not no_playerlist_chan:
-            self.bot.live_playerlist_store.pop(event.realm_id, None)
-            self.bot.fetch_devices_for.discard(event.realm_id)
+            # every config here was unlinked, so the realm index already has
+            # nothing left for this realm
             self.bot.offline_realms.discard(int(event.realm_id))
 
             # we don't want to stop the whole thing, but as of right now i would
@@ -368,9 +400,6 @@ class PlayerlistEventHandling(utils.Extension):
     async def watchlist_notify(self, event: pl_events.PlayerWatchlistMatch) -> None:
         for config in await event.configs():
             if not config.playerlist_chan or not config.player_watchlist:
-                self.bot.player_watchlist_store[
-                    f"{event.realm_id}-{event.player_xuid}"
-                ].discard(config.guild_id)
                 config.player_watchlist = []
                 await config.save()
                 continue
@@ -17,8 +17,6 @@ Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 import asyncio
 import datetime
 import importlib
-import math
-import time
 import typing
 from collections import defaultdict
 
@@ -27,9 +25,16 @@ import interactions as ipy
 import tansy
 
 import common.classes as cclasses
+import common.metrics as metrics
 import common.models as models
 import common.playerlist_events as pl_events
 import common.playerlist_utils as pl_utils
+import common.ratelimits as ratelimits
+import common.realm_index as realm_index
+import common.realm_ticks as realm_ticks
+import common.session_ingest as session_ingest
+import common.stats_cache as stats_cache
+import common.tick_pipeline as tick_pipeline
 import common.utils as utils
 
 
@@ -44,50 +49,40 @@ class Playerlist(utils.Extension):
         self.bot: utils.RealmBotBase = bot
         self.name = "Playerlist Related"
 
-        self.previous_now = datetime.datetime.now(tz=datetime.UTC)
         self.forbidden_count: int = 0
+        self.differ = realm_ticks.RealmDiffer(self.bot.online_state)
+
+        self.pipeline: tick_pipeline.TickPipeline[
+            realm_ticks.FetchedTick, pl_events.PlayerlistParseFinish
+        ] = tick_pipeline.TickPipeline(
+            "playerlist",
+            fetch=self.fetch_realms,
+            diff=self.diff_realms,
+            persist=self.persist_realms,
+            merge=realm_ticks.merge_finish_events,
+            ready=self.bot.fully_ready,
+        )
+        self.consume_task: asyncio.Task | None = None
 
         if utils.FEATURE("PROCESS_REALMS"):
-            self.get_people_task = self.bot.create_task(self.get_people_runner())
+            if utils.FEATURE("EXTERNAL_POLLERS"):
+                # the pollers (see poller.py) do the fetching, diffing and persisting
+                # for us - all that's left is to act on what they found
+                self.consume_task = self.bot.create_task(self.consume_deltas())
+            else:
+                self.pipeline.start(self.bot.create_task)
 
     def drop(self) -> None:
-        if utils.FEATURE("PROCESS_REALMS"):
-            self.get_people_task.cancel()
+        self.pipeline.stop()
+        if self.consume_task:
+            self.consume_task.cancel()
         super().drop()
 
-    def next_time(self) -> ipy.Timestamp:
-        now = ipy.Timestamp.utcnow()
-        # margin of error
-        multiplicity = math.ceil((now.timestamp() + 0.1) / 60)
-        next_time = multiplicity * 60
-        return ipy.Timestamp.utcfromtimestamp(next_time)
-
-    async def get_people_runner(self) -> None:
-        await self.bot.fully_ready.wait()
-        await utils.sleep_until(self.next_time())
-
-        while True:
-            next_time = self.next_time()
-            try:
-                start = time.perf_counter()
-                await self.parse_realms()
-                end = time.perf_counter()
-
-                if self.previous_now.minute in {0, 30}:
-                    ipy.const.get_logger().info(
-                        "Ran parse_realms in %s seconds", round(end - start, 3)
-                    )
-
-                if utils.FEATURE("HANDLE_MISSING_REALMS"):
-                    self.bot.create_task(self.handle_missing_warning())
-            except Exception as e:
-                if not isinstance(e, asyncio.CancelledError):
-                    await utils.error_handle(e)
-                else:
-                    break
-            await utils.sleep_until(next_time)
+    @property
+    def previous_now(self) -> datetime.datetime:
+        return self.differ.previous_now
 
-    async def parse_realms(self) -> None:
+    async def fetch_realms(self) -> realm_ticks.FetchedTick | None:
         try:
             realms = await self.bot.realms.fetch_activities()
             self.forbidden_count = 0
@@ -97,7 +92,7 @@ class Playerlist(utils.Extension):
                 and e.resp.status_code == 502
             ):
                 # bad gateway, can't do much about it
-                return
+                return None
             if (
                 isinstance(e, elytra.MicrosoftAPIException)
                 and e.resp.status_code == 403
@@ -112,139 +107,158 @@ class Playerlist(utils.Extension):
                     )
             raise
 
-        player_objs: list[models.PlayerSession] = []
-        joined_player_objs: list[models.PlayerSession] = []
-        gotten_realm_ids: set[int] = set()
-        now = datetime.datetime.now(tz=datetime.UTC)
-
-        for realm in realms.servers:
-            gotten_realm_ids.add(realm.id)
-            player_set: set[str] = set()
-            joined: set[str] = set()
-
-            for player in realm.players:
-                player_set.add(player.uuid)
-
-                kwargs = {
-                    "custom_id": self.bot.uuid_cache[f"{realm.id}-{player.uuid}"],
-                    "realm_id": str(realm.id),
-                    "xuid": str(player.uuid),
-                    "online": True,
-                    "last_seen": now,
-                }
-
-                if player.uuid not in self.bot.online_cache[realm.id]:
-                    joined.add(player.uuid)
-                    kwargs["joined_at"] = now
-                    joined_player_objs.append(models.PlayerSession(**kwargs))
-
-                    if guild_ids := self.bot.player_watchlist_store[
-                        f"{realm.id}-{player.uuid}"
-                    ]:
+        return realm_ticks.FetchedTick(realms, datetime.datetime.now(tz=datetime.UTC))
+
+    async def diff_realms(
+        self, fetched: realm_ticks.FetchedTick
+    ) -> pl_events.PlayerlistParseFinish:
+        finish_event, tick = self.differ.diff(
+            fetched.realms,
+            fetched.timestamp,
+            diff_only=utils.FEATURE("DIFF_ONLY_PERSISTENCE"),
+        )
+        self.handle_tick(tick)
+        return finish_event
+
+    async def persist_realms(
+        self, finish_event: pl_events.PlayerlistParseFinish
+    ) -> None:
+        await session_ingest.persist_tick(
+            self.bot.db, finish_event, rollup=utils.FEATURE("PLAYTIME_ROLLUPS")
+        )
+        if utils.FEATURE("STATS_CACHE"):
+            # results computed before this tick was persisted are stale now, even
+            # though they're still in the same minute
+            await stats_cache.invalidate_tick(self.bot.valkey, finish_event)
+
+        # dispatched after everything has been written so that anything
+        # listening for this can rely on the database being up to date
+        self.bot.dispatch(finish_event)
+
+    async def consume_deltas(self) -> None:
+        await self.bot.fully_ready.wait()
+
+        # only ticks from here on out matter - anything before this is already in
+        # the database, which is what the online state was loaded from
+        last_id = "$"
+        # the shards that have reported since the last finish event
+        reported_shards: set[int] = set()
+
+        while True:
+            try:
+                response = await self.bot.valkey.xread(
+                    {realm_ticks.DELTA_STREAM: last_id}, count=50, block=60000
+                )
+
+                for entry_id, fields in realm_ticks.stream_entries(response):
+                    last_id = entry_id
+                    tick = realm_ticks.decode_tick(fields["data"])
+
+                    with metrics.timing("playerlist.stage.consume").time():
+                        self.apply_tick(tick)
+                        self.handle_tick(tick)
+
+                    metrics.gauge("playerlist.consume.lag").set(
+                        (
+                            datetime.datetime.now(tz=datetime.UTC) - tick.timestamp
+                        ).total_seconds()
+                    )
+
+                    # every shard sends its own tick each minute, but anything
+                    # waiting on this wants to know that every realm has been dealt
+                    # with, so it only goes out once the last shard has reported
+                    # the pollers already persisted everything before publishing
+                    reported_shards.add(tick.shard)
+                    if len(reported_shards) >= tick.shard_count:
+                        reported_shards.clear()
                         self.bot.dispatch(
-                            pl_events.PlayerWatchlistMatch(
-                                str(realm.id),
-                                player.uuid,
-                                guild_ids,
+                            pl_events.PlayerlistParseFinish(
+                                (), timestamp=tick.timestamp
                             )
                         )
-                else:
-                    player_objs.append(models.PlayerSession(**kwargs))
+            except Exception as e:
+                if isinstance(e, asyncio.CancelledError):
+                    break
 
-            left = self.bot.online_cache[realm.id].difference(player_set)
+                metrics.counter("playerlist.consume.failed").inc()
+                await utils.error_handle(e)
+                await asyncio.sleep(5)
 
-            # if all of the players left, there MAY be a crash, but it's hard
-            # to tell since they could have all just left during that minute
-            # 4 seems like a reasonable threshold to guess for this
-            already_sent_realm_down = False
-            if not player_set and len(left) > 4:
-                self.bot.dispatch(
-                    pl_events.RealmDown(
-                        str(realm.id),
-                        left,
-                        now,
-                    )
+    def apply_tick(self, tick: realm_ticks.TickDeltas) -> None:
+        # keeps our view of who's online in line with what the poller has
+        for delta in tick.deltas:
+            if delta.missing:
+                self.bot.online_state.pop_realm(delta.realm_id)
+                continue
+
+            for session in delta.left:
+                self.bot.online_state.discard(delta.realm_id, session.xuid)
+            for session in delta.joined:
+                self.bot.online_state.add(
+                    delta.realm_id, session.xuid, session.custom_id, session.joined_at
                 )
-                already_sent_realm_down = True
 
-            self.bot.online_cache[realm.id] = player_set
+        if tick.timestamp > self.differ.previous_now:
+            self.differ.previous_now = tick.timestamp
 
-            if realm.id in self.bot.offline_realms:
-                self.bot.offline_realms.discard(realm.id)
-                self.bot.dropped_offline_realms.add(realm.id)
+    def handle_tick(self, tick: realm_ticks.TickDeltas) -> None:
+        now = tick.timestamp
 
-            player_objs.extend(
-                models.PlayerSession(
-                    custom_id=self.bot.uuid_cache.pop(f"{realm.id}-{player}"),
-                    realm_id=str(realm.id),
-                    xuid=player,
-                    online=False,
-                    last_seen=self.previous_now,
-                )
-                for player in left
-            )
-            if (
-                not already_sent_realm_down
-                and self.bot.live_playerlist_store[str(realm.id)]
-                and (joined or left)
-            ):
-                self.bot.dispatch(
-                    pl_events.LivePlayerlistSend(
-                        str(realm.id),
-                        joined,
-                        left,
-                        now,
-                    )
-                )
+        seen_realm_ids = set(tick.seen_realm_ids)
+        for realm_id in self.bot.offline_realms.copy():
+            if realm_id in seen_realm_ids:
+                self.bot.offline_realms.discard(realm_id)
+                self.bot.dropped_offline_realms.add(realm_id)
 
-        online_cache_ids = set(self.bot.online_cache.keys())
-        for missed_realm_id in online_cache_ids.difference(gotten_realm_ids):
-            # adds the missing realm id to the countdown timer dict
+        for delta in tick.deltas:
+            realm_id = str(delta.realm_id)
+            left = {session.xuid for session in delta.left}
 
-            self.bot.offline_realms.add(missed_realm_id)
+            if delta.missing:
+                # adds the missing realm id to the countdown timer dict
+                self.bot.offline_realms.add(delta.realm_id)
 
-            now_invalid = self.bot.online_cache.pop(missed_realm_id, None)
-            if not now_invalid:
+                if left:
+                    self.bot.dispatch(pl_events.RealmDown(realm_id, left, now))
                 continue
 
-            player_objs.extend(
-                models.PlayerSession(
-                    custom_id=self.bot.uuid_cache.pop(f"{missed_realm_id}-{player}"),
-                    realm_id=str(missed_realm_id),
-                    xuid=player,
-                    online=False,
-                    last_seen=self.previous_now,
-                )
-                for player in now_invalid
-            )
-            self.bot.dispatch(
-                pl_events.RealmDown(
-                    str(missed_realm_id),
-                    now_invalid,
-                    now,
-                )
-            )
+            joined = {session.xuid for session in delta.joined}
 
-        self.previous_now = now
+            for xuid in joined:
+                if guild_ids := realm_index.INDEX.watchlist_guilds(realm_id, xuid):
+                    self.bot.dispatch(
+                        pl_events.PlayerWatchlistMatch(realm_id, xuid, guild_ids)
+                    )
 
-        self.bot.dispatch(
-            pl_events.PlayerlistParseFinish(
-                (
-                    pl_utils.RealmPlayersContainer(player_sessions=player_objs),
-                    pl_utils.RealmPlayersContainer(
-                        player_sessions=joined_player_objs, fields=("joined_at",)
-                    ),
+            # if all of the players left, there MAY be a crash, but it's hard
+            # to tell since they could have all just left during that minute
+            # 4 seems like a reasonable threshold to guess for this
+            if not delta.online and len(left) > 4:
+                self.bot.dispatch(pl_events.RealmDown(realm_id, left, now))
+            elif realm_index.INDEX.has_live_playerlist(realm_id):
+                self.bot.dispatch(
+                    pl_events.LivePlayerlistSend(realm_id, joined, left, now)
                 )
+
+        if utils.FEATURE("HANDLE_MISSING_REALMS"):
+            self.bot.create_task(
+                self.handle_missing_warning(tick.shard, tick.shard_count)
             )
-        )
 
-    async def handle_missing_warning(self) -> None:
+    async def handle_missing_warning(
+        self, shard: int = 0, shard_count: int = 1
+    ) -> None:
         # basically, for every realm that has been determined to be offline/missing -
         # increase its value by one. if it increases more than a set value,
         # try to warn the user about the realm not being there
         # ideally, this should run every minute
+        # with pollers, this runs once per poller for the realms that poller handles
 
-        offline_realms = self.bot.offline_realms.copy()
+        offline_realms = [
+            realm_id
+            for realm_id in self.bot.offline_realms
+            if realm_ticks.in_partition(realm_id, shard, shard_count)
+        ]
 
         async with self.bot.valkey.pipeline() as pipe:
             for realm_id in offline_realms:
@@ -341,7 +355,7 @@ class Playerlist(utils.Extension):
                     config = await models.GuildConfig.prisma().find_unique_or_raise(
                         where={"guild_id": config.guild_id}
                     )
-                await pl_utils.invalidate_premium(self.bot, config)
+                await pl_utils.invalidate_premium(config)
             else:
                 bypass_cache_for = {p.xuid for p in player_sessions if p.online}
 
@@ -350,6 +364,11 @@ class Playerlist(utils.Extension):
             player_sessions,
             bypass_cache_for=bypass_cache_for,
             gamertag_map=gamertag_map,
+            priority=(
+                ratelimits.Priority.AUTORUNNER
+                if autorunner
+                else ratelimits.Priority.INTERACTIVE
+            ),
         )
 
         online_list = sorted(
@@ -483,7 +502,7 @@ class Playerlist(utils.Extension):
             if config.valid_premium:
                 bypass_cache = True
             else:
-                await pl_utils.invalidate_premium(self.bot, config)
+                await pl_utils.invalidate_premium(config)
 
         playerlist = await pl_utils.fill_in_gamertags_for_sessions(
             self.bot,
@@ -519,4 +538,8 @@ def setup(bot: utils.RealmBotBase) -> None:
     importlib.reload(cclasses)
     importlib.reload(pl_events)
     importlib.reload(pl_utils)
+    importlib.reload(session_ingest)
+    importlib.reload(stats_cache)
+    importlib.reload(realm_ticks)
+    importlib.reload(tick_pipeline)
     Playerlist(bot)
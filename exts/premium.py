@@ -23,6 +23,8 @@ import interactions as ipy
 import tansy
 
 import common.classes as cclasses
+import common.config_cache as config_cache
+import common.live_online as live_online
 import common.models as models
 import common.playerlist_utils as pl_utils
 import common.premium_utils as premium_utils
@@ -150,6 +152,7 @@ class PremiumHandling(utils.Extension):
             data={"premium_code": {"connect": {"id": code_obj.id}}},
             where={"guild_id": ctx.guild_id},
         )
+        await config_cache.CACHE.invalidate(int(ctx.guild_id))
 
         code_obj = await models.PremiumCode.prisma().update(
             data={"uses": {"increment": 1}}, where={"id": code_obj.id}
@@ -188,11 +191,6 @@ class PremiumHandling(utils.Extension):
                 " running this."
             )
 
-        if toggle:
-            self.bot.live_playerlist_store[config.realm_id].add(config.guild_id)
-        else:
-            self.bot.live_playerlist_store[config.realm_id].discard(config.guild_id)
-
         config.live_playerlist = toggle
         await config.save()
         await ctx.send(
@@ -261,13 +259,9 @@ class PremiumHandling(utils.Extension):
         )
         xuids = ",".join(p.xuid for p in online_list)
 
-        embed = ipy.Embed(
-            title=f"{len(online_list)}/10 people online",
-            description=online_str or "*No players online.*",
-            color=self.bot.color,
-            timestamp=ipy.Timestamp.utcnow(),
+        embed = live_online.build_embed(
+            self.bot.color, len(online_list), online_str, ipy.Timestamp.utcnow()
         )
-        embed.set_footer("As of")
 
         try:
             msg = await ctx.channel.send(embed=embed)
@@ -278,11 +272,16 @@ class PremiumHandling(utils.Extension):
                 " History`, and `Embed Links` enabled for this channel."
             ) from None
 
+        if config.live_online_channel:
+            self.bot.live_online.discard(config.live_online_channel)
+
         config.live_online_channel = f"{msg._channel_id}|{msg.id}"
         await config.save()
 
-        await self.bot.valkey.hset(config.live_online_channel, "xuids", xuids)
-        await self.bot.valkey.hset(config.live_online_channel, "gamertags", online_str)
+        await self.bot.valkey.hset(
+            config.live_online_channel,
+            mapping={"xuids": xuids, "gamertags": online_str},
+        )
 
         await ctx.send(embeds=utils.make_embed("Done!"), ephemeral=True)
 
@@ -353,7 +352,6 @@ class PremiumHandling(utils.Extension):
                 else:
                     config.fetch_devices = True
                     await config.save()
-                    self.bot.fetch_devices_for.add(config.realm_id)
 
                     result = "Turned on displaying devices."
             except TimeoutError:
@@ -372,11 +370,6 @@ class PremiumHandling(utils.Extension):
 
             await ctx.send(embeds=utils.make_embed("Turned off displaying devices."))
 
-            if not await models.GuildConfig.prisma().count(
-                where={"realm_id": config.realm_id, "fetch_devices": True}
-            ):
-                self.bot.fetch_devices_for.discard(config.realm_id)
-
     @premium.subcommand(
         sub_cmd_name="export",
         sub_cmd_description=(
@@ -397,7 +390,7 @@ class PremiumHandling(utils.Extension):
         csv_entries: list[str] = ["xuid,gamertag,online,last_seen,joined_at"]
 
         sessions = await models.PlayerSession.prisma().find_many(
-            where={"realm_id": config.realm_id, "NOT": [{"joined_at": None}]},
+            where={"realm_id": config.realm_id},
             order={"last_seen": "desc"},
         )
         gamertags = await pl_utils.get_xuid_to_gamertag_map(
@@ -581,6 +574,7 @@ class PremiumHandling(utils.Extension):
             data={"premium_code": {"connect": {"id": code.id}}},
             where={"guild_id": int(entitlement._guild_id)},
         )
+        await config_cache.CACHE.invalidate(int(entitlement._guild_id))
         await models.PremiumCode.prisma().update(
             data={"uses": {"increment": 1}}, where={"id": code.id}
         )
@@ -601,6 +595,7 @@ class PremiumHandling(utils.Extension):
             data={"expires_at": entitlement.ends_at},
             where={"customer_id": str(entitlement.subscription_id)},
         )
+        await config_cache.CACHE.invalidate(int(entitlement._guild_id))
 
     @ipy.listen(ipy.events.EntitlementDelete)
     async def entitlement_delete(self, event: ipy.events.EntitlementDelete) -> None:
@@ -616,6 +611,7 @@ class PremiumHandling(utils.Extension):
         await models.PremiumCode.prisma().delete_many(
             where={"customer_id": str(entitlement.subscription_id)}
         )
+        await config_cache.CACHE.invalidate(int(entitlement._guild_id))
 
 
 def setup(bot: utils.RealmBotBase) -> None:
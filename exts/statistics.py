@@ -15,6 +15,7 @@ Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 """
 
 import datetime
+import functools
 import importlib
 import typing
 
@@ -101,13 +102,15 @@ class Statistics(utils.Extension):
             unformated_title,
             indivdual=individual,
         )
-        time_data, datetimes_used = await stats_utils.process_single_graph_data(
+        time_data, earliest_datetime = await stats_utils.process_single_graph_data(
+            ctx.bot,
             config,
             min_datetime=returned_data.min_datetime,
             now=now,
             func_to_use=returned_data.func_to_use,
             gamertag=gamertag,
             filter_kwargs=filter_kwargs,
+            deadline=stats_utils.interaction_deadline(ctx),
         )
         graph = stats_utils.create_single_graph(
             ctx,
@@ -123,7 +126,7 @@ class Statistics(utils.Extension):
             now=now,
             title=returned_data.formatted_title,
             min_datetime=returned_data.min_datetime,
-            datetimes_used=datetimes_used,
+            earliest_datetime=earliest_datetime,
         )
 
     async def make_summary_single_graph(
@@ -141,13 +144,15 @@ class Statistics(utils.Extension):
         returned_data = await stats_utils.process_summary(
             ctx, now, summarize_by, unformated_title
         )
-        time_data, datetimes_used = await stats_utils.process_single_graph_data(
+        time_data, earliest_datetime = await stats_utils.process_single_graph_data(
+            ctx.bot,
             config,
             min_datetime=returned_data.min_datetime,
             now=now,
             func_to_use=returned_data.func_to_use,
             gamertag=gamertag,
             filter_kwargs=filter_kwargs,
+            deadline=stats_utils.interaction_deadline(ctx),
         )
         graph = stats_utils.create_single_graph(
             ctx,
@@ -163,7 +168,7 @@ class Statistics(utils.Extension):
             now=now,
             title=returned_data.formatted_title,
             min_datetime=returned_data.min_datetime,
-            datetimes_used=datetimes_used,
+            earliest_datetime=earliest_datetime,
         )
 
     graph = tansy.SlashCommand(
@@ -186,8 +191,7 @@ class Statistics(utils.Extension):
         self,
         ctx: utils.RealmContext,
         period: str = tansy.Option(
-            "The period to graph by. Periods larger than 7 days requires a vote or"
-            " Premium.",
+            "The period to graph by.",
             choices=stats_utils.GATED_PERIOD_TO_GRAPH,
         ),
     ) -> None:
@@ -207,8 +211,7 @@ class Statistics(utils.Extension):
         self,
         ctx: utils.RealmContext,
         summarize_by: str = tansy.Option(
-            "What to summarize by. Periods larger than 7 days requires a vote or"
-            " Premium.",
+            "What to summarize by.",
             choices=stats_utils.GATED_SUMMARIZE_BY,
         ),
     ) -> None:
@@ -231,8 +234,7 @@ class Statistics(utils.Extension):
         ctx: utils.RealmContext,
         gamertag: str = tansy.Option("The gamertag of the user to graph."),
         period: str = tansy.Option(
-            "The period to graph by. Periods larger than 7 days requires a vote or"
-            " Premium.",
+            "The period to graph by.",
             choices=stats_utils.GATED_PERIOD_TO_GRAPH,
         ),
     ) -> None:
@@ -262,8 +264,7 @@ class Statistics(utils.Extension):
         ctx: utils.RealmContext,
         gamertag: str = tansy.Option("The gamertag of the user to graph."),
         summarize_by: str = tansy.Option(
-            "What to summarize by. Periods larger than 7 days requires a vote or"
-            " Premium.",
+            "What to summarize by.",
             choices=stats_utils.GATED_SUMMARIZE_BY,
         ),
     ) -> None:
@@ -292,8 +293,7 @@ class Statistics(utils.Extension):
         self,
         ctx: utils.RealmContext,
         period: str = tansy.Option(
-            "The period to graph by. Periods larger than 7 days requires a vote or"
-            " Premium.",
+            "The period to graph by.",
             choices=stats_utils.GATED_PERIOD_TO_GRAPH,
         ),
     ) -> None:
@@ -332,8 +332,7 @@ class Statistics(utils.Extension):
         self,
         ctx: utils.RealmContext,
         summarize_by: str = tansy.Option(
-            "What to summarize by. Periods larger than 7 days requires a vote or"
-            " Premium.",
+            "What to summarize by.",
             choices=stats_utils.GATED_SUMMARIZE_BY,
         ),
     ) -> None:
@@ -412,12 +411,14 @@ class Statistics(utils.Extension):
         config = await ctx.fetch_config()
 
         time_data, earliest_datetime = await stats_utils.process_multi_graph_data(
+            ctx.bot,
             config,
             xuid_list,
             gamertag_list=gamertags,
             min_datetime=returned_data.min_datetime,
             now=now,
             func_to_use=returned_data.func_to_use,
+            deadline=stats_utils.interaction_deadline(ctx),
         )
         graph = stats_utils.create_multi_graph(
             ctx,
@@ -527,21 +528,18 @@ class Statistics(utils.Extension):
         time_delta = datetime.timedelta(days=period, minutes=1)
         min_datetime = now - time_delta
 
-        datetimes = await stats_utils.gather_datetimes(config, min_datetime)
-
-        earliest_datetime = min(d.joined_at for d in datetimes)
-        warn_about_earliest = (
-            min_datetime + datetime.timedelta(days=1) < earliest_datetime
+        first_page = await stats_utils.process_leaderboard_page(
+            self.bot, config, 0, min_datetime=min_datetime, now=now
         )
-
-        leaderboard_counter_sort = stats_utils.calc_leaderboard(datetimes)
-        if not leaderboard_counter_sort:
+        if not first_page.entries or not first_page.earliest:
             raise utils.CustomCheckFailure(
                 "There's no data for the linked Realm for this timespan."
             )
 
-        if kwargs.get("autorunner"):
-            leaderboard_counter_sort = leaderboard_counter_sort[:20]
+        leaderboard_counter_sort = first_page.entries
+        warn_about_earliest = (
+            min_datetime + datetime.timedelta(days=1) < first_page.earliest
+        )
 
         period_str = period_resolver(period)
 
@@ -558,10 +556,18 @@ class Statistics(utils.Extension):
             )
             await ctx.send(embed=embed)
 
-        if len(leaderboard_counter_sort) > +20:
+        # autorunners only ever send the first page
+        if first_page.total > len(first_page.entries) and not kwargs.get("autorunner"):
             pag = cclasses.DynamicLeaderboardPaginator(
                 client=self.bot,
-                pages_data=leaderboard_counter_sort,
+                fetch_page=functools.partial(
+                    stats_utils.process_leaderboard_page,
+                    self.bot,
+                    config,
+                    min_datetime=min_datetime,
+                    now=now,
+                ),
+                first_page=first_page,
                 period_str=period_str,
                 timestamp=now,
                 nicknames=config.nicknames,
@@ -21,7 +21,6 @@ import functools
 import logging
 import os
 import typing
-import uuid
 from collections import defaultdict
 
 import rpl_config
@@ -54,8 +53,16 @@ from interactions.ext import prefixed_commands as prefixed
 from prisma import Prisma
 
 import common.classes as cclasses
+import common.compute_pool as compute_pool
+import common.config_cache as config_cache
+import common.gamertag_cache as gamertag_cache
+import common.gamertag_resolver as gamertag_resolver
 import common.help_tools as help_tools
+import common.live_online as live_online
 import common.models as models
+import common.online_state as online_state
+import common.ratelimits as ratelimits
+import common.realm_index as realm_index
 import common.utils as utils
 
 if typing.TYPE_CHECKING:
@@ -119,6 +126,10 @@ class RealmsPlayerlistBot(utils.RealmBotBase):
         # but too many things depend on fully_ready being set for me to remove it
         self.fully_ready.set()
 
+        if utils.FEATURE("LOCAL_GAMERTAG_CACHE"):
+            self.create_task(self.gamertag_cache.listen(self.valkey))
+        self.create_task(config_cache.CACHE.listen(self.valkey))
+
     @ipy.listen("ready")
     async def on_ready(self) -> None:
         # dms bot owner on every ready noting if the bot is coming up or reconnecting
@@ -289,6 +300,7 @@ class RealmsPlayerlistBot(utils.RealmBotBase):
         await bot.realms.close()
         await bot.db.disconnect()
         await bot.valkey.aclose(close_connection_pool=True)
+        compute_pool.shutdown()
 
         return await super().stop()
 
@@ -336,20 +348,31 @@ bot.unavailable_guilds = set()
 bot.init_load = True
 bot.bot_owner = None  # type: ignore
 bot.color = ipy.Color(int(os.environ["BOT_COLOR"]))  # c156e0, aka 12670688
-bot.online_cache = defaultdict(set)
+bot.online_state = online_state.OnlineState()
+# with the local cache off, everything goes straight through to valkey
+bot.gamertag_cache = gamertag_cache.GamertagCache(
+    max_entries=(
+        gamertag_cache.MAX_ENTRIES if utils.FEATURE("LOCAL_GAMERTAG_CACHE") else 0
+    )
+)
+bot.gamertag_resolver = gamertag_resolver.GamertagResolver(bot)
+bot.live_online = live_online.LiveOnlineRenderer(bot)
+# same goes for guild configs and the database
+if not utils.FEATURE("CONFIG_CACHE"):
+    config_cache.CACHE.max_entries = 0
+# the realm index has to hear about config changes no matter what
+config_cache.CACHE.invalidation_hooks.append(realm_index.INDEX.schedule_refresh)
 bot.slash_perms_cache = defaultdict(dict)
-bot.live_playerlist_store = defaultdict(set)
-bot.player_watchlist_store = defaultdict(set)
-bot.uuid_cache = defaultdict(lambda: str(uuid.uuid4()))
 bot.mini_commands_per_scope = {}
 bot.offline_realms = cclasses.OrderedSet()
 bot.dropped_offline_realms = set()
-bot.fetch_devices_for = set()
 bot.background_tasks = set()
 bot.blacklist = set()
 
 
 async def start() -> None:
+    await compute_pool.start()
+
     db = Prisma(
         auto_register=True,
         datasource={"url": os.environ["DB_URL"]},
@@ -362,6 +385,7 @@ async def start() -> None:
         os.environ["VALKEY_URL"],
         decode_responses=True,
     )
+    config_cache.CACHE.valkey = bot.valkey
 
     if blacklist_raw := await bot.valkey.get("rpl-blacklist"):
         bot.blacklist = set(orjson.loads(blacklist_raw))
@@ -380,66 +404,38 @@ async def start() -> None:
     )
     if num_updated > 0:
         # we've reset all online entries, reset live online channels too
-        for config in await models.GuildConfig.prisma().find_many(
-            where={"NOT": [{"live_online_channel": None}]}
-        ):
-            await bot.valkey.hset(config.live_online_channel, "xuids", "")
-            await bot.valkey.hset(config.live_online_channel, "gamertags", "")
+        async with bot.valkey.pipeline() as pipe:
+            for config in await models.GuildConfig.prisma().find_many(
+                where={"NOT": [{"live_online_channel": None}]}
+            ):
+                pipe.hset(
+                    config.live_online_channel,
+                    mapping={"xuids": "", "gamertags": ""},
+                )
+            await pipe.execute()
 
     # add all online players to the online cache
     for player in await models.PlayerSession.prisma().find_many(where={"online": True}):
-        bot.uuid_cache[player.realm_xuid_id] = player.custom_id
-        bot.online_cache[int(player.realm_id)].add(player.xuid)
+        bot.online_state.add(
+            int(player.realm_id), player.xuid, player.custom_id, player.joined_at
+        )
 
     if utils.FEATURE("HANDLE_MISSING_REALMS"):
         async for realm_id in bot.valkey.scan_iter("missing-realm-*"):
             bot.offline_realms.add(int(realm_id.removeprefix("missing-realm-")))
 
-    for config in await models.GuildConfig.prisma().find_many(
-        where={
-            "NOT": [
-                {
-                    "realm_id": None,
-                    "playerlist_chan": None,
-                    "player_watchlist": {"is_empty": True},
-                },
-            ]
-        }
-    ):
-        for player_xuid in config.player_watchlist:
-            bot.player_watchlist_store[f"{config.realm_id}-{player_xuid}"].add(
-                config.guild_id
-            )
+    # which guilds want what from each realm - live playerlists, devices, and
+    # watchlist pings all come from this
+    configs = await realm_index.INDEX.rebuild()
 
-    # add info for who has premium features on and has valid premium
-    for config in await models.GuildConfig.prisma().find_many(
-        where={
-            "NOT": [
-                {"premium_code_id": None, "realm_id": None},
-            ],
-            "OR": [  # i honestly still cant believe this is all typehinted
-                {"premium_code": {"is": {"expires_at": None}}},
-                {
-                    "premium_code": {
-                        "is": {
-                            "expires_at": {
-                                "gt": ipy.Timestamp.utcnow()
-                                - datetime.timedelta(days=1)
-                            }
-                        }
-                    }
-                },
-            ],
-        },
-        include={"premium_code": True},
-    ):
-        if config.playerlist_chan and config.live_playerlist:
-            bot.live_playerlist_store[config.realm_id].add(config.guild_id)  # type: ignore
-        if config.fetch_devices:
-            bot.fetch_devices_for.add(config.realm_id)
+    if utils.FEATURE("CONFIG_CACHE"):
+        # every config with a realm is going to be needed for playerlist events
+        # sooner or later, so may as well keep them all now
+        for config in configs:
+            config_cache.CACHE.put(config)
 
     bot.fully_ready = asyncio.Event()
-    bot.pl_sem = asyncio.Semaphore(12)  # TODO: maybe increase this?
+    bot.ratelimits = ratelimits.RateLimitScheduler()
 
     bot.xbox = await elytra.XboxAPI.from_file(
         os.environ["XBOX_CLIENT_ID"],
@@ -452,6 +448,7 @@ async def start() -> None:
         os.environ["XAPI_TOKENS_LOCATION"],
     )
     bot.own_gamertag = bot.xbox.auth_mgr.xsts_token.gamertag
+    bot.xbox.session.event_hooks["response"].append(bot.ratelimits.on_xbox_response)
 
     headers = {
         "X-Authorization": os.environ["OPENXBL_KEY"],
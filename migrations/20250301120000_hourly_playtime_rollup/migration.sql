@@ -0,0 +1,42 @@
+-- AlterTable
+ALTER TABLE "realmplayersession" ADD COLUMN     "rolled_up_to" TIMESTAMPTZ(6);
+
+-- CreateTable
+CREATE TABLE "realmplayerhourlyplaytime" (
+    "realm_id" VARCHAR(50) NOT NULL,
+    "xuid" VARCHAR(50) NOT NULL,
+    "hour" TIMESTAMPTZ(6) NOT NULL,
+    "minutes" INTEGER NOT NULL DEFAULT 0,
+
+    CONSTRAINT "realmplayerhourlyplaytime_pkey" PRIMARY KEY ("realm_id","xuid","hour")
+);
+
+-- CreateIndex
+CREATE INDEX "realmplayerhourlyplaytime_realm_id_hour_idx" ON "realmplayerhourlyplaytime"("realm_id", "hour");
+
+-- Backfill the rollups from the sessions that already exist
+-- (same as the rollup in common/playtime_rollup.py, just for everything at once)
+WITH "pending" AS (
+    SELECT "custom_id", "realm_id", "xuid",
+        date_trunc('minute', "joined_at", 'UTC') AS "start",
+        date_trunc('minute', "last_seen", 'UTC') AS "end"
+    FROM "realmplayersession"
+    WHERE "joined_at" IS NOT NULL
+        AND date_trunc('minute', "last_seen", 'UTC') > date_trunc('minute', "joined_at", 'UTC')
+), "marked" AS (
+    UPDATE "realmplayersession" AS "session" SET "rolled_up_to" = "pending"."end"
+    FROM "pending" WHERE "session"."custom_id" = "pending"."custom_id"
+)
+INSERT INTO "realmplayerhourlyplaytime" ("realm_id", "xuid", "hour", "minutes")
+SELECT "pending"."realm_id", "pending"."xuid", "hours"."hour",
+    sum(
+        extract(epoch FROM least("pending"."end", "hours"."hour" + interval '1 hour')
+        - greatest("pending"."start", "hours"."hour")) / 60
+    )::int
+FROM "pending"
+CROSS JOIN LATERAL generate_series(
+    date_trunc('hour', "pending"."start", 'UTC'),
+    "pending"."end" - interval '1 minute',
+    interval '1 hour'
+) AS "hours"("hour")
+GROUP BY 1, 2, 3;
@@ -0,0 +1,16 @@
+-- CreateIndex
+CREATE INDEX "realmplayersession_realm_id_last_seen_idx" ON "realmplayersession"("realm_id", "last_seen");
+
+-- CreateIndex
+CREATE INDEX "realmplayersession_realm_id_joined_at_idx" ON "realmplayersession"("realm_id", "joined_at");
+
+-- CreateIndex
+CREATE INDEX "realmplayersession_realm_id_xuid_last_seen_idx" ON "realmplayersession"("realm_id", "xuid", "last_seen");
+
+-- CreateIndex
+CREATE INDEX "realmplayersession_online_last_seen_idx" ON "realmplayersession"("online", "last_seen");
+
+-- Prisma can't describe partial indexes, so this one only lives here
+-- only a tiny fraction of sessions are online at once, and the playerlist and the
+-- last seen bump every minute only care about those
+CREATE INDEX "realmplayersession_online_realm_id_idx" ON "realmplayersession"("realm_id") WHERE "online";
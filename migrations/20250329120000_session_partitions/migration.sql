@@ -0,0 +1,84 @@
+-- realmplayersession becomes range partitioned by week on joined_at, so that old
+-- sessions can be dropped a partition at a time instead of with one huge delete
+-- partitioning on last_seen would mean moving every online session between
+-- partitions whenever it crosses a week, since it's bumped every minute
+-- new partitions are made ahead of time by the bot, see common/session_partitions.py
+
+-- the partition key has to be part of the primary key, and so can't be null
+-- sessions without a joined_at never counted towards any stats, so the closest
+-- thing to keep them around as is starting and ending them at the same time
+UPDATE "realmplayersession" SET "joined_at" = "last_seen" WHERE "joined_at" IS NULL;
+
+ALTER TABLE "realmplayersession" RENAME TO "realmplayersession_unpartitioned";
+ALTER TABLE "realmplayersession_unpartitioned" RENAME CONSTRAINT "realmplayersession_pkey" TO "realmplayersession_unpartitioned_pkey";
+DROP INDEX "realmplayersession_realm_id_last_seen_idx";
+DROP INDEX "realmplayersession_realm_id_joined_at_idx";
+DROP INDEX "realmplayersession_realm_id_xuid_last_seen_idx";
+DROP INDEX "realmplayersession_online_last_seen_idx";
+DROP INDEX "realmplayersession_online_realm_id_idx";
+
+-- CreateTable
+CREATE TABLE "realmplayersession" (
+    "custom_id" UUID NOT NULL,
+    "realm_id" VARCHAR(50) NOT NULL,
+    "xuid" VARCHAR(50) NOT NULL,
+    "online" BOOLEAN NOT NULL DEFAULT false,
+    "last_seen" TIMESTAMPTZ(6) NOT NULL,
+    "joined_at" TIMESTAMPTZ(6) NOT NULL,
+    "rolled_up_to" TIMESTAMPTZ(6),
+
+    CONSTRAINT "realmplayersession_pkey" PRIMARY KEY ("custom_id","joined_at")
+) PARTITION BY RANGE ("joined_at");
+
+-- anything that doesn't fit in a weekly partition goes here
+CREATE TABLE "realmplayersession_default" PARTITION OF "realmplayersession" DEFAULT;
+
+-- one partition for every week that has sessions in it, up to four weeks from now
+DO $$
+DECLARE
+    "week" timestamptz;
+BEGIN
+    FOR "week" IN
+        SELECT generate_series(
+            least(
+                date_trunc('week', (SELECT min("joined_at") FROM "realmplayersession_unpartitioned"), 'UTC'),
+                date_trunc('week', now(), 'UTC')
+            ),
+            date_trunc('week', now(), 'UTC') + interval '4 weeks',
+            interval '1 week'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF "realmplayersession" FOR VALUES FROM (%L) TO (%L)',
+            'realmplayersession_p' || to_char("week" AT TIME ZONE 'UTC', 'YYYYMMDD'),
+            "week",
+            "week" + interval '1 week'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO "realmplayersession"
+    ("custom_id", "realm_id", "xuid", "online", "last_seen", "joined_at", "rolled_up_to")
+SELECT "custom_id", "realm_id", "xuid", "online", "last_seen", "joined_at", "rolled_up_to"
+FROM "realmplayersession_unpartitioned";
+
+DROP TABLE "realmplayersession_unpartitioned";
+
+-- indexes on the partitioned table are created on every partition, including
+-- ones made later on
+
+-- CreateIndex
+CREATE INDEX "realmplayersession_realm_id_last_seen_idx" ON "realmplayersession"("realm_id", "last_seen");
+
+-- CreateIndex
+CREATE INDEX "realmplayersession_realm_id_joined_at_idx" ON "realmplayersession"("realm_id", "joined_at");
+
+-- CreateIndex
+CREATE INDEX "realmplayersession_realm_id_xuid_last_seen_idx" ON "realmplayersession"("realm_id", "xuid", "last_seen");
+
+-- CreateIndex
+CREATE INDEX "realmplayersession_online_last_seen_idx" ON "realmplayersession"("online", "last_seen");
+
+CREATE INDEX "realmplayersession_online_realm_id_idx" ON "realmplayersession"("realm_id") WHERE "online";
+
+ANALYZE "realmplayersession";
@@ -0,0 +1,14 @@
+-- CreateTable
+CREATE TABLE "realmplayerprofile" (
+    "xuid" VARCHAR(50) NOT NULL,
+    "gamertag" VARCHAR(50) NOT NULL,
+    "updated_at" TIMESTAMPTZ(6) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "last_device" VARCHAR(50),
+
+    CONSTRAINT "realmplayerprofile_pkey" PRIMARY KEY ("xuid")
+);
+
+-- CreateIndex
+-- prisma can't describe expression indexes, this is for looking up xuids by
+-- gamertag without caring about case
+CREATE INDEX "realmplayerprofile_lower_gamertag_idx" ON "realmplayerprofile"(lower("gamertag"));
@@ -0,0 +1,4 @@
+-- CreateIndex
+-- the periodic playtime rollup looks for every session seen recently, no matter
+-- the realm or if it's still online
+CREATE INDEX "realmplayersession_last_seen_idx" ON "realmplayersession"("last_seen");
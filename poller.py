@@ -0,0 +1,248 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# a standalone worker that does the realm fetching, diffing and persisting that
+# the bot otherwise does itself, but only for a slice of the realms
+# run one of these per shard, with POLLER_SHARD set to 0 through
+# POLLER_SHARD_COUNT - 1, and set EXTERNAL_POLLERS in the bot's DEBUG config
+# so it listens for what these find instead of polling itself
+
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+
+import rpl_config
+
+rpl_config.load()
+
+SHARD = int(os.environ.get("POLLER_SHARD", "0"))
+SHARD_COUNT = int(os.environ.get("POLLER_SHARD_COUNT", "1"))
+
+# the stream only needs to hold enough for bots to catch up after a hiccup
+STREAM_MAXLEN = 10000
+
+logger = logging.getLogger("realms_bot")
+logger.setLevel(logging.INFO)
+handler = logging.FileHandler(
+    filename=f"{os.environ['DIRECTORY_OF_BOT']}/poller-{SHARD}.log",
+    encoding="utf-8",
+    mode="a",
+)
+handler.setFormatter(
+    logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s")
+)
+logger.addHandler(handler)
+
+import elytra
+import sentry_sdk
+import valkey.asyncio as aiovalkey
+from prisma import Prisma
+
+import common.models as models
+import common.online_state as online_state
+import common.playerlist_events as pl_events
+import common.realm_ticks as realm_ticks
+import common.session_ingest as session_ingest
+import common.stats_cache as stats_cache
+import common.tick_pipeline as tick_pipeline
+import common.utils as utils
+
+if not utils.FEATURE("PRINT_TRACKBACK_FOR_ERRORS") and utils.SENTRY_ENABLED:
+    sentry_sdk.init(dsn=os.environ["SENTRY_DSN"])
+
+# what gets persisted, and the ticks to publish once it has been
+# there's more than one tick if earlier ones couldn't be persisted
+type Diffed = tuple[pl_events.PlayerlistParseFinish, list[realm_ticks.TickDeltas]]
+
+
+def merge_diffed(older: Diffed, newer: Diffed) -> Diffed:
+    return (
+        realm_ticks.merge_finish_events(older[0], newer[0]),
+        older[1] + newer[1],
+    )
+
+
+class Poller:
+    def __init__(
+        self,
+        db: Prisma,
+        valkey: aiovalkey.Valkey,
+        realms: elytra.BedrockRealmsAPI,
+        state: online_state.OnlineState,
+    ) -> None:
+        self.db = db
+        self.valkey = valkey
+        self.realms = realms
+        self.forbidden_count: int = 0
+
+        self.state = state
+
+        self.differ = realm_ticks.RealmDiffer(
+            state, shard=SHARD, shard_count=SHARD_COUNT
+        )
+        self.pipeline: tick_pipeline.TickPipeline[realm_ticks.FetchedTick, Diffed] = (
+            tick_pipeline.TickPipeline(
+                f"poller.{SHARD}",
+                fetch=self.fetch,
+                diff=self.diff,
+                persist=self.persist,
+                merge=merge_diffed,
+            )
+        )
+
+    async def fetch(self) -> realm_ticks.FetchedTick | None:
+        # every poller has to fetch every realm - there's no way to ask for
+        # only some of them - but the diffing and writing is what's expensive
+        try:
+            realms = await self.realms.fetch_activities()
+            self.forbidden_count = 0
+        except elytra.MicrosoftAPIException as e:
+            if e.resp.status_code == 502:
+                # bad gateway, can't do much about it
+                return None
+            if e.resp.status_code == 403:
+                self.forbidden_count += 1
+                if self.forbidden_count > 3:
+                    logger.error(
+                        "Got forbidden 3+ times in a row. High chance account is"
+                        " banned - please manually check to verify this."
+                    )
+            raise
+
+        return realm_ticks.FetchedTick(realms, datetime.datetime.now(tz=datetime.UTC))
+
+    async def diff(self, fetched: realm_ticks.FetchedTick) -> Diffed:
+        finish_event, tick = self.differ.diff(
+            fetched.realms,
+            fetched.timestamp,
+            diff_only=utils.FEATURE("DIFF_ONLY_PERSISTENCE"),
+        )
+        return finish_event, [tick]
+
+    async def persist(self, diffed: Diffed) -> None:
+        finish_event, ticks = diffed
+        await session_ingest.persist_tick(
+            self.db, finish_event, rollup=utils.FEATURE("PLAYTIME_ROLLUPS")
+        )
+
+        # published even if nothing changed, as the bots use the list of seen
+        # realms (and the tick itself) to keep track of missing realms
+        # also published after persisting so the bots can rely on the database
+        # being up to date, same as when they poll themselves
+        # the stats cache is invalidated in the same go, for the same reason
+        # this is a transaction, so either everything goes out or nothing does
+        async with self.valkey.pipeline() as pipe:
+            if utils.FEATURE("STATS_CACHE"):
+                stats_cache.queue_invalidate(
+                    pipe, stats_cache.changed_realm_ids(finish_event)
+                )
+            for tick in ticks:
+                pipe.xadd(
+                    realm_ticks.DELTA_STREAM,
+                    {"data": realm_ticks.encode_tick(tick)},
+                    maxlen=STREAM_MAXLEN,
+                    approximate=True,
+                )
+            await pipe.execute()
+
+        # cleared so that retrying this after a failure doesn't publish any of
+        # them twice
+        ticks.clear()
+
+    async def consume_closed(self) -> None:
+        # the bot closes sessions that haven't been seen in a while itself,
+        # so we need to forget about the ones in our realms too
+        last_id = "$"
+
+        while True:
+            try:
+                response = await self.valkey.xread(
+                    {realm_ticks.CLOSED_STREAM: last_id}, block=60000
+                )
+
+                for entry_id, fields in realm_ticks.stream_entries(response):
+                    last_id = entry_id
+                    for realm_id, xuid in realm_ticks.decode_closed(fields["data"]):
+                        if realm_ticks.in_partition(realm_id, SHARD, SHARD_COUNT):
+                            self.state.discard(realm_id, xuid)
+            except Exception as e:
+                if isinstance(e, asyncio.CancelledError):
+                    break
+
+                logger.exception("Failed to read closed sessions.")
+                await asyncio.sleep(5)
+
+
+async def start() -> None:
+    if not 0 <= SHARD < SHARD_COUNT:
+        raise ValueError(
+            f"POLLER_SHARD must be between 0 and {SHARD_COUNT - 1}, got {SHARD}."
+        )
+
+    db = Prisma(
+        auto_register=True,
+        datasource={"url": os.environ["DB_URL"]},
+        http={"http2": True},
+    )
+    await db.connect()
+
+    valkey = aiovalkey.Valkey.from_url(
+        os.environ["VALKEY_URL"],
+        decode_responses=True,
+    )
+
+    # pick up who's online for our realms, so the first tick doesn't think
+    # everyone just joined
+    state = online_state.OnlineState()
+    for player in await models.PlayerSession.prisma().find_many(where={"online": True}):
+        realm_id = int(player.realm_id)
+        if realm_ticks.in_partition(realm_id, SHARD, SHARD_COUNT):
+            state.add(realm_id, player.xuid, player.custom_id, player.joined_at)
+
+    realms = await elytra.BedrockRealmsAPI.from_file(
+        os.environ["XBOX_CLIENT_ID"],
+        os.environ["XBOX_CLIENT_SECRET"],
+        os.environ["XAPI_TOKENS_LOCATION"],
+    )
+
+    poller = Poller(db, valkey, realms, state)
+    poller.pipeline.start()
+    closed_task = asyncio.create_task(poller.consume_closed())
+    logger.info("Poller %s/%s started.", SHARD, SHARD_COUNT)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        poller.pipeline.stop()
+        closed_task.cancel()
+        await realms.close()
+        await db.disconnect()
+        await valkey.aclose(close_connection_pool=True)
+
+
+if __name__ == "__main__":
+    run_method = asyncio.run
+
+    # use uvloop if possible
+    with contextlib.suppress(ImportError):
+        import uvloop  # type: ignore
+
+        run_method = uvloop.run
+
+    with contextlib.suppress(KeyboardInterrupt):
+        run_method(start())
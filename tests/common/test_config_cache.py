@@ -0,0 +1,107 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import typing
+
+import pydantic
+
+import common.config_cache as config_cache
+
+
+# stands in for GuildConfig, which needs a generated prisma client
+class FakeConfig(pydantic.BaseModel):
+    guild_id: int
+    realm_id: str | None = None
+    premium_code_id: int | None = None
+    premium_code: dict[str, typing.Any] | None = None
+    nicknames: dict[str, str] = {}
+
+
+class FakeValkey:
+    def __init__(self) -> None:
+        self.published: list[tuple[str, bytes]] = []
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        self.published.append((channel, message))
+
+
+def test_configs_are_copied() -> None:
+    cache = config_cache.ConfigCache()
+    config = FakeConfig(guild_id=1)
+    cache.put(config)  # type: ignore
+
+    config.nicknames["1"] = "changed"
+    cached = cache.get(1)
+    assert cached is not None and cached.nicknames == {}
+
+    cached.nicknames["1"] = "changed"
+    assert cache.get(1).nicknames == {}  # type: ignore
+    assert cache.get(2) is None
+
+
+def test_configs_without_their_premium_code_are_not_kept() -> None:
+    cache = config_cache.ConfigCache()
+    cache.put(FakeConfig(guild_id=1, premium_code_id=5))  # type: ignore
+    assert cache.get(1) is None
+
+    cache.put(
+        FakeConfig(guild_id=1, premium_code_id=5, premium_code={})  # type: ignore
+    )
+    assert cache.get(1) is not None
+
+
+def test_least_recently_used_is_evicted_and_entries_expire() -> None:
+    cache = config_cache.ConfigCache(max_entries=2)
+    cache.put(FakeConfig(guild_id=1))  # type: ignore
+    cache.put(FakeConfig(guild_id=2))  # type: ignore
+    assert cache.get(1) is not None
+
+    cache.put(FakeConfig(guild_id=3))  # type: ignore
+    assert len(cache) == 2
+    assert cache.get(2) is None
+
+    cache = config_cache.ConfigCache(ttl=-1)
+    cache.put(FakeConfig(guild_id=1))  # type: ignore
+    assert cache.get(1) is None
+
+    # how the cache is turned off
+    cache = config_cache.ConfigCache(max_entries=0)
+    cache.put(FakeConfig(guild_id=1))  # type: ignore
+    assert len(cache) == 0
+
+
+def test_store_publishes_and_others_drop_it() -> None:
+    cache = config_cache.ConfigCache()
+    cache.valkey = FakeValkey()  # type: ignore
+    cache.put(FakeConfig(guild_id=1, realm_id="r"))  # type: ignore
+
+    asyncio.run(cache.store(FakeConfig(guild_id=1, realm_id="s")))  # type: ignore
+    [(channel, message)] = cache.valkey.published  # type: ignore
+    assert channel == config_cache.INVALIDATION_CHANNEL
+    assert cache.get(1).realm_id == "s"  # type: ignore
+
+    # our own messages are ignored
+    cache.handle_invalidation(message)
+    assert cache.get(1) is not None
+
+    changed: list[int | None] = []
+    other = config_cache.ConfigCache()
+    other.invalidation_hooks.append(changed.append)
+    other.put(FakeConfig(guild_id=1, realm_id="r"))  # type: ignore
+    other.handle_invalidation(message)
+    assert other.get(1) is None
+    assert changed == [1]
@@ -0,0 +1,137 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import time
+
+import orjson
+
+import common.gamertag_cache as gamertag_cache
+
+
+class FakePipeline:
+    def __init__(self, data: dict[str, str]) -> None:
+        self.data = data
+        self.queued: list[str] = []
+        self.expiries: dict[str, int] = {}
+        self.published: list[tuple[str, bytes]] = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        pass
+
+    def get(self, key: str) -> None:
+        self.queued.append(key)
+
+    # the real thing is always called with keywords, so this keeps the names
+    def setex(self, name: str, time: int, value: str) -> None:
+        self.data[name] = value
+        self.expiries[name] = time
+
+    def publish(self, channel: str, message: bytes) -> None:
+        self.published.append((channel, message))
+
+    async def execute(self) -> list[str | None]:
+        results = [self.data.get(key) for key in self.queued]
+        self.queued = []
+        return results
+
+
+class FakeValkey:
+    def __init__(self, data: dict[str, str]) -> None:
+        self.data = data
+        self.pipelines: list[FakePipeline] = []
+
+    def pipeline(self) -> FakePipeline:
+        pipe = FakePipeline(self.data)
+        self.pipelines.append(pipe)
+        return pipe
+
+    async def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+
+def test_lookups_only_go_to_valkey_once() -> None:
+    cache = gamertag_cache.GamertagCache()
+    valkey = FakeValkey({"rpl-xuid-1": "One", "rpl-xuid-2": "Two"})
+
+    first = asyncio.run(cache.get_gamertags(valkey, ["1", "2", "3"]))  # type: ignore
+    assert first == {"1": "One", "2": "Two", "3": None}
+
+    second = asyncio.run(cache.get_gamertags(valkey, ["1", "2"]))  # type: ignore
+    assert second == {"1": "One", "2": "Two"}
+    assert len(valkey.pipelines) == 1
+
+    # the reverse direction gets filled in too
+    assert asyncio.run(cache.get_xuid(valkey, "Two")) == "2"  # type: ignore
+
+
+def test_least_recently_used_is_evicted() -> None:
+    cache = gamertag_cache.GamertagCache(max_entries=2)
+    cache.put("1", "One")
+    cache.put("2", "Two")
+
+    now = time.monotonic()
+    assert cache._gamertags.get("1", now) == "One"
+
+    cache.put("3", "Three")
+    assert len(cache) == 2
+    assert cache._gamertags.get("2", now) is None
+    assert cache._xuids.get("Two", now) is None
+
+
+def test_entries_expire() -> None:
+    cache = gamertag_cache.GamertagCache(ttl=10)
+    cache.put("1", "One")
+
+    assert cache._gamertags.get("1", time.monotonic() + 20) is None
+
+
+def test_store_replaces_old_mappings_and_publishes() -> None:
+    cache = gamertag_cache.GamertagCache()
+    cache.put("1", "OldName")
+
+    pipe = FakePipeline({})
+    cache.queue_store(pipe, {"1": "NewName"}, 60)  # type: ignore
+
+    now = time.monotonic()
+    assert cache._gamertags.get("1", now) == "NewName"
+    assert cache._xuids.get("OldName", now) is None
+    assert pipe.data == {"rpl-xuid-1": "NewName", "rpl-gt-NewName": "1"}
+    assert pipe.expiries == {"rpl-xuid-1": 60, "rpl-gt-NewName": 60}
+
+    [(channel, message)] = pipe.published
+    assert channel == gamertag_cache.INVALIDATION_CHANNEL
+
+    # our own messages are ignored, but everyone else drops what they had
+    cache.handle_invalidation(message)
+    assert cache._gamertags.get("1", now) == "NewName"
+
+    other = gamertag_cache.GamertagCache()
+    other.put("1", "OldName")
+    other.handle_invalidation(message)
+    assert other._gamertags.get("1", now) is None
+    assert other._xuids.get("OldName", now) is None
+
+
+def test_invalidation_message_format() -> None:
+    cache = gamertag_cache.GamertagCache()
+    cache.put("1", "One")
+    cache.handle_invalidation(orjson.dumps({"origin": "else", "pairs": [["1", "Uno"]]}))
+
+    assert len(cache) == 0
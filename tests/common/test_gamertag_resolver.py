@@ -0,0 +1,191 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import gc
+import typing
+
+import pytest
+
+import common.gamertag_resolver as gamertag_resolver
+import common.playerlist_utils as pl_utils
+import common.ratelimits as ratelimits
+
+
+class FakeBot:
+    openxbl_session = None
+
+    def create_task(self, coro: typing.Coroutine) -> asyncio.Task:
+        return asyncio.create_task(coro)
+
+
+class FakeHandler:
+    """Stands in for GamertagHandler, remembering every batch it was made for."""
+
+    batches: typing.ClassVar[list[tuple[str, ...]]] = []
+    # made fresh for each batch, as a traceback would keep the batch around
+    error: typing.ClassVar[type[Exception] | None] = None
+    # lets a test hold a batch open until it's ready for it to finish
+    release: typing.ClassVar[asyncio.Event | None] = None
+
+    def __init__(
+        self,
+        _: object,
+        xuids_to_get: tuple[str, ...],
+        __: object,
+        *,
+        gather_devices_for: set[str],
+        priority: ratelimits.Priority,
+    ) -> None:
+        self.xuids_to_get = xuids_to_get
+        self.gather_devices_for = gather_devices_for
+        self.priority = priority
+        self.batches.append(xuids_to_get)
+
+    async def stream(
+        self,
+    ) -> typing.AsyncGenerator[dict[str, pl_utils.GamertagInfo], None]:
+        if self.release:
+            await self.release.wait()
+        if self.error:
+            raise self.error("peoplehub is down")
+
+        yield {
+            xuid: pl_utils.GamertagInfo(
+                f"gt{xuid}", "Android" if xuid in self.gather_devices_for else None
+            )
+            for xuid in self.xuids_to_get
+            if xuid != "unknown"
+        }
+
+
+@pytest.fixture(autouse=True)
+def fake_handler(monkeypatch: pytest.MonkeyPatch) -> type[FakeHandler]:
+    FakeHandler.batches = []
+    FakeHandler.error = None
+    FakeHandler.release = None
+    monkeypatch.setattr(pl_utils, "GamertagHandler", FakeHandler)
+    return FakeHandler
+
+
+def test_duplicates_are_coalesced() -> None:
+    async def run() -> tuple[dict, dict]:
+        resolver = gamertag_resolver.GamertagResolver(FakeBot())  # type: ignore
+        return await asyncio.gather(
+            resolver.resolve(["1", "2", "2", "", "unknown"]),
+            resolver.resolve(["2", "3", "1"]),
+        )
+
+    first, second = asyncio.run(run())
+
+    assert first == {
+        "1": pl_utils.GamertagInfo("gt1"),
+        "2": pl_utils.GamertagInfo("gt2"),
+    }
+    assert second == {
+        "1": pl_utils.GamertagInfo("gt1"),
+        "2": pl_utils.GamertagInfo("gt2"),
+        "3": pl_utils.GamertagInfo("gt3"),
+    }
+    # everything asked for at once goes out together, and only once each
+    assert FakeHandler.batches == [("1", "2", "unknown", "3")]
+
+
+def test_in_flight_xuids_are_shared() -> None:
+    async def run() -> tuple[dict, dict]:
+        FakeHandler.release = asyncio.Event()
+        resolver = gamertag_resolver.GamertagResolver(FakeBot())  # type: ignore
+
+        first = asyncio.create_task(resolver.resolve(["1", "2"]))
+        await asyncio.sleep(gamertag_resolver.COALESCE_WINDOW * 2)
+        # the first batch is out by now, but hasn't come back
+        second = asyncio.create_task(resolver.resolve(["2", "3"]))
+        await asyncio.sleep(gamertag_resolver.COALESCE_WINDOW * 2)
+
+        FakeHandler.release.set()
+        return await first, await second
+
+    first, second = asyncio.run(run())
+
+    assert first.keys() == {"1", "2"}
+    assert second.keys() == {"2", "3"}
+    assert FakeHandler.batches == [("1", "2"), ("3",)]
+
+
+def test_devices_upgrade_pending_fetch() -> None:
+    async def run() -> tuple[dict, dict]:
+        resolver = gamertag_resolver.GamertagResolver(FakeBot())  # type: ignore
+        return await asyncio.gather(
+            resolver.resolve(["1"]),
+            resolver.resolve(["1"], gather_devices_for={"1"}),
+        )
+
+    first, second = asyncio.run(run())
+
+    assert first == second == {"1": pl_utils.GamertagInfo("gt1", "Android")}
+    assert FakeHandler.batches == [("1",)]
+
+
+def test_batch_failure_reaches_everyone_waiting() -> None:
+    FakeHandler.error = RuntimeError
+
+    async def run() -> list[dict | BaseException]:
+        resolver = gamertag_resolver.GamertagResolver(FakeBot())  # type: ignore
+        return await asyncio.gather(
+            resolver.resolve(["1", "2"]),
+            resolver.resolve(["2"]),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    # both share the one batch, and so the one exception
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] is results[0]
+    assert FakeHandler.batches == [("1", "2")]
+
+
+def test_batch_failure_after_callers_gave_up() -> None:
+    FakeHandler.error = RuntimeError
+    unhandled: list[dict[str, typing.Any]] = []
+
+    async def run() -> None:
+        asyncio.get_running_loop().set_exception_handler(
+            lambda _, context: unhandled.append(context)
+        )
+        FakeHandler.release = asyncio.Event()
+        resolver = gamertag_resolver.GamertagResolver(FakeBot())  # type: ignore
+
+        waiting = asyncio.create_task(resolver.resolve(["1", "2"]))
+        await asyncio.sleep(gamertag_resolver.COALESCE_WINDOW * 2)
+        waiting.cancel()
+        await asyncio.sleep(0)
+
+        FakeHandler.release.set()
+        # lets the batch fail
+        await asyncio.sleep(gamertag_resolver.COALESCE_WINDOW * 2)
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        # exceptions that were never retrieved get reported once their futures
+        # are garbage collected
+        del resolver
+        gc.collect()
+
+    asyncio.run(run())
+
+    assert unhandled == []
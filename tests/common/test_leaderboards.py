@@ -0,0 +1,195 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# makes sure the leaderboard worked out in sql comes out exactly like
+# calc_leaderboard, both from the sessions and from the hourly rollups
+# like the query plan tests, this needs a postgres database with the migrations
+# applied that's fine to wipe. run with:
+# PLAN_CHECK_DB_URL=postgresql://... \
+#     python -m pytest tests/common/test_leaderboards.py
+# and it's skipped otherwise
+
+import asyncio
+import datetime
+import os
+import random
+import typing
+import uuid
+
+import pytest
+
+DB_URL = os.environ.get("PLAN_CHECK_DB_URL")
+if not DB_URL:
+    pytest.skip("PLAN_CHECK_DB_URL is not set.", allow_module_level=True)
+
+from prisma import Prisma
+
+import common.leaderboards as leaderboards
+import common.playtime_rollup as playtime_rollup
+import common.stats_utils as stats_utils
+
+REALM_ID = "7"
+# deliberately not on the hour or minute, so the rollups have to make up for
+# the part of the hour before the window
+WINDOW_START = datetime.datetime(2024, 5, 8, 13, 23, 17, 250000, tzinfo=datetime.UTC)
+HOUR = datetime.timedelta(hours=1)
+MINUTE = datetime.timedelta(minutes=1)
+
+# the event loop, the client, and the sessions as they are in the database
+type Database = tuple[asyncio.AbstractEventLoop, Prisma, list[Session]]
+
+INSERT = """
+INSERT INTO "realmplayersession"
+    ("custom_id", "realm_id", "xuid", "online", "last_seen", "joined_at")
+VALUES ($1::uuid, $2, $3, $4, $5::timestamptz, $6::timestamptz)
+"""
+BUMP = """
+UPDATE "realmplayersession" SET "last_seen" = $3::timestamptz
+WHERE "custom_id" = $1::uuid AND "joined_at" = $2::timestamptz
+"""
+
+
+class Session(typing.NamedTuple):
+    custom_id: str
+    xuid: str
+    joined_at: datetime.datetime
+    last_seen: datetime.datetime
+    online: bool
+
+
+def make_sessions() -> list[Session]:
+    rng = random.Random(7)  # noqa: S311
+    sessions: list[Session] = []
+
+    def add(
+        xuid: str,
+        joined_at: datetime.datetime,
+        last_seen: datetime.datetime,
+        *,
+        online: bool = False,
+    ) -> None:
+        sessions.append(Session(str(uuid.uuid4()), xuid, joined_at, last_seen, online))
+
+    # a few dozen players, so there's more than one page
+    for i in range(45):
+        xuid = str(2535400000000000 + i)
+        cursor = WINDOW_START - datetime.timedelta(seconds=rng.randrange(6 * 3600))
+        for _ in range(rng.randrange(1, 6)):
+            joined_at = cursor + datetime.timedelta(
+                seconds=rng.randrange(7200), microseconds=rng.randrange(1_000_000)
+            )
+            last_seen = joined_at + datetime.timedelta(
+                seconds=rng.randrange(10, 4 * 3600),
+                microseconds=rng.randrange(1_000_000),
+            )
+            add(xuid, joined_at, last_seen)
+            cursor = last_seen
+
+    # crosses the start of the window, so it's left out entirely
+    add("1", WINDOW_START - 10 * MINUTE, WINDOW_START + 50 * MINUTE)
+    # joins right as the window starts
+    add("2", WINDOW_START, WINDOW_START + 2 * HOUR + 30 * MINUTE)
+    # joins just before the window, in the same hour and minute as its start
+    add("3", WINDOW_START - datetime.timedelta(seconds=2), WINDOW_START + 3 * HOUR)
+    # under a minute, and within the same minute - so no time at all
+    add("4", WINDOW_START + 5 * MINUTE, WINDOW_START + 5 * MINUTE + MINUTE / 4)
+    # a tie with the one that joined at the start of the window
+    add("5", WINDOW_START + 3 * HOUR, WINDOW_START + 5 * HOUR + 30 * MINUTE)
+    # still online
+    add("6", WINDOW_START + 20 * HOUR, WINDOW_START + 22 * HOUR, online=True)
+    # no xuid, which never makes it onto the leaderboard
+    add("", WINDOW_START + HOUR, WINDOW_START + 2 * HOUR)
+
+    return sessions
+
+
+def expected(sessions: list[Session]) -> list[tuple[str, int]]:
+    # ties are in the order players show up in for calc_leaderboard, and by
+    # xuid in sql - going through them by xuid makes those the same
+    return stats_utils.calc_leaderboard(
+        stats_utils.GatherDatetimesReturn(s.xuid, s.joined_at, s.last_seen)
+        for s in sorted(sessions, key=lambda s: (s.xuid, s.joined_at))
+        if s.joined_at >= WINDOW_START
+    )
+
+
+@pytest.fixture(scope="module")
+def database() -> typing.Generator[Database, None, None]:
+    loop = asyncio.new_event_loop()
+    db = Prisma(datasource={"url": DB_URL})
+    sessions = make_sessions()
+
+    async def setup() -> list[Session]:
+        await db.connect()
+        await db.execute_raw(
+            'TRUNCATE "realmplayersession", "realmplayerhourlyplaytime"'
+        )
+
+        for session in sessions:
+            await db.execute_raw(
+                INSERT,
+                session.custom_id,
+                REALM_ID,
+                session.xuid,
+                session.online,
+                session.last_seen,
+                session.joined_at,
+            )
+        await playtime_rollup.rollup_sessions(
+            db, [(s.custom_id, s.joined_at) for s in sessions]
+        )
+
+        # some players keep playing after being rolled up, so that the rollups
+        # are partly behind like they'd normally be
+        bumped = sessions.copy()
+        for index, session in enumerate(sessions[::7]):
+            last_seen = session.last_seen + (index % 4 + 1) * 17 * MINUTE
+            await db.execute_raw(BUMP, session.custom_id, session.joined_at, last_seen)
+            bumped[index * 7] = session._replace(last_seen=last_seen)
+        return bumped
+
+    sessions = loop.run_until_complete(setup())
+    yield loop, db, sessions
+    loop.run_until_complete(db.disconnect())
+    loop.close()
+
+
+@pytest.mark.parametrize("rollups", [False, True])
+def test_leaderboard_matches_calc_leaderboard(
+    database: Database, rollups: bool
+) -> None:
+    loop, db, sessions = database
+    calculated = expected(sessions)
+    assert len(calculated) > leaderboards.PAGE_SIZE
+
+    async def fetch_all() -> list[leaderboards.LeaderboardPage]:
+        pages: list[leaderboards.LeaderboardPage] = []
+        while True:
+            page = await leaderboards.fetch_page(
+                REALM_ID, WINDOW_START, len(pages), rollups=rollups, db=db
+            )
+            if not page.entries:
+                return pages
+            pages.append(page)
+
+    pages = loop.run_until_complete(fetch_all())
+
+    assert [entry for page in pages for entry in page.entries] == calculated
+    assert all(page.total == len(calculated) for page in pages)
+    assert all(len(page.entries) == leaderboards.PAGE_SIZE for page in pages[:-1])
+    assert pages[0].earliest == min(
+        s.joined_at for s in sessions if s.joined_at >= WINDOW_START
+    ).replace(microsecond=0)
@@ -0,0 +1,150 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import datetime
+import types
+import typing
+
+import interactions as ipy
+import pytest
+
+import common.live_online as live_online
+
+KEY = "123|456"
+START = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+
+class FakeValkey:
+    def __init__(self) -> None:
+        self.data: dict[str, dict[str, str]] = {}
+
+    async def hmget(self, key: str, fields: tuple[str, ...]) -> list[str | None]:
+        return [self.data.get(key, {}).get(field) for field in fields]
+
+    async def hset(self, key: str, mapping: dict[str, str]) -> None:
+        self.data.setdefault(key, {}).update(mapping)
+
+
+class FakeBot:
+    color = ipy.Color(0)
+
+    def __init__(self) -> None:
+        self.valkey = FakeValkey()
+
+    def create_task(self, coro: typing.Coroutine) -> asyncio.Task:
+        return asyncio.create_task(coro)
+
+
+class FakeMessage:
+    """Stands in for the message being edited, remembering every edit made."""
+
+    edits: typing.ClassVar[list[ipy.Embed]] = []
+
+    def __init__(self, **_: typing.Any) -> None:
+        pass
+
+    async def edit(self, *, embed: ipy.Embed) -> None:
+        self.edits.append(embed)
+
+
+@pytest.fixture(autouse=True)
+def fake_message(monkeypatch: pytest.MonkeyPatch) -> None:
+    FakeMessage.edits = []
+    monkeypatch.setattr(live_online.ipy, "Message", FakeMessage)
+    monkeypatch.setattr(live_online, "COALESCE_WINDOW", 0.01)
+
+
+def update(
+    minute: int,
+    *,
+    joined: typing.Iterable[str] = (),
+    left: typing.Iterable[str] = (),
+) -> typing.Any:
+    # stands in for LiveOnlineUpdate, which needs a GuildConfig
+    return types.SimpleNamespace(
+        live_online_channel=KEY,
+        joined=set(joined),
+        left=set(left),
+        gamertag_mapping={xuid: f"Player {xuid}" for xuid in joined},
+        timestamp=START + datetime.timedelta(minutes=minute),
+        realm_down_event=False,
+        config=None,
+    )
+
+
+async def settle() -> None:
+    await asyncio.sleep(live_online.COALESCE_WINDOW * 5)
+
+
+def test_updates_in_one_window_make_one_edit() -> None:
+    async def run() -> None:
+        renderer = live_online.LiveOnlineRenderer(FakeBot())  # type: ignore
+        renderer.submit(update(0, joined={"1", "2"}))
+        renderer.submit(update(1, joined={"3"}, left={"1"}))
+        renderer.submit(update(2, left={"3"}))
+        await settle()
+
+    asyncio.run(run())
+
+    assert len(FakeMessage.edits) == 1
+    embed = FakeMessage.edits[0]
+    assert embed.title == "1/10 people online"
+    assert embed.description == "Player 2"
+    # the latest update's time is what's shown
+    assert embed.timestamp == START + datetime.timedelta(minutes=2)
+
+
+def test_unchanged_embed_is_not_edited() -> None:
+    async def run() -> None:
+        renderer = live_online.LiveOnlineRenderer(FakeBot())  # type: ignore
+        renderer.submit(update(0, joined={"1"}))
+        await settle()
+
+        # joining again, or a join and leave that cancel out, changes nothing
+        renderer.submit(update(1, joined={"1"}))
+        await settle()
+        renderer.submit(update(2, joined={"2"}))
+        renderer.submit(update(3, left={"2"}))
+        await settle()
+
+        # but a real change still goes through
+        renderer.submit(update(4, joined={"2"}))
+        await settle()
+
+    asyncio.run(run())
+
+    assert [embed.description for embed in FakeMessage.edits] == [
+        "Player 1",
+        "Player 1\nPlayer 2",
+    ]
+
+
+def test_discard_forgets_what_was_shown() -> None:
+    async def run() -> None:
+        renderer = live_online.LiveOnlineRenderer(FakeBot())  # type: ignore
+        renderer.submit(update(0, joined={"1"}))
+        await settle()
+
+        # a new message for the same channel has to be edited even if the
+        # list itself is the same
+        renderer.discard(KEY)
+        renderer.submit(update(1))
+        await settle()
+
+    asyncio.run(run())
+
+    assert len(FakeMessage.edits) == 2
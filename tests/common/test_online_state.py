@@ -0,0 +1,175 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import collections
+import datetime
+import uuid
+
+from common.online_state import OnlineState, RealmDiff
+
+START = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+
+class DictState:
+    """
+    What OnlineState replaced - a dict of sets of online xuids, and a dict of
+    "realm_id-xuid" to session ids that makes a new one for anyone it hasn't seen.
+    """
+
+    def __init__(self) -> None:
+        self.online_cache: collections.defaultdict[int, set[str]] = (
+            collections.defaultdict(set)
+        )
+        self.uuid_cache: collections.defaultdict[str, str] = collections.defaultdict(
+            lambda: str(uuid.uuid4())
+        )
+
+    def update(
+        self, realm_id: int, xuids: list[str]
+    ) -> tuple[set[str], dict[str, str], set[str]]:
+        player_set = set(xuids)
+        # the old code looked up everyone online's id every tick, making
+        # one for whoever didn't have one yet
+        for xuid in player_set:
+            self.uuid_cache[f"{realm_id}-{xuid}"]
+
+        joined = player_set.difference(self.online_cache[realm_id])
+        left = self.online_cache[realm_id].difference(player_set)
+        stayed = player_set.intersection(self.online_cache[realm_id])
+        self.online_cache[realm_id] = player_set
+
+        return (
+            joined,
+            {xuid: self.uuid_cache.pop(f"{realm_id}-{xuid}") for xuid in left},
+            stayed,
+        )
+
+
+def test_update_matches_dicts() -> None:
+    state = OnlineState()
+    dicts = DictState()
+    # dict session id -> OnlineState session id
+    issued: dict[str, str] = {}
+
+    ticks = [
+        ["1000000000000001", "1000000000000002"],  # both join
+        ["1000000000000002", "1000000000000001"],  # both stay, out of order
+        ["1000000000000002", "1000000000000003", "1000000000000003"],  # duplicate
+        ["1000000000000003"],  # 2 leaves
+        ["1000000000000003", "1000000000000002"],  # 2 rejoins
+        [],  # everyone leaves
+    ]
+    for minute, xuids in enumerate(ticks):
+        diff = state.update(7, xuids, START + datetime.timedelta(minutes=minute))
+        joined, left, stayed = dicts.update(7, xuids)
+
+        # session ids are random, so the dicts' ids are mapped to the ones
+        # OnlineState made - both have to agree for anyone who stayed or left
+        for session in diff.joined:
+            issued[dicts.uuid_cache[f"7-{session.xuid}"]] = session.custom_id
+        for session in diff.left:
+            assert issued.pop(left[session.xuid]) == session.custom_id
+
+        assert {s.xuid for s in diff.joined} == joined
+        assert {s.xuid for s in diff.left} == set(left)
+        assert diff.stayed == len(stayed)
+        assert diff.online == len(joined) + len(stayed)
+        assert sorted(state.xuids(7)) == sorted(dicts.online_cache[7])
+        for xuid in dicts.online_cache[7]:
+            assert state.session_id(7, xuid) == issued[dicts.uuid_cache[f"7-{xuid}"]]
+
+    assert 7 in state
+    assert state.count(7) == 0
+
+
+def test_join_stay_leave() -> None:
+    state = OnlineState()
+
+    diff = state.update(1, ["1000000000000001"], START)
+    assert diff.left == []
+    assert [s.xuid for s in diff.joined] == ["1000000000000001"]
+    assert diff.joined[0].joined_at == START
+    session_id = diff.joined[0].custom_id
+
+    diff = state.update(1, ["1000000000000001"], START + datetime.timedelta(minutes=1))
+    assert diff == RealmDiff([], [], 1)
+    assert diff.stayed == 1
+    assert state.session_id(1, "1000000000000001") == session_id
+    assert state.sessions(1)[0].joined_at == START
+
+    diff = state.update(1, [], START + datetime.timedelta(minutes=2))
+    assert diff.joined == []
+    assert [(s.xuid, s.custom_id, s.joined_at) for s in diff.left] == [
+        ("1000000000000001", session_id, START)
+    ]
+    assert not state.is_online(1, "1000000000000001")
+
+
+def test_rejoin_gets_new_session() -> None:
+    state = OnlineState()
+
+    first = state.update(1, ["1000000000000001"], START).joined[0]
+    state.update(1, [], START + datetime.timedelta(minutes=1))
+    rejoined = state.update(
+        1, ["1000000000000001"], START + datetime.timedelta(minutes=2)
+    ).joined[0]
+
+    assert rejoined.custom_id != first.custom_id
+    assert rejoined.joined_at == START + datetime.timedelta(minutes=2)
+
+
+def test_realms_are_separate() -> None:
+    state = OnlineState()
+
+    state.update(1, ["1000000000000001"], START)
+    diff = state.update(2, ["1000000000000001"], START)
+
+    assert [s.xuid for s in diff.joined] == ["1000000000000001"]
+    assert state.session_id(1, "1000000000000001") != state.session_id(
+        2, "1000000000000001"
+    )
+
+
+def test_odd_xuids() -> None:
+    # anything that isn't a plain 16 digit number is interned instead
+    state = OnlineState()
+    xuids = ["0123", "not a xuid", "99999999999999999999", "1000000000000001"]
+
+    diff = state.update(1, xuids, START)
+    assert {s.xuid for s in diff.joined} == set(xuids)
+
+    diff = state.update(1, ["not a xuid"], START + datetime.timedelta(minutes=1))
+    assert {s.xuid for s in diff.left} == set(xuids) - {"not a xuid"}
+    assert state.xuids(1) == ["not a xuid"]
+
+
+def test_realm_removal() -> None:
+    state = OnlineState()
+
+    joined = state.update(1, ["1000000000000002", "1000000000000001"], START).joined
+    state.update(2, ["1000000000000001"], START)
+
+    removed = state.pop_realm(1)
+    assert removed is not None
+    assert sorted(removed) == sorted(joined)
+    assert 1 not in state
+    assert state.realm_ids() == [2]
+    assert state.pop_realm(1) is None
+
+    # coming back is the same as being seen for the first time
+    diff = state.update(1, ["1000000000000001"], START + datetime.timedelta(minutes=1))
+    assert [s.xuid for s in diff.joined] == ["1000000000000001"]
+    assert diff.left == []
@@ -0,0 +1,165 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import heapq
+import time
+
+import pytest
+
+import common.ratelimits as ratelimits
+
+
+def test_refill_is_proportional_and_capped() -> None:
+    # 10 tokens every second
+    bucket = ratelimits.TokenBucket("test", 10, 1)
+    bucket.tokens = 0
+    bucket.updated = 100.0
+
+    bucket._refill(100.25)
+    assert bucket.tokens == pytest.approx(2.5)
+
+    bucket._refill(105.0)
+    assert bucket.tokens == 10
+
+
+def test_waits_for_refill() -> None:
+    # a token every 50ms
+    bucket = ratelimits.TokenBucket("test", 2, 0.1)
+
+    async def run() -> list[float]:
+        start = time.monotonic()
+        waits: list[float] = []
+        for _ in range(4):
+            await bucket.acquire()
+            waits.append(time.monotonic() - start)
+        return waits
+
+    waits = asyncio.run(run())
+
+    # the first two come out of the bucket, the others need it to refill
+    assert waits[1] < 0.02
+    assert waits[2] == pytest.approx(0.05, abs=0.03)
+    assert waits[3] == pytest.approx(0.1, abs=0.03)
+
+
+def test_priorities_go_first() -> None:
+    bucket = ratelimits.TokenBucket("test", 1, 0.05)
+    order: list[ratelimits.Priority] = []
+
+    async def acquire(priority: ratelimits.Priority) -> None:
+        await bucket.acquire(priority)
+        order.append(priority)
+
+    async def run() -> None:
+        await bucket.acquire()
+        await asyncio.gather(
+            acquire(ratelimits.Priority.BACKGROUND),
+            acquire(ratelimits.Priority.AUTORUNNER),
+            acquire(ratelimits.Priority.LIVE),
+        )
+
+    asyncio.run(run())
+
+    assert order == [
+        ratelimits.Priority.LIVE,
+        ratelimits.Priority.AUTORUNNER,
+        ratelimits.Priority.BACKGROUND,
+    ]
+
+
+def test_cancelled_waiter_is_skipped() -> None:
+    bucket = ratelimits.TokenBucket("test", 1, 0.05)
+
+    async def run() -> float:
+        await bucket.acquire()
+
+        cancelled = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        start = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start
+
+    # the next waiter gets the token the cancelled one would have, and not
+    # the one after it
+    assert asyncio.run(run()) < 0.075
+
+
+def test_cancelled_after_handout_returns_token() -> None:
+    # a token every 1000 seconds, so refills don't muddy the waters
+    bucket = ratelimits.TokenBucket("test", 1, 1000)
+
+    async def run() -> None:
+        await bucket.acquire()
+        # keeps the dispatcher out of the way, so the handout can be done by hand
+        bucket.block_for(1000)
+
+        waiting = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+
+        # what the dispatcher does once it takes a token out of the bucket, with
+        # the waiter cancelled before it gets to run again
+        assert bucket.tokens == pytest.approx(0, abs=1e-3)
+        heapq.heappop(bucket._waiters)[2].set_result(None)
+        waiting.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        assert bucket._dispatcher
+        bucket._dispatcher.cancel()
+
+    asyncio.run(run())
+
+    assert bucket.tokens == pytest.approx(1, abs=1e-3)
+
+
+def test_scheduler_routes_to_buckets() -> None:
+    scheduler = ratelimits.RateLimitScheduler({"a": (1, 1000), "b": (1, 1000)})
+
+    async def run() -> None:
+        await scheduler.acquire("a")
+        # a's token being gone doesn't hold up b
+        await asyncio.wait_for(scheduler.acquire("b"), 0.1)
+
+    asyncio.run(run())
+
+    assert scheduler.bucket("a").tokens < 1
+    assert scheduler.bucket("b").tokens < 1
+
+
+def test_headers_and_throttles_block() -> None:
+    scheduler = ratelimits.RateLimitScheduler({"peoplehub": (10, 15)})
+    bucket = scheduler.bucket("peoplehub")
+
+    scheduler.observe_headers(
+        "peoplehub",
+        {"X-RateLimit-Limit": "30", "X-RateLimit-Remaining": "0"},
+        200,
+    )
+    assert bucket.capacity == 30
+    assert bucket.tokens == 0
+
+    scheduler.observe_headers("peoplehub", {"Retry-After": "5"}, 429)
+    assert bucket.blocked_until == pytest.approx(time.monotonic() + 5, abs=0.1)
+    assert bucket.estimated_wait() >= 4.9
+
+    scheduler.observe_throttle("peoplehub", {"maxRequests": 20, "periodInSeconds": 30})
+    assert (bucket.capacity, bucket.period) == (20, 30)
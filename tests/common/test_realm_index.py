@@ -0,0 +1,96 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import pydantic
+
+import common.realm_index as realm_index
+
+
+# stands in for GuildConfig, which needs a generated prisma client
+class FakeConfig(pydantic.BaseModel):
+    guild_id: int
+    realm_id: str | None = None
+    premium_code_id: int | None = None
+    premium_code: dict | None = None
+    valid_premium: bool = False
+    playerlist_chan: int | None = None
+    live_playerlist: bool = False
+    fetch_devices: bool = False
+    player_watchlist: list[str] = []
+
+
+def premium_config(**kwargs: object) -> FakeConfig:
+    return FakeConfig(
+        premium_code_id=1, premium_code={}, valid_premium=True, **kwargs  # type: ignore
+    )
+
+
+def test_flags_need_premium() -> None:
+    index = realm_index.RealmIndex()
+    index.update(
+        FakeConfig(  # type: ignore
+            guild_id=1, realm_id="r", playerlist_chan=5, live_playerlist=True
+        )
+    )
+    index.update(
+        premium_config(
+            guild_id=2, realm_id="r", playerlist_chan=5, live_playerlist=True
+        )  # type: ignore
+    )
+    index.update(
+        premium_config(guild_id=3, realm_id="r", fetch_devices=True)  # type: ignore
+    )
+
+    assert index.guild_ids("r") == {1, 2, 3}
+    assert index.live_playerlist_guilds("r") == {2}
+    assert index.fetches_devices("r")
+    assert not index.has_live_playerlist("s")
+
+
+def test_moving_realms_and_removing() -> None:
+    index = realm_index.RealmIndex()
+    index.update(
+        premium_config(
+            guild_id=1, realm_id="r", fetch_devices=True, player_watchlist=["x"]
+        )  # type: ignore
+    )
+    assert index.watchlist_guilds("r", "x") == {1}
+
+    index.update(premium_config(guild_id=1, realm_id="s"))  # type: ignore
+    assert not index.has_guilds("r")
+    assert not index.fetches_devices("r")
+    assert index.watchlist_guilds("r", "x") == set()
+    assert index.realm_of(1) == "s"
+    assert index.has_guilds("s") and not index.has_guilds("s", excluding=1)
+
+    index.update(FakeConfig(guild_id=1))  # type: ignore
+    assert len(index) == 0
+
+
+def test_premium_is_kept_when_the_code_was_not_loaded() -> None:
+    index = realm_index.RealmIndex()
+    index.update(premium_config(guild_id=1, realm_id="r"))  # type: ignore
+
+    index.update(
+        FakeConfig(  # type: ignore
+            guild_id=1,
+            realm_id="r",
+            premium_code_id=1,
+            playerlist_chan=5,
+            live_playerlist=True,
+        )
+    )
+    assert index.live_playerlist_guilds("r") == {1}
@@ -0,0 +1,245 @@
+"""
+Copyright 2020-2025 AstreaTSS.
+This file is part of the Realms Playerlist Bot.
+
+The Realms Playerlist Bot is free software: you can redistribute it and/or modify it under
+the terms of the GNU Affero General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+The Realms Playerlist Bot is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License along with the Realms
+Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# makes sure every query the bot makes against the session tables can use an index
+# this needs a postgres database with the migrations applied that's fine to wipe -
+# the session tables are emptied out and filled with fake data. run with:
+# PLAN_CHECK_DB_URL=postgresql://... \
+#     python -m pytest tests/common/test_session_query_plans.py
+# and it's skipped otherwise
+
+import asyncio
+import datetime
+import os
+import typing
+import uuid
+
+import orjson
+import pytest
+
+DB_URL = os.environ.get("PLAN_CHECK_DB_URL")
+if not DB_URL:
+    pytest.skip("PLAN_CHECK_DB_URL is not set.", allow_module_level=True)
+
+from prisma import Prisma
+
+import common.leaderboards as leaderboards
+import common.playtime_rollup as playtime_rollup
+import common.session_ingest as session_ingest
+import common.session_partitions as session_partitions
+import common.session_retention as session_retention
+
+SESSION_TABLES = frozenset({"realmplayersession", "realmplayerhourlyplaytime"})
+# realmplayersession's partitions show up in plans under their own names
+SESSION_PARTITION_PREFIX = "realmplayersession_"
+
+# 500 realms with 20k players between them, spread across the last 30 days
+# about 2% of sessions are online, like they'd be normally
+SEED = """
+INSERT INTO "realmplayersession"
+    ("custom_id", "realm_id", "xuid", "online", "last_seen", "joined_at",
+    "rolled_up_to")
+SELECT gen_random_uuid(), "realm_id", "xuid", "online", "last_seen",
+    "last_seen" - ("i" % 180) * interval '1 minute',
+    CASE WHEN "online" THEN NULL ELSE date_trunc('minute', "last_seen") END
+FROM (
+    SELECT "i", ("i" % 500)::text AS "realm_id", ("i" % 20000)::text AS "xuid",
+        "i" % 50 = 0 AS "online",
+        CASE WHEN "i" % 50 = 0 THEN now()
+            ELSE now() - ("i" * 7919 % 2592000) * interval '1 second'
+        END AS "last_seen"
+    FROM generate_series(1, 200000) AS "i"
+) AS "fake"
+"""
+SEED_HOURLY = """
+INSERT INTO "realmplayerhourlyplaytime" ("realm_id", "xuid", "hour", "minutes")
+SELECT ("i" % 500)::text, ("i" % 20000)::text,
+    date_trunc('hour', now()) - ("i" % 720) * interval '1 hour', "i" % 60 + 1
+FROM generate_series(1, 200000) AS "i"
+ON CONFLICT DO NOTHING
+"""
+
+NOW = datetime.datetime.now(tz=datetime.UTC)
+HOUR_AGO = NOW - datetime.timedelta(hours=1)
+WEEK_AGO = NOW - datetime.timedelta(days=7)
+RETENTION_START = (
+    datetime.datetime.min.replace(tzinfo=datetime.UTC),
+    str(uuid.UUID(int=0)),
+)
+
+# the event loop, the client, and every partition without anything in it
+type Database = tuple[asyncio.AbstractEventLoop, Prisma, frozenset[str]]
+
+# the prisma queries are written out as the sql they (more or less) turn into
+QUERY_SHAPES: dict[str, tuple[str, tuple[typing.Any, ...]]] = {
+    "playerlist": (
+        (
+            'SELECT DISTINCT ON ("xuid") * FROM "realmplayersession"'
+            ' WHERE "realm_id" = $1 AND ("online" OR "last_seen" >= $2::timestamptz)'
+            ' ORDER BY "xuid", "last_seen" DESC'
+        ),
+        ("7", HOUR_AGO),
+    ),
+    "live_online": (
+        'SELECT * FROM "realmplayersession" WHERE "realm_id" = $1 AND "online"',
+        ("7",),
+    ),
+    "gather_datetimes": (
+        (
+            'SELECT * FROM "realmplayersession"'
+            ' WHERE "realm_id" = $1 AND "joined_at" >= $2::timestamptz'
+        ),
+        ("7", WEEK_AGO),
+    ),
+    "gather_players_datetimes": (
+        (
+            'SELECT * FROM "realmplayersession" WHERE "realm_id" = $1'
+            ' AND "joined_at" >= $2::timestamptz AND "xuid" = ANY($3::text[])'
+        ),
+        ("7", WEEK_AGO, ["7", "507"]),
+    ),
+    "get_player_log": (
+        (
+            'SELECT * FROM "realmplayersession" WHERE "xuid" = $1 AND "realm_id" = $2'
+            ' AND ("online" OR "last_seen" >= $3::timestamptz)'
+            ' ORDER BY "last_seen" DESC'
+        ),
+        ("7", "7", WEEK_AGO),
+    ),
+    "realm_session_count": (
+        'SELECT count(*) FROM "realmplayersession" WHERE "realm_id" = $1',
+        ("7",),
+    ),
+    "retention_delete": (
+        session_retention._DELETE_CHUNK.format(table="realmplayersession"),
+        (NOW - datetime.timedelta(days=31), *RETENTION_START, 5000),
+    ),
+    "retention_close": (
+        session_retention._CLOSE_CHUNK,
+        (HOUR_AGO, *RETENTION_START, 5000),
+    ),
+    "startup_reset": (
+        (
+            'UPDATE "realmplayersession" SET "online" = false'
+            ' WHERE "online" AND "last_seen" < $1::timestamptz'
+        ),
+        (NOW - datetime.timedelta(minutes=5),),
+    ),
+    "startup_scan": ('SELECT * FROM "realmplayersession" WHERE "online"', ()),
+    "last_seen_bump": (session_ingest._LAST_SEEN_BUMP, (NOW, ["7", "8"])),
+    "session_upsert": (
+        session_ingest._UPSERT_BASE
+        + session_ingest._update_clause(("online", "last_seen")),
+        (
+            [str(uuid.uuid4()), str(uuid.uuid4())],
+            ["7", "7"],
+            ["7", "507"],
+            [False, False],
+            [NOW.isoformat()] * 2,
+            [HOUR_AGO.isoformat()] * 2,
+        ),
+    ),
+    "rollup_sessions": (
+        playtime_rollup._ROLLUP_SESSIONS,
+        ([str(uuid.uuid4()), str(uuid.uuid4())], [HOUR_AGO.isoformat()] * 2),
+    ),
+    "rollup_recent": (
+        playtime_rollup._ROLLUP_RECENT,
+        (NOW - datetime.timedelta(days=2),),
+    ),
+    "hourly_ranges": (playtime_rollup.HOURLY_RANGES, ("7", WEEK_AGO, None)),
+    "session_leaderboard": (
+        leaderboards._SESSION_LEADERBOARD,
+        ("7", WEEK_AGO, None, leaderboards.PAGE_SIZE, 0),
+    ),
+    "rollup_leaderboard": (
+        leaderboards._ROLLUP_LEADERBOARD,
+        ("7", WEEK_AGO, None, leaderboards.PAGE_SIZE, 0),
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def database() -> typing.Generator[Database, None, None]:
+    loop = asyncio.new_event_loop()
+    db = Prisma(datasource={"url": DB_URL})
+
+    async def setup() -> frozenset[str]:
+        await db.connect()
+        await db.execute_raw(
+            'TRUNCATE "realmplayersession", "realmplayerhourlyplaytime"'
+        )
+        # make sure the fake sessions land in weekly partitions and not the
+        # default one, like they would normally
+        week = session_partitions.week_start(NOW - datetime.timedelta(days=31))
+        weeks = (session_partitions.week_start(NOW) - week).days // 7
+        await session_partitions.ensure_partitions(db, week, ahead=weeks + 1)
+
+        await db.execute_raw(SEED)
+        await db.execute_raw(SEED_HOURLY)
+        await db.execute_raw(
+            'ANALYZE "realmplayersession", "realmplayerhourlyplaytime"'
+        )
+
+        # postgres is right to sequentially scan partitions with nothing in them
+        rows = await db.query_raw(
+            'SELECT "relname" FROM pg_class WHERE "relname" LIKE $1'
+            ' AND "relkind" = \'r\' AND "reltuples" = 0',
+            f"{SESSION_PARTITION_PREFIX}%",
+        )
+        return frozenset(row["relname"] for row in rows)
+
+    empty_partitions = loop.run_until_complete(setup())
+    yield loop, db, empty_partitions
+    loop.run_until_complete(db.disconnect())
+    loop.close()
+
+
+def sequential_scans(
+    plan: dict[str, typing.Any], ignored: frozenset[str] = frozenset()
+) -> list[str]:
+    found: list[str] = []
+
+    relation = plan.get("Relation Name", "")
+    if (
+        plan.get("Node Type") == "Seq Scan"
+        and relation not in ignored
+        and (
+            relation in SESSION_TABLES or relation.startswith(SESSION_PARTITION_PREFIX)
+        )
+    ):
+        found.append(relation)
+
+    for subplan in plan.get("Plans", ()):
+        found.extend(sequential_scans(subplan, ignored))
+    return found
+
+
+@pytest.mark.parametrize("shape", QUERY_SHAPES)
+def test_query_uses_indexes(database: Database, shape: str) -> None:
+    loop, db, empty_partitions = database
+    query, args = QUERY_SHAPES[shape]
+
+    rows = loop.run_until_complete(
+        db.query_raw(f"EXPLAIN (FORMAT JSON) {query}", *args)
+    )
+    plan = rows[0]["QUERY PLAN"]
+    if isinstance(plan, str):
+        plan = orjson.loads(plan)
+
+    assert not sequential_scans(plan[0]["Plan"], empty_partitions), orjson.dumps(
+        plan
+    ).decode()
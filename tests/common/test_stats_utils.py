@@ -14,6 +14,8 @@ You should have received a copy of the GNU Affero General Public License along w
 Playerlist Bot. If not, see <https://www.gnu.org/licenses/>.
 """
 
+import datetime
+
 import stats_utils_models
 
 import common.stats_utils as stats_utils
@@ -29,6 +31,26 @@ def test_get_minutes_per_hour() -> None:
     assert results == stats_utils_models.MINUTES_PER_HOUR_RESULTS
 
 
+def test_get_minutes_per_hour_with_bounds() -> None:
+    min_datetime = min(
+        r.joined_at for r in stats_utils_models.TEST_DATETIMES
+    ) - datetime.timedelta(hours=2)
+    max_datetime = max(
+        r.last_seen for r in stats_utils_models.TEST_DATETIMES
+    ) + datetime.timedelta(hours=2)
+
+    results = stats_utils.get_minutes_per_hour(
+        stats_utils_models.TEST_DATETIMES,
+        min_datetime=min_datetime,
+        max_datetime=max_datetime,
+    )
+
+    # the extra hours on either side should just be empty
+    assert len(results) > len(stats_utils_models.MINUTES_PER_HOUR_RESULTS)
+    for k, v in results.items():
+        assert v == stats_utils_models.MINUTES_PER_HOUR_RESULTS.get(k, 0)
+
+
 def test_timespan_minutes_per_hour() -> None:
     results = stats_utils.timespan_minutes_per_hour(stats_utils_models.TEST_DATETIMES)
     assert results == stats_utils_models.TIMESPAN_MINUTES_PER_HOUR_RESULTS